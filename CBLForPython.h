@@ -443,6 +443,9 @@ typedef uint8_t CBLConcurrencyControl;
 typedef bool (*CBLConflictHandler)(void *context,
                                    CBLDocument *documentBeingSaved,
                                    const CBLDocument *conflictingDocument);
+extern "Python" bool conflictHandlerCallback(void *context,
+                                             CBLDocument *documentBeingSaved,
+                                             const CBLDocument *conflictingDocument);
 
 const CBLDocument *CBLDatabase_GetDocument(const CBLDatabase *database,
                                            FLString docID,
@@ -587,7 +590,7 @@ CBLQuery *CBLResultSet_GetQuery(const CBLResultSet *rs);
 typedef void (*CBLQueryChangeListener)(void *context,
                                        CBLQuery *query,
                                        CBLListenerToken *token);
-extern "Python" void queryListenerCallback(void *context, const CBLQuery *query);
+extern "Python" void queryListenerCallback(void *context, CBLQuery *query, CBLListenerToken *token);
 CBLListenerToken *CBLQuery_AddChangeListener(CBLQuery *query,
                                              CBLQueryChangeListener listener,
                                              void *context);
@@ -646,6 +649,8 @@ CBLScope *CBLCollection_Scope(const CBLCollection *collection);
 
 FLString CBLCollection_Name(const CBLCollection *collection);
 
+CBLDatabase *CBLCollection_Database(const CBLCollection *collection);
+
 uint64_t CBLCollection_Count(const CBLCollection *collection);
 
 const CBLDocument *CBLCollection_GetDocument(const CBLCollection *collection, FLString docID, CBLError *outError);
@@ -678,15 +683,26 @@ bool CBLCollection_DeleteIndex(CBLCollection *collection, FLString name, CBLErro
 
 FLMutableArray CBLCollection_GetIndexNames(CBLCollection *collection, CBLError *outError);
 
-typedef... CBLCollectionChange;
+typedef struct {
+    const CBLCollection* collection;
+    unsigned numDocs;
+    FLString* docIDs;
+    ...;
+} CBLCollectionChange;
 
 typedef void (*CBLCollectionChangeListener)(void *context, const CBLCollectionChange *change);
+extern "Python" void collectionListenerCallback(void *context, const CBLCollectionChange *change);
 
 CBLListenerToken *CBLCollection_AddChangeListener(const CBLCollection *collection, CBLCollectionChangeListener listener, void *context);
 
-typedef... CBLDocumentChange;
+typedef struct {
+    const CBLCollection* collection;
+    FLString docID;
+    ...;
+} CBLDocumentChange;
 
 typedef void (*CBLCollectionDocumentChangeListener)(void *context, const CBLDocumentChange *change);
+extern "Python" void collectionDocumentListenerCallback(void *context, const CBLDocumentChange *change);
 
 CBLListenerToken *CBLCollection_AddDocumentChangeListener(const CBLCollection *collection, FLString docID, CBLCollectionDocumentChangeListener listener, void *context);
 
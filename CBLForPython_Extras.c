@@ -0,0 +1,247 @@
+//
+// CBLForPython_Extras.c
+//
+// Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+//
+
+/*
+    C helpers compiled into the _PyCBL extension along with the CFFI glue; `build.py` appends this
+    file to the extension source, after `#include <cbl/CouchbaseLite.h>`. The declarations CFFI
+    sees are in `CBLForPython_Extras.h`, which must be kept in sync with this file.
+*/
+
+#include <stdlib.h>
+#include <string.h>
+
+/* Must match the enum in CBLForPython_Extras.h */
+enum {
+    kCBLPyInteger = 16,
+    kCBLPyUnsigned,
+    kCBLPyDouble
+};
+
+
+/* ---- Fleece -> pickle ----
+
+   CBLPy_PickleFleece walks a Fleece value and writes it out as a pickle (protocol 3), which
+   Python's `pickle.loads` turns into dicts, lists, strs etc. in a single pass of C code. Only
+   plain data opcodes are used; nothing in the stream refers to a Python global. */
+
+typedef struct {
+    uint8_t *buf;
+    size_t size, capacity;
+    bool failed;
+} CBLPy_Writer;
+
+static bool CBLPy_Reserve(CBLPy_Writer *w, size_t n) {
+    if (w->failed)
+        return false;
+    if (w->size + n > w->capacity) {
+        size_t capacity = w->capacity ? w->capacity * 2 : 512;
+        while (capacity < w->size + n)
+            capacity *= 2;
+        uint8_t *buf = realloc(w->buf, capacity);
+        if (!buf) {
+            w->failed = true;
+            return false;
+        }
+        w->buf = buf;
+        w->capacity = capacity;
+    }
+    return true;
+}
+
+static void CBLPy_PutByte(CBLPy_Writer *w, uint8_t b) {
+    if (CBLPy_Reserve(w, 1))
+        w->buf[w->size++] = b;
+}
+
+static void CBLPy_PutLE(CBLPy_Writer *w, uint64_t n, int count) {
+    if (CBLPy_Reserve(w, count)) {
+        for (int i = 0; i < count; i++, n >>= 8)
+            w->buf[w->size++] = (uint8_t)n;
+    }
+}
+
+static bool CBLPy_PutSized(CBLPy_Writer *w, uint8_t opcode, FLSlice s) {
+    if (s.size > UINT32_MAX)
+        return false;
+    CBLPy_PutByte(w, opcode);
+    CBLPy_PutLE(w, s.size, 4);
+    if (s.size > 0 && CBLPy_Reserve(w, s.size)) {
+        memcpy(w->buf + w->size, s.buf, s.size);
+        w->size += s.size;
+    }
+    return !w->failed;
+}
+
+static void CBLPy_PutInt(CBLPy_Writer *w, int64_t n) {
+    if (n >= INT32_MIN && n <= INT32_MAX) {
+        CBLPy_PutByte(w, 'J');                  /* BININT: 4-byte signed */
+        CBLPy_PutLE(w, (uint32_t)(int32_t)n, 4);
+    } else {
+        CBLPy_PutByte(w, 0x8a);                 /* LONG1: n-byte two's complement */
+        CBLPy_PutByte(w, 8);
+        CBLPy_PutLE(w, (uint64_t)n, 8);
+    }
+}
+
+static void CBLPy_PutUnsigned(CBLPy_Writer *w, uint64_t n) {
+    if (n <= INT64_MAX) {
+        CBLPy_PutInt(w, (int64_t)n);
+    } else {
+        CBLPy_PutByte(w, 0x8a);                 /* LONG1, with a zero sign byte */
+        CBLPy_PutByte(w, 9);
+        CBLPy_PutLE(w, n, 8);
+        CBLPy_PutByte(w, 0);
+    }
+}
+
+static void CBLPy_PutDouble(CBLPy_Writer *w, double d) {
+    uint64_t bits;
+    memcpy(&bits, &d, sizeof(bits));
+    CBLPy_PutByte(w, 'G');                      /* BINFLOAT: big-endian IEEE double */
+    if (CBLPy_Reserve(w, 8)) {
+        for (int shift = 56; shift >= 0; shift -= 8)
+            w->buf[w->size++] = (uint8_t)(bits >> shift);
+    }
+}
+
+/* Returns false if the value can't be pickled here: a blob, or a container nested deeper than
+   `depth`. (The Python decoder turns those into Blob and lazy Array/Dictionary objects.) */
+static bool CBLPy_PickleValue(CBLPy_Writer *w, FLValue value, int depth) {
+    switch (FLValue_GetType(value)) {
+        case kFLNull:
+        case kFLUndefined:
+            CBLPy_PutByte(w, 'N');
+            break;
+        case kFLBoolean:
+            CBLPy_PutByte(w, FLValue_AsBool(value) ? 0x88 : 0x89);
+            break;
+        case kFLNumber:
+            if (!FLValue_IsInteger(value))
+                CBLPy_PutDouble(w, FLValue_AsDouble(value));
+            else if (FLValue_IsUnsigned(value))
+                CBLPy_PutUnsigned(w, FLValue_AsUnsigned(value));
+            else
+                CBLPy_PutInt(w, FLValue_AsInt(value));
+            break;
+        case kFLString:
+            return CBLPy_PutSized(w, 'X', FLValue_AsString(value));     /* BINUNICODE */
+        case kFLData:
+            return CBLPy_PutSized(w, 'B', FLValue_AsData(value));       /* BINBYTES */
+        case kFLArray: {
+            if (depth <= 0)
+                return false;
+            FLArray array = FLValue_AsArray(value);
+            uint32_t count = FLArray_Count(array);
+            CBLPy_PutByte(w, ']');                                      /* EMPTY_LIST */
+            if (count > 0) {
+                CBLPy_PutByte(w, '(');                                  /* MARK */
+                for (uint32_t i = 0; i < count; i++) {
+                    if (!CBLPy_PickleValue(w, FLArray_Get(array, i), depth - 1))
+                        return false;
+                }
+                CBLPy_PutByte(w, 'e');                                  /* APPENDS */
+            }
+            break;
+        }
+        case kFLDict: {
+            FLDict dict = FLValue_AsDict(value);
+            if (depth <= 0 || FLDict_IsBlob(dict))
+                return false;
+            CBLPy_PutByte(w, '}');                                      /* EMPTY_DICT */
+            if (FLDict_Count(dict) > 0) {
+                CBLPy_PutByte(w, '(');
+                FLDictIterator i;
+                FLDictIterator_Begin(dict, &i);
+                FLValue item;
+                while (NULL != (item = FLDictIterator_GetValue(&i))) {
+                    if (!CBLPy_PutSized(w, 'X', FLDictIterator_GetKeyString(&i))
+                            || !CBLPy_PickleValue(w, item, depth - 1)) {
+                        FLDictIterator_End(&i);
+                        return false;
+                    }
+                    FLDictIterator_Next(&i);
+                }
+                CBLPy_PutByte(w, 'u');                                  /* SETITEMS */
+            }
+            break;
+        }
+    }
+    return !w->failed;
+}
+
+FLSliceResult CBLPy_PickleFleece(FLValue value, int depth) {
+    FLSliceResult result = {NULL, 0};
+    CBLPy_Writer w = {NULL, 0, 0, false};
+    CBLPy_PutByte(&w, 0x80);                    /* PROTO 3 */
+    CBLPy_PutByte(&w, 3);
+    if (value && CBLPy_PickleValue(&w, value, depth)) {
+        CBLPy_PutByte(&w, '.');                 /* STOP */
+        if (!w.failed) {
+            result = FLSliceResult_New(w.size);
+            if (result.buf)
+                memcpy((void*)result.buf, w.buf, w.size);
+        }
+    }
+    free(w.buf);
+    return result;
+}
+
+
+/* ---- Hot-path helpers ----
+
+   Each of these does in one call what would otherwise take a CFFI crossing per item. */
+
+int CBLPy_ValueType(FLValue value) {
+    FLValueType type = FLValue_GetType(value);
+    if (type != kFLNumber)
+        return type;
+    else if (!FLValue_IsInteger(value))
+        return kCBLPyDouble;
+    else if (FLValue_IsUnsigned(value))
+        return kCBLPyUnsigned;
+    else
+        return kCBLPyInteger;
+}
+
+size_t CBLPy_DictGetMany(FLDict dict, FLDictKey *keys, size_t count, FLValue *outValues) {
+    size_t found = 0;
+    for (size_t i = 0; i < count; i++) {
+        outValues[i] = dict ? FLDict_GetWithKey(dict, &keys[i]) : NULL;
+        if (outValues[i])
+            found++;
+    }
+    return found;
+}
+
+size_t CBLPy_GetDocuments(const CBLCollection *collection,
+                          const char *docIDs, const size_t *docIDEnds, size_t count,
+                          const CBLDocument **outDocs, CBLError *outError)
+{
+    size_t start = 0;
+    for (size_t i = 0; i < count; i++) {
+        FLString docID = {docIDs + start, docIDEnds[i] - start};
+        start = docIDEnds[i];
+        outDocs[i] = CBLCollection_GetDocument(collection, docID, outError);
+        if (!outDocs[i] && outError->code != 0) {
+            for (size_t j = i + 1; j < count; j++)
+                outDocs[j] = NULL;
+            return i;
+        }
+    }
+    return count;
+}
@@ -0,0 +1,48 @@
+//
+// CBLForPython_Extras.h
+//
+// Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+// http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+//
+
+/*
+    CFFI declarations of the helper functions in `CBLForPython_Extras.c`. `build.py` appends these
+    to `CBLForPython.h` or `CBLForPython_EE.h`, unless it's run with `--without_extras`; the Python
+    code checks for each function and falls back to plain API calls when it's missing.
+*/
+
+// Encodes a Fleece value as a pickle (protocol 3) for `pickle.loads`. Returns a null slice if the
+// value contains a blob, or containers nested more than `depth` levels deep.
+FLSliceResult CBLPy_PickleFleece(FLValue value, int depth);
+
+// The value's FLValueType, except that numbers are told apart: integers are kCBLPyInteger, or
+// kCBLPyUnsigned if too large for an int64, and floating-point numbers are kCBLPyDouble.
+enum {
+    kCBLPyInteger = 16,
+    kCBLPyUnsigned,
+    kCBLPyDouble
+};
+int CBLPy_ValueType(FLValue value);
+
+// Looks up `count` keys in a dict, storing each value (or NULL) in `outValues`. A NULL dict finds
+// nothing. Returns the number of keys found.
+size_t CBLPy_DictGetMany(FLDict dict, FLDictKey *keys, size_t count, FLValue *outValues);
+
+// Gets `count` documents from a collection. The IDs are UTF-8, concatenated in `docIDs`, and the
+// i'th one ends at offset `docIDEnds[i]`. Each document (or NULL if it doesn't exist) is stored
+// in `outDocs`, and must be released by the caller. If getting a document fails, stops and
+// returns its index, with `outError` set; otherwise returns `count`.
+size_t CBLPy_GetDocuments(const CBLCollection *collection,
+                          const char *docIDs, const size_t *docIDEnds, size_t count,
+                          const CBLDocument **outDocs, CBLError *outError);
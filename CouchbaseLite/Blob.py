@@ -16,16 +16,23 @@
 #
 
 from ._PyCBL import ffi, lib
-from .Collections import *
 from .common import *
 
-class Blob (object):
+class Blob (CBLObject):
+    __slots__ = ("_data",)
+
     def __init__(self, data, *, contentType =None, fdict =None):
         if fdict != None:
-            super.__init__(lib.FLDict_GetBlob(fdict), "Dict is not a Blob")
+            # The blob belongs to the dict's document; retain it so it outlives this reference.
+            blob = lib.FLDict_GetBlob(fdict)
+            CBLObject.__init__(self, ffi.cast("CBLBlob*", lib.CBL_Retain(blob)) if blob else None, "Dict is not a Blob")
+            self._data = UNSET
         else:
-            super.__init__(lib.CBLBlob_CreateWithData(contentType, asSlice(data)),
-                           "Failed to create Blob")
+            contentTypeSlice = stringParam(contentType) if contentType != None else [ffi.NULL, 0]
+            buffer = ffi.from_buffer(data)
+            CBLObject.__init__(self, lib.CBLBlob_CreateWithData(contentTypeSlice, [buffer, len(buffer)]),
+                               "Failed to create Blob")
+            self._data = data
 
     @property
     def digest(self):
@@ -41,14 +48,12 @@ class Blob (object):
     
     @property
     def data(self):
-        if "_data" in self.__dict__:
+        if self._data is not UNSET:
             return self._data
         elif self.digest != None:
             sliceResult = lib.CBLBlob_Content(self._ref, gError)
             # OPT: This copies the bytes
-            result = sliceResultToBytes(sliceResult)
-            lib.FLSliceResult_Release(sliceResult)
-            return result
+            return sliceResultToBytes(sliceResult)
         else:
             return None
 
@@ -59,8 +64,9 @@ class Blob (object):
         if self.length != None:
             if self.contentType != None:
                 r += ", "
-                r += self.length + " bytes"
+            r += str(self.length) + " bytes"
         return r + "]"
 
     def _jsonEncodable(self):
+        from .Collections import decodeFleeceDict
         return decodeFleeceDict( lib.CBLBlob_Properties(self._ref), depth=99 )
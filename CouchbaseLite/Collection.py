@@ -15,19 +15,25 @@
 # limitations under the License.
 
 
-import datetime
-import math
-from typing import Union, List
+from __future__ import annotations
+
+import contextlib
+import itertools
 
 from ._PyCBL import ffi, lib
 from .common import *
 from .Document import *
+
+# Gets a batch of documents in one call; from CBLForPython_Extras.c, if _PyCBL was built with it.
+_get_documents = getattr(lib, "CBLPy_GetDocuments", None)
  
 
 class Collection:
     """
     New methods for scopes and collections
     """
+    listeners = set()   # handles of collection listeners, kept alive until their tokens are removed
+
     @staticmethod
     def get_default_collection(database):
         """
@@ -252,14 +258,15 @@ class Collection:
     @staticmethod
     def get_document_epxiration(collection, doc_id):
         """
-        Returns the time, if any, at which a given document will expire and be purged.
+        Returns the time, if any, at which a given document will expire and be purged,
+        as a CBLTimestamp (milliseconds since the Unix epoch); 0 if it has no expiration.
         """
         gError = ffi.new("CBLError*")
-        time_stamp = lib.CBLCollection_GetDocumentExpiration(collection, doc_id, gError)
+        time_stamp = lib.CBLCollection_GetDocumentExpiration(collection, stringParam(doc_id), gError)
 
-        if not time_stamp:
+        if time_stamp < 0:
             raise CBLException("Couldn't get the TTL for the document with doc_id {} in the given collection"
-                               .format(stringParam(doc_id)), gError)
+                               .format(doc_id), gError)
       
         return time_stamp
     
@@ -267,13 +274,301 @@ class Collection:
     @staticmethod
     def set_document_epxiration(collection, doc_id, expiration_ts):
         """
-        Sets or clears the expiration time of a document. 
+        Sets or clears the expiration time of a document. 'expiration_ts' is a CBLTimestamp, a datetime,
+        a timedelta from now, or None/0 to clear the expiration.
         """
         gError = ffi.new("CBLError*")
-        is_TTL_set = lib.CBLCollection_SetDocumentExpiration(collection, doc_id, expiration_ts, gError)
+        is_TTL_set = lib.CBLCollection_SetDocumentExpiration(collection, stringParam(doc_id), cblTimestamp(expiration_ts), gError)
 
         if not is_TTL_set:
             raise CBLException("Couldn't set the TTL {} for the document with doc_id {} in the given collection"
-                               .format(stringParam(expiration_ts), stringParam(doc_id)), gError)
+                               .format(expiration_ts, doc_id), gError)
       
-        return is_TTL_set
\ No newline at end of file
+        return is_TTL_set
+
+    get_document_expiration = get_document_epxiration
+    set_document_expiration = set_document_epxiration
+
+
+    @staticmethod
+    def get_full_name(collection):
+        """
+        Returns the collection's 'scope.collection' name, quoted for use in a N1QL FROM clause
+        """
+        scope = lib.CBLCollection_Scope(collection)
+        try:
+            scope_name = sliceToString(lib.CBLScope_Name(scope))
+        finally:
+            lib.CBL_Release(scope)
+        return "`{}`.`{}`".format(scope_name, sliceToString(lib.CBLCollection_Name(collection)))
+
+
+    @staticmethod
+    def count(collection):
+        """
+        Returns the number of documents in the collection, without running a query
+        """
+        return lib.CBLCollection_Count(collection)
+
+
+    @staticmethod
+    def get_index_names(collection) -> List[str]:
+        """
+        Returns the names of the indexes on the collection
+        """
+        gError = ffi.new("CBLError*")
+        mutable_array = lib.CBLCollection_GetIndexNames(collection, gError)
+        if not mutable_array:
+            raise CBLException("Couldn't get index names", gError)
+        try:
+            return decodeFleeceArray(ffi.cast("FLArray", mutable_array))
+        finally:
+            lib.FLMutableArray_Release(mutable_array)
+
+
+    @staticmethod
+    def stats(collection, **kwargs):
+        """
+        Returns a CollectionStats that caches the collection's count, indexes, size and change
+        rate. Keep it and poll it, rather than calling this each time.
+        """
+        from .Stats import CollectionStats
+        return CollectionStats(collection, **kwargs)
+
+
+    @staticmethod
+    def _transaction(collection):
+        """
+        Internal utility: a transaction on the database that owns 'collection', for use in a 'with' statement
+        """
+        return _CollectionTransaction(collection)
+
+
+    @staticmethod
+    def set_documents_expiration(collection, doc_ids, expiration_ts, batch_size = 1000):
+        """
+        Sets or clears the expiration time of many documents, 'batch_size' documents per transaction.
+        'expiration_ts' is as for set_document_expiration. Returns the number of documents updated.
+        """
+        gError = ffi.new("CBLError*")
+        timestamp = cblTimestamp(expiration_ts)
+        count = 0
+        doc_ids = iter(doc_ids)
+        while True:
+            batch = list(itertools.islice(doc_ids, batch_size))
+            if not batch:
+                return count
+            with Collection._transaction(collection):
+                for doc_id in batch:
+                    if not lib.CBLCollection_SetDocumentExpiration(collection, stringParam(doc_id), timestamp, gError):
+                        raise CBLException("Couldn't set the TTL for the document with doc_id {} in the given collection"
+                                           .format(doc_id), gError)
+            count += len(batch)
+
+
+    @staticmethod
+    def set_expiration_where(collection, where, expiration_ts, params = None, batch_size = 1000):
+        """
+        Sets or clears the expiration time of every document in the collection matching the N1QL
+        condition 'where', e.g. "type = 'sensor' AND timestamp < $cutoff" with params {'cutoff': ...}.
+        Returns the number of documents updated.
+        """
+        from .Query import N1QLQuery
+
+        query = N1QLQuery(lib.CBLCollection_Database(collection),
+                          "SELECT meta().id FROM {} WHERE {}".format(Collection.get_full_name(collection), where))
+        if params:
+            query.setParameters(params)
+        doc_ids = [row[0] for row in query.stream(asArray = True)]
+        return Collection.set_documents_expiration(collection, doc_ids, expiration_ts, batch_size)
+
+
+    @staticmethod
+    def get_documents(collection, doc_ids, projection = None, consistent = False):
+        """
+        Returns a dict mapping each of 'doc_ids' to its document's properties, or to None if there is
+        no such document.
+
+        If 'projection' is a list of key paths (see KeyPath), only those values are decoded, and each
+        document maps to a dict of {path: value}.
+
+        If 'consistent' is true, all documents are read inside one transaction, so they are consistent
+        with each other. Couchbase Lite has no read-only transactions, so this takes the database's
+        write lock, blocking other writers and the replicator until the documents are read.
+        """
+        doc_ids = list(doc_ids)
+        return dict(Collection.iter_documents(collection, doc_ids, projection, batch_size = max(len(doc_ids), 1),
+                                              consistent = consistent))
+
+
+    @staticmethod
+    def iter_documents(collection, doc_ids, projection = None, batch_size = 1000, consistent = False):
+        """
+        Like get_documents, but yields (doc_id, properties) pairs in the order of 'doc_ids'. The IDs
+        are read 'batch_size' at a time; if 'consistent' is true, each batch is read in its own
+        transaction, and no transaction is held while the caller processes the results.
+        """
+        if projection != None:
+            from .KeyPath import KeyPath
+            projection = [path if isinstance(path, KeyPath) else KeyPath(path) for path in projection]
+        gError = ffi.new("CBLError*")
+        idSlice = SliceBuffer()
+        ids = iter(doc_ids)
+        while True:
+            batch = list(itertools.islice(ids, batch_size))
+            if not batch:
+                return
+            results = []
+            with Collection._transaction(collection) if consistent else contextlib.nullcontext():
+                docs = Collection._get_batch(collection, batch, idSlice, gError)
+                try:
+                    for doc_id, doc in zip(batch, docs):
+                        if not doc:
+                            props = None
+                        elif projection == None:
+                            props = decodeFleeceDict(lib.CBLDocument_Properties(doc))
+                        else:
+                            props = KeyPath.project(doc, projection)
+                        results.append((doc_id, props))
+                finally:
+                    for doc in docs:
+                        if doc:
+                            lib.CBL_Release(doc)
+            yield from results
+
+
+    @staticmethod
+    def _get_batch(collection, doc_ids, id_slice, gError):
+        # Returns the documents (or NULLs) with the given IDs, which the caller must release.
+        if _get_documents != None:
+            # One call into CBLForPython_Extras.c gets the whole batch.
+            encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+            buffer = ffi.from_buffer(b"".join(encoded))
+            ends = ffi.new("size_t[]", list(itertools.accumulate(len(e) for e in encoded)))
+            docs = ffi.new("const CBLDocument*[]", len(doc_ids))
+            n = _get_documents(collection, buffer, ends, len(doc_ids), docs, gError)
+        else:
+            docs = []
+            n = 0
+            for doc_id in doc_ids:
+                doc = lib.CBLCollection_GetDocument(collection, id_slice.set(doc_id), gError)
+                if not doc and gError.code != 0:
+                    break
+                docs.append(doc)
+                n += 1
+        if n < len(doc_ids):
+            for doc in docs:
+                if doc:
+                    lib.CBL_Release(doc)
+            raise CBLException("Couldn't get document {}".format(doc_ids[n]), gError)
+        return docs
+
+
+    @staticmethod
+    def search(collection, index, terms, limit = 20, offset = 0, fields = (), cursor = None, snippets = None):
+        """
+        Searches the full-text index 'index' for 'terms', returning a SearchPage of up to 'limit'
+        hits in descending rank order, each with the requested 'fields'. Pass the page's `cursor`
+        to get the next page. 'snippets' lists fields to make highlighted excerpts of.
+
+        This compiles the search queries on every call; to run many searches on one index, create
+        a Search.FullTextSearch and reuse it.
+        """
+        from .Search import FullTextSearch
+        return FullTextSearch(collection, index, fields = fields).search(terms, limit = limit, offset = offset,
+                                                                         cursor = cursor, snippets = snippets)
+
+
+    @staticmethod
+    def add_change_listener(collection, listener):
+        """
+        Registers 'listener' to be called with a list of document IDs whenever documents in the
+        collection change. Returns a ListenerToken; call its `remove` method to unregister.
+        """
+        from . import _Listeners
+        handle = ffi.new_handle(listener)
+        Collection.listeners.add(handle)
+        c_token = lib.CBLCollection_AddChangeListener(collection, lib.collectionListenerCallback, handle)
+        return ListenerToken(Collection, handle, c_token)
+
+
+    @staticmethod
+    def add_document_listener(collection, doc_id, listener):
+        """
+        Registers 'listener' to be called with the document ID whenever document 'doc_id' in the
+        collection changes. Returns a ListenerToken.
+        """
+        from . import _Listeners
+        handle = ffi.new_handle(listener)
+        Collection.listeners.add(handle)
+        c_token = lib.CBLCollection_AddDocumentChangeListener(collection, stringParam(doc_id),
+                                                              lib.collectionDocumentListenerCallback, handle)
+        return ListenerToken(Collection, handle, c_token)
+
+
+    @staticmethod
+    def update_document(collection, doc_id, patch, retry_on_conflict = True, create = False):
+        """
+        Applies a Patch (or a list of (op, path, [value]) tuples) to the document 'doc_id' in place and
+        saves it. Only the patched properties are read or written; the rest of the document is never
+        decoded into Python.
+
+        If the document is changed by someone else between reading and saving, the patch is re-applied
+        on top of the newer revision (unless 'retry_on_conflict' is False, in which case the save fails.)
+        A missing document raises, unless 'create' is True.
+        """
+        from .Patch import Patch
+        from . import _Listeners
+
+        if not isinstance(patch, Patch):
+            patch = Patch(patch)
+        gError = ffi.new("CBLError*")
+        doc = lib.CBLCollection_GetMutableDocument(collection, stringParam(doc_id), gError)
+        if not doc:
+            if gError.code != 0 or not create:
+                raise CBLException("Couldn't get document {} to update".format(doc_id), gError)
+            doc = lib.CBLDocument_CreateWithID(stringParam(doc_id))
+
+        def merge(document_being_saved, conflicting_document):
+            if not conflicting_document:
+                return False    # deleted in the meantime
+            newer = lib.FLDict_MutableCopy(lib.CBLDocument_Properties(conflicting_document), lib.kFLDeepCopyImmutables)
+            lib.CBLDocument_SetProperties(document_being_saved, newer)
+            lib.FLValue_Release(ffi.cast("FLValue", newer))
+            patch._apply(lib.CBLDocument_MutableProperties(document_being_saved))
+            return True
+
+        try:
+            patch._apply(lib.CBLDocument_MutableProperties(doc))
+            if retry_on_conflict:
+                handle = ffi.new_handle(merge)
+                saved = lib.CBLCollection_SaveDocumentWithConflictHandler(collection, doc, lib.conflictHandlerCallback,
+                                                                          handle, gError)
+            else:
+                saved = lib.CBLCollection_SaveDocumentWithConcurrencyControl(collection, doc, FailOnConflict, gError)
+            if not saved:
+                raise CBLException("Couldn't save updated document {}".format(doc_id), gError)
+        finally:
+            lib.CBL_Release(doc)
+
+
+class _CollectionTransaction:
+    def __init__(self, collection):
+        self._db = lib.CBLCollection_Database(collection)
+        self._error = ffi.new("CBLError*")
+        self._lock = transactionLock(self._db)
+
+    def __enter__(self):
+        self._lock.acquire()
+        if not lib.CBLDatabase_BeginTransaction(self._db, self._error):
+            self._lock.release()
+            raise CBLException("Couldn't begin a transaction", self._error)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        commit = not exc_type
+        try:
+            ok = lib.CBLDatabase_EndTransaction(self._db, commit, self._error)
+        finally:
+            self._lock.release()
+        if not ok and commit:
+            raise CBLException("Couldn't commit a transaction", self._error)
@@ -20,7 +20,6 @@ from .common import *
 from .Blob import Blob
 from collections.abc import Sequence, Mapping
 from functools import total_ordering
-import json
 
 
 FLArrayType = ffi.typeof("struct $$FLArray *")
@@ -30,6 +29,34 @@ FLDictType  = ffi.typeof("struct $$FLDict *")
 #### FLEECE DECODING:
 
 
+# The native decoder in CBLForPython_Extras.c walks a whole dict or array in C and returns it as a
+# pickle, which pickle.loads turns into Python objects without coming back through CFFI for each
+# value. It gives up on blobs, and on containers nested deeper than `depth`; those go through the
+# Python decoder below, as does everything if _PyCBL was built without the extras.
+_pickleFleece = getattr(lib, "CBLPy_PickleFleece", None)
+_NOT_NATIVE = object()
+
+# CBLPy_ValueType, also from the extras, returns a value's type and kind of number in one call.
+_valueType   = getattr(lib, "CBLPy_ValueType", lib.FLValue_GetType)
+_kFLInteger  = getattr(lib, "kCBLPyInteger", None)
+_kFLUnsigned = getattr(lib, "kCBLPyUnsigned", None)
+_kFLDouble   = getattr(lib, "kCBLPyDouble", None)
+
+if _pickleFleece != None:
+    from pickle import loads as _unpickle
+
+def _decodeNative(f, depth):
+    if _pickleFleece == None:
+        return _NOT_NATIVE
+    result = _pickleFleece(ffi.cast("FLValue", f), depth)
+    if not result.buf:
+        return _NOT_NATIVE
+    try:
+        return _unpickle(ffi.buffer(result.buf, result.size))
+    finally:
+        lib.FLSliceResult_Release(result)
+
+
 # Most general function, accepts params of type FLValue, FLDict or FLArray.
 def decodeFleece(f, *, depth =99, mutable =False):
     ffitype = ffi.typeof(f)
@@ -41,14 +68,20 @@ def decodeFleece(f, *, depth =99, mutable =False):
         return decodeFleeceValue(f, depth=depth, mutable=mutable)
 
 # Decodes an FLValue (which may of course turn out to be an FLArray or FLDict)
-def decodeFleeceValue(f, *, depth =99, mutable =False):
-    typ = lib.FLValue_GetType(f)
+def decodeFleeceValue(f, *, depth =99, mutable =False, native =True):
+    typ = _valueType(f)
     if typ == lib.kFLString:
         return sliceToString(lib.FLValue_AsString(f))
     elif typ == lib.kFLDict:
-        return decodeFleeceDict(ffi.cast(FLDictType, f), depth=depth, mutable=mutable)
+        return decodeFleeceDict(ffi.cast(FLDictType, f), depth=depth, mutable=mutable, native=native)
     elif typ == lib.kFLArray:
-        return decodeFleeceArray(ffi.cast(FLArrayType, f), depth=depth, mutable=mutable)
+        return decodeFleeceArray(ffi.cast(FLArrayType, f), depth=depth, mutable=mutable, native=native)
+    elif typ == _kFLInteger:
+        return lib.FLValue_AsInt(f)
+    elif typ == _kFLDouble:
+        return lib.FLValue_AsDouble(f)
+    elif typ == _kFLUnsigned:
+        return lib.FLValue_AsUnsigned(f)
     elif typ == lib.kFLNumber:
         if lib.FLValue_IsInteger(f):
             return lib.FLValue_AsInt(f)
@@ -65,21 +98,29 @@ def decodeFleeceValue(f, *, depth =99, mutable =False):
         return None
 
 # Decodes an FLArray
-def decodeFleeceArray(farray, *, depth =99, mutable =False):
+def decodeFleeceArray(farray, *, depth =99, mutable =False, native =True):
     if depth <= 0:
         if mutable:
             return MutableArray(fleece=farray)
         else:
             return Array(fleece=farray)
+    if native:
+        result = _decodeNative(farray, depth)
+        if result is not _NOT_NATIVE:
+            return result
     result = []
     n = lib.FLArray_Count(farray)
     for i in range(n):
         value = lib.FLArray_Get(farray, i)
-        result.append(decodeFleeceValue(value, depth=depth-1, mutable=mutable))
+        result.append(decodeFleeceValue(value, depth=depth-1, mutable=mutable, native=False))
     return result
 
 # Decodes an FLDict
-def decodeFleeceDict(fdict, *, depth =99, mutable =False):
+def decodeFleeceDict(fdict, *, depth =99, mutable =False, native =True):
+    if native and depth > 0:
+        result = _decodeNative(fdict, depth)
+        if result is not _NOT_NATIVE:
+            return result
     if lib.FLDict_IsBlob(fdict):
         return Blob(None, fdict=fdict)
     elif depth <= 0:
@@ -96,9 +137,81 @@ def decodeFleeceDict(fdict, *, depth =99, mutable =False):
             if not value:
                 break
             key = sliceToString( lib.FLDictIterator_GetKeyString(i) )
-            result[key] = decodeFleeceValue(value, depth=depth-1, mutable=mutable)
+            result[key] = decodeFleeceValue(value, depth=depth-1, mutable=mutable, native=False)
+            lib.FLDictIterator_Next(i)
+        return result
+
+# Decodes an FLValue down to `depth` levels of dicts/arrays; containers below that are returned as
+# JSON strings. Unlike the lazy Dictionary/Array objects decodeFleece returns at its depth limit,
+# the result stays valid after the Fleece data it came from is freed.
+def decodeFleeceBounded(f, depth, *, native =True):
+    typ = lib.FLValue_GetType(f)
+    if native and depth > 0 and (typ == lib.kFLDict or typ == lib.kFLArray):
+        # If the native decoder succeeds, nothing was nested deep enough to need JSON.
+        result = _decodeNative(f, depth)
+        if result is not _NOT_NATIVE:
+            return result
+    if typ == lib.kFLDict:
+        fdict = ffi.cast(FLDictType, f)
+        if lib.FLDict_IsBlob(fdict):
+            return decodeFleeceDict(fdict)
+        if depth <= 0:
+            return sliceResultToString(lib.FLValue_ToJSON(f))
+        result = {}
+        i = ffi.new("FLDictIterator*")
+        lib.FLDictIterator_Begin(fdict, i)
+        while True:
+            value = lib.FLDictIterator_GetValue(i)
+            if not value:
+                break
+            key = sliceToString( lib.FLDictIterator_GetKeyString(i) )
+            result[key] = decodeFleeceBounded(value, depth-1, native=False)
             lib.FLDictIterator_Next(i)
         return result
+    elif typ == lib.kFLArray:
+        if depth <= 0:
+            return sliceResultToString(lib.FLValue_ToJSON(f))
+        farray = ffi.cast(FLArrayType, f)
+        return [decodeFleeceBounded(lib.FLArray_Get(farray, i), depth-1, native=False)
+                for i in range(lib.FLArray_Count(farray))]
+    else:
+        return decodeFleeceValue(f)
+
+
+#### FLEECE ENCODING:
+
+
+# Stores a Python value into a mutable Fleece collection slot, as returned by FLMutableDict_Set,
+# FLMutableArray_Set or FLMutableArray_Append. Scalars are stored directly; containers are
+# converted through JSON.
+def setFleeceSlot(slot, value):
+    if value is None:
+        lib.FLSlot_SetNull(slot)
+    elif isinstance(value, bool):
+        lib.FLSlot_SetBool(slot, value)
+    elif isinstance(value, int):
+        if value > 0x7FFFFFFFFFFFFFFF:
+            lib.FLSlot_SetUInt(slot, value)
+        else:
+            lib.FLSlot_SetInt(slot, value)
+    elif isinstance(value, float):
+        lib.FLSlot_SetDouble(slot, value)
+    elif isinstance(value, str):
+        lib.FLSlot_SetString(slot, stringParam(value))
+    elif isinstance(value, (bytes, bytearray)):
+        buffer = ffi.from_buffer(value)
+        lib.FLSlot_SetData(slot, [buffer, len(buffer)])
+    else:
+        error = ffi.new("FLError*")
+        json = stringParam(encodeJSON(value))
+        if isinstance(value, (Mapping, Blob)):
+            container = ffi.cast("FLValue", lib.FLMutableDict_NewFromJSON(json, error))
+        else:
+            container = ffi.cast("FLValue", lib.FLMutableArray_NewFromJSON(json, error))
+        if not container:
+            raise CBLException("Couldn't convert value of type " + str(type(value)) + " to Fleece")
+        lib.FLSlot_SetValue(slot, container)
+        lib.FLValue_Release(container)
 
 
 ### Array class
@@ -107,33 +220,35 @@ def decodeFleeceDict(fdict, *, depth =99, mutable =False):
 @total_ordering
 class Array (Sequence):
     "A Couchbase Lite array, decoded from a Document or Query. Behaves like a regular Python sequence."
+    __slots__ = ("_flArray", "_pyList")
 
     def __init__(self, *, fleece=None):
         "Constructor: takes an FLArray"
         if fleece != None:
             self._flArray = fleece
+            self._pyList = UNSET        # converted on first access
         else:
+            self._flArray = None
             self._pyList = []
 
     def __len__(self):
-        if not "_pyList" in self.__dict__:
+        if self._pyList is UNSET:
             return lib.FLArray_Count(self._flArray)
         return len(self._pyList)
     
     @property
     def _toList(self):
-        if not "_pyList" in self.__dict__:
+        if self._pyList is UNSET:
             # Convert Fleece array to Python list:
             self._pyList = decodeFleeceArray(self._flArray, depth=1)
-            del self._flArray
-            print ("Converted Array to list")
+            self._flArray = None
         return self._pyList
    
     def __getitem__(self, i):
         return self._toList[i]
     
     def __repr__(self):
-        if not "_pyList" in self.__dict__:
+        if self._pyList is UNSET:
             # Don't convert in place; just return the converted form's representation
             return decodeFleeceArray(self._flArray, depth=999).__repr__()
         return self._pyList.__repr__()
@@ -149,11 +264,13 @@ class Array (Sequence):
 
 
 class MutableArray (Array):
+    __slots__ = ()
+
     def __setitem__(self, i, value):
         self._toList.__setitem__(i, value)
 
     def __delitem__(self, i):
-        self._toList.__deltem__(i)
+        self._toList.__delitem__(i)
 
     def insert(self, i, value):
         self._toList.insert(i, value)
@@ -164,23 +281,27 @@ class MutableArray (Array):
 
 class Dictionary (Mapping):
     "A Couchbase Lite dictionary, decoded from a Document or Query. Behaves like a regular Python mapping."
+    __slots__ = ("_flDict", "_pyMap")
+
     def __init__(self, *, fleece=None):
         if fleece != None:
             self._flDict = fleece
+            self._pyMap = UNSET         # converted on first access
         else:
-            self._pyDict = {}
+            self._flDict = None
+            self._pyMap = {}
 
     def __len__(self):
-        if not "_pyMap" in self.__dict__:
+        if self._pyMap is UNSET:
             return lib.FLDict_Count(self._flDict)
         return len(self._pyMap)
 
     @property
     def _toDict(self):
-        if not "_pyMap" in self.__dict__:
+        if self._pyMap is UNSET:
             # Convert Fleece dict to Python mapping:
             self._pyMap = decodeFleeceDict(self._flDict)
-            del self._flDict
+            self._flDict = None
         return self._pyMap
 
     def __getitem__(self, key):
@@ -190,7 +311,7 @@ class Dictionary (Mapping):
         return self._toDict.__iter__()
     
     def __repr__(self):
-        if not "_pyMap" in self.__dict__:
+        if self._pyMap is UNSET:
             # Don't convert in place; just return the converted form's representation
             return decodeFleeceDict(self._flDict, depth=999).__repr__()
         return self._toDict.__repr__()
@@ -205,17 +326,20 @@ class Dictionary (Mapping):
 
 
 class MutableDictionary (Dictionary):
+    __slots__ = ()
+
     def __setitem__(self, key, value):
         self._toDict.__setitem__(key, value)
 
     def __delitem__(self, key):
-        self._toDict.__deltem__(key)
+        self._toDict.__delitem__(key)
 
 
 ### JSON Encoder
 
 
 def encodeJSON(root, sortKeys =False):
+    import json     # deferred: it's a sizeable share of the package's import time
     # Custom JSON encoding for Array, Dictionary, Blob objects
     def _defaultEncodeJSON(o):
         try:
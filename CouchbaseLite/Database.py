@@ -15,14 +15,15 @@
 # limitations under the License.
 #
 
-import datetime
-import math
-from typing import Union, List
+from __future__ import annotations
+
+import threading
+import time
+import warnings
 
 from ._PyCBL import ffi, lib
 from .common import *
 from .Document import *
-from .Query import JSONLanguage
 
 
 class IndexConfiguration:
@@ -37,7 +38,7 @@ class IndexConfiguration:
         self.expressionLanguage = expressionLanguage
         self.expressions = expressions
 
-        if expressionLanguage == JSONLanguage:
+        if expressionLanguage == lib.kCBLJSONLanguage:
             if not isinstance(expressions, str):
                 self.expressions = encodeJSON(expressions)
 
@@ -76,6 +77,14 @@ class FullTextIndexConfiguration(IndexConfiguration):
         return super().get_ffi_struct() + tuple(options)
 
 
+class MaintenanceType:
+    Compact = lib.kCBLMaintenanceTypeCompact
+    Reindex = lib.kCBLMaintenanceTypeReindex
+    IntegrityCheck = lib.kCBLMaintenanceTypeIntegrityCheck
+    Optimize = lib.kCBLMaintenanceTypeOptimize
+    FullOptimize = lib.kCBLMaintenanceTypeFullOptimize
+
+
 class DatabaseConfiguration:
     def __init__(self, directory):
         self.directory = directory
@@ -89,7 +98,118 @@ class DatabaseConfiguration:
         return ffi.new("CBLDatabaseConfiguration*", [self._cblDir])
 
 
+class TransactionWarning (UserWarning):
+    """Warns that a transaction was held open longer than its database's `transactionWarningSeconds`."""
+
+
+class Transaction:
+    """
+    A database transaction, as returned by `Database.transaction()`:
+
+        with db.transaction() as tx:
+            db.saveDocument(doc)
+            if not valid:
+                tx.abort()      # roll back when the block exits, without raising
+
+    Transactions nest by flattening: entering a transaction while the same thread already has one
+    open on the database joins the outer one, and only the outermost exit commits or rolls back.
+    An abort (or an exception) at any level rolls back the whole transaction.
+
+    Couchbase Lite transactions belong to the database handle, not to a thread, so transactions
+    from different threads on the same Database are serialized: a thread entering one waits until
+    any other thread's transaction has ended.
+
+    While open, the transaction records the document operations made through the Database, and the
+    time spent in each. If it's held longer than `database.transactionWarningSeconds`, a
+    TransactionWarning is issued when it ends.
+    """
+    maxRecordedOperations = 1000
+
+    def __init__(self, database):
+        self.database = database
+        self.depth = 0
+        self.aborted = False
+        self.committed = False
+        self.started = None
+        self.duration = None
+        self.operations = []            # (operation, docID, seconds)
+        self.operationCount = 0
+        self._outer = None
+
+    def __repr__(self):
+        state = "committed" if self.committed else "aborted" if self.aborted else "open" if self.depth else "new"
+        return "Transaction[" + self.database.name + ", " + state + ", " + str(self.operationCount) + " operations]"
+
+    @property
+    def elapsed(self):
+        """Seconds since the transaction began (or its total duration, once it has ended.)"""
+        if self.duration != None:
+            return self.duration
+        if self.started == None:
+            return 0.0
+        return time.perf_counter() - self.started
+
+    @property
+    def operationTime(self):
+        """Total seconds spent in the recorded operations."""
+        return sum(op[2] for op in self.operations)
+
+    def abort(self):
+        """Marks the transaction to be rolled back when the outermost `with` block exits."""
+        (self._outer or self).aborted = True
+
+    def __enter__(self):
+        active = self.database._activeTransaction()
+        if active != None:
+            self._outer = active
+            active.depth += 1
+            return active
+        self.database._txLock.acquire()
+        error = ffi.new("CBLError*")
+        if not lib.CBLDatabase_BeginTransaction(self.database._ref, error):
+            self.database._txLock.release()
+            raise CBLException("Couldn't begin a transaction", error)
+        self.depth = 1
+        self.started = time.perf_counter()
+        self.database._txState.transaction = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tx = self._outer or self
+        self._outer = None
+        if exc_type:
+            tx.aborted = True
+        tx.depth -= 1
+        if tx.depth == 0:
+            tx._end()
+
+    def _end(self):
+        self.database._txState.transaction = None
+        commit = not self.aborted
+        error = ffi.new("CBLError*")
+        try:
+            ok = lib.CBLDatabase_EndTransaction(self.database._ref, commit, error)
+        finally:
+            self.database._txLock.release()
+        self.duration = time.perf_counter() - self.started
+        self.committed = commit and ok
+        self.database._noteTransaction(self)
+        if self.duration > self.database.transactionWarningSeconds:
+            warnings.warn("{} held for {:.3f}s ({:.3f}s in {} operations)".format(
+                              self, self.duration, self.operationTime, self.operationCount),
+                          TransactionWarning, stacklevel=3)
+        if not ok and commit:
+            raise CBLException("Couldn't commit a transaction", error)
+
+    def _record(self, operation, docID, started):
+        self.operationCount += 1
+        if len(self.operations) < self.maxRecordedOperations:
+            self.operations.append((operation, docID, time.perf_counter() - started))
+
+
 class Database (CBLObject):
+    transactionWarningSeconds = 1.0     # transactions held longer than this issue a TransactionWarning
+
     def __init__(self, name, config =None):
         if config != None:
             dirSlice = stringParam(config.directory)
@@ -98,8 +218,13 @@ class Database (CBLObject):
             cblConfig = ffi.NULL
         self.name = name
         self.listeners = set()
+        self._txState = threading.local()
+        self.transactionCount = 0
+        self.transactionTime = 0.0
+        self.longestTransaction = 0.0
         CBLObject.__init__(self, lib.CBLDatabase_Open(stringParam(name), cblConfig, gError),
                            "Couldn't open database " + name, gError)
+        self._txLock = transactionLock(self._ref)
 
     def __repr__(self):
         return "Database['" + self.name + "']"
@@ -128,8 +253,17 @@ class Database (CBLObject):
             raise CBLException("Couldn't delete database file", gError)
 
     def compact(self):
-        if not lib.CBLDatabase_PerformMaintenance(self._ref, lib.kCBLMaintenanceTypeCompact, gError):
-            raise CBLException("Couldn't compact database", gError)
+        self.performMaintenance(MaintenanceType.Compact)
+
+    def performMaintenance(self, type):
+        """
+        Runs a maintenance operation (one of the MaintenanceType constants) synchronously.
+
+        Uses its own error buffer rather than the shared one, so it's safe to call from a background thread.
+        """
+        error = ffi.new("CBLError*")
+        if not lib.CBLDatabase_PerformMaintenance(self._ref, type, error):
+            raise CBLException("Couldn't perform database maintenance", error)
 
     def createIndex(self, name, config: IndexConfiguration):
         """
@@ -177,21 +311,39 @@ class Database (CBLObject):
     def getDocument(self, id):
         return Document._get(self, id)
 
+    def getDocuments(self, ids, projection = None):
+        """Returns a dict mapping each ID to its document's properties, or None if it doesn't exist.
+           See Collection.get_documents."""
+        from .Collection import Collection
+        collection = lib.CBLDatabase_DefaultCollection(self._ref, gError)
+        if not collection:
+            raise CBLException("Couldn't get the default collection", gError)
+        try:
+            return Collection.get_documents(collection, ids, projection)
+        finally:
+            lib.CBL_Release(collection)
+
     def getMutableDocument(self, id):
         return MutableDocument._get(self, id)
 
     def saveDocument(self, doc, concurrency = FailOnConflict):
+        started = time.perf_counter()
         doc._prepareToSave()
         if not lib.CBLDatabase_SaveDocumentWithConcurrencyControl(self._ref, doc._ref, concurrency, gError):
             raise CBLException("Couldn't save document", gError)
+        self._recordOperation("save", doc.id, started)
 
     def deleteDocument(self, id):
+        started = time.perf_counter()
         if not lib.CBLDatabase_DeleteDocument(self._ref, stringParam(id), gError):
             raise CBLException("Couldn't delete document", gError)
+        self._recordOperation("delete", id, started)
 
     def purgeDocument(self, id):
+        started = time.perf_counter()
         if not lib.CBLDatabase_PurgeDocumentByID(self._ref, stringParam(id), gError):
             raise CBLException("Couldn't purge document", gError)
+        self._recordOperation("purge", id, started)
 
     def __getitem__(self, id):
         return self.getMutableDocument(id)
@@ -204,66 +356,76 @@ class Database (CBLObject):
     def __delitem__(self, id):
         self.deleteDocument(id)
 
-    # Batch operations:  (`with db: ...`)
+    # Batch operations:  (`with db.transaction() as tx: ...`, or just `with db: ...`)
+
+    def transaction(self):
+        """Returns a Transaction, to be used in a `with` statement."""
+        return Transaction(self)
 
     def __enter__(self):
-        if not lib.CBLDatabase_BeginTransaction(self._ref, gError):
-            raise CBLException("Couldn't begin a transaction", gError)
+        return self.transaction().__enter__()
 
     def __exit__(self, exc_type, exc_value, traceback):
-        commit = not exc_type
-        if not lib.CBLDatabase_EndTransaction(self._ref, commit, gError) and commit:
-            raise CBLException("Couldn't commit a transaction", gError)
+        self._activeTransaction().__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def inTransaction(self):
+        """True if the calling thread has a transaction open on this database."""
+        return self._activeTransaction() != None
+
+    @property
+    def transactionStats(self):
+        """The number of transactions ended, and their total and longest durations in seconds."""
+        return {"count": self.transactionCount, "totalSeconds": self.transactionTime,
+                "longestSeconds": self.longestTransaction}
 
-    # TODO: Some way to abort the transaction w/o raising an exception
+    def _activeTransaction(self):
+        return getattr(self._txState, "transaction", None)
+
+    def _recordOperation(self, operation, docID, started):
+        tx = self._activeTransaction()
+        if tx != None:
+            tx._record(operation, docID, started)
+
+    def _noteTransaction(self, tx):
+        self.transactionCount += 1
+        self.transactionTime += tx.duration
+        self.longestTransaction = max(self.longestTransaction, tx.duration)
 
     # Expiration:
     
     def getDocumentExpiration(self, id):
+        import datetime
         exp = lib.CBLDatabase_GetDocumentExpiration(self._ref, stringParam(id), gError)
         if exp > 0:
-            return datetime.fromtimestamp(exp)
+            return datetime.datetime.fromtimestamp(exp / 1000.0)
         elif exp == 0:
             return None
         else:
             raise CBLException("Couldn't get document's expiration", gError)
             
     def setDocumentExpiration(self, id, expDateTime):
-        timestamp = 0
-        if expDateTime != None:
-            timestamp = math.ceil(expDateTime.timestamp)
-        if not lib.CBLDatabase_SetDocumentExpiration(self._ref, stringParam(id), timestamp, gError):
+        """Sets the time a document expires: a datetime, a timedelta from now, or None to clear it."""
+        if not lib.CBLDatabase_SetDocumentExpiration(self._ref, stringParam(id), cblTimestamp(expDateTime), gError):
             raise CBLException("Couldn't set document's expiration", gError)
 
 
     # Listeners:
 
     def addListener(self, listener):
+        from . import _Listeners
         handle = ffi.new_handle(listener)
         self.listeners.add(handle)
         c_token = lib.CBLDatabase_AddChangeListener(self._ref, lib.databaseListenerCallback, handle)
         return ListenerToken(self, handle, c_token)
 
     def addDocumentListener(self, docID, listener):
+        from . import _Listeners
         handle = ffi.new_handle(listener)
         self.listeners.add(handle)
         c_token = lib.CBLDatabase_AddDocumentChangeListener(self._ref, stringParam(docID),
-                                                            lib.databaseListenerCallback, handle)
+                                                            lib.documentListenerCallback, handle)
         return ListenerToken(self, handle, c_token)
 
     def removeListener(self, token):
         token.remove()
-
-
-@ffi.def_extern()
-def databaseListenerCallback(context, db, numDocs, c_docIDs):
-    docIDs = []
-    for i in range(numDocs):
-        docIDs.append(sliceToString(c_docIDs[i]))
-    listener = ffi.from_handle(context)
-    listener(docIDs)
-
-@ffi.def_extern()
-def documentListenerCallback(context, db, docID):
-    listener = ffi.from_handle(context)
-    listener(sliceToString(docID))
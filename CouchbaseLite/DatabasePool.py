@@ -0,0 +1,151 @@
+# DatabasePool.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os.path
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ._PyCBL import lib
+from .common import *
+from .Database import Database, DatabaseConfiguration
+
+
+class _PoolEntry (object):
+    __slots__ = ("database", "refCount", "lastUsed")
+
+    def __init__(self, database):
+        self.database = database
+        self.refCount = 0
+        self.lastUsed = time.monotonic()
+
+
+class DatabasePool (object):
+    """
+    A registry of shared Database handles, keyed by (directory, name).
+
+    Every `acquire` of the same database returns the same Database object and bumps its
+    reference count; `release` drops it again. Databases whose count drops to zero stay open
+    (so the next `acquire` is free) until the pool needs room for another one, at which point
+    the least-recently-used idle database is closed.
+    """
+    def __init__(self, maxOpen =64):
+        """
+        :param maxOpen: The maximum number of databases the pool keeps open at once. When it is reached, idle databases are closed in LRU order; if none are idle, `acquire` raises a CBLException.
+        """
+        if maxOpen < 1:
+            raise ValueError("maxOpen must be at least 1")
+        self.maxOpen = maxOpen
+        self._entries = OrderedDict()    # key -> _PoolEntry, least recently used first
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __repr__(self):
+        return "DatabasePool[" + str(len(self._entries)) + "/" + str(self.maxOpen) + " open]"
+
+    @staticmethod
+    def _key(name, config):
+        if config != None:
+            directory = config.directory
+        else:
+            directory = sliceToString(lib.CBLDatabaseConfiguration_Default().directory)
+        return (os.path.abspath(directory), name)
+
+    def acquire(self, name, config =None):
+        """Returns the shared Database with this name and configuration, opening it if necessary.
+           Every call must be balanced by a call to `release`."""
+        key = DatabasePool._key(name, config)
+        with self._lock:
+            if self._closed:
+                raise CBLException("DatabasePool is closed")
+            entry = self._entries.get(key)
+            if entry == None:
+                if len(self._entries) >= self.maxOpen:
+                    self._evictIdle(len(self._entries) - self.maxOpen + 1)
+                if config == None:
+                    config = DatabaseConfiguration(key[0])
+                entry = _PoolEntry(Database(name, config))
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+            entry.refCount += 1
+            entry.lastUsed = time.monotonic()
+            return entry.database
+
+    def release(self, database):
+        """Gives back a Database obtained from `acquire`. The database stays open while idle,
+           until it is evicted or the pool is closed."""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.database is database:
+                    if entry.refCount <= 0:
+                        raise CBLException("Database " + database.name + " released more often than acquired")
+                    entry.refCount -= 1
+                    entry.lastUsed = time.monotonic()
+                    self._entries.move_to_end(key)
+                    return
+        raise CBLException("Database " + database.name + " does not belong to this pool")
+
+    @contextmanager
+    def database(self, name, config =None):
+        """Context manager that acquires a Database and releases it again: `with pool.database(name) as db: ...`"""
+        db = self.acquire(name, config)
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def closeIdle(self, idleSeconds =0):
+        """Closes every database that has been unused for at least `idleSeconds`. Returns the number closed."""
+        cutoff = time.monotonic() - idleSeconds
+        with self._lock:
+            keys = [key for key, entry in self._entries.items()
+                    if entry.refCount == 0 and entry.lastUsed <= cutoff]
+            for key in keys:
+                self._entries.pop(key).database.close()
+            return len(keys)
+
+    def close(self):
+        """Closes all databases and shuts the pool down. Databases that are still acquired are
+           closed too, so callers should release them first."""
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            if entry.refCount > 0:
+                print ("WARNING: DatabasePool.close() is closing " + entry.database.name + " while it is in use")
+            entry.database.close()
+
+    @property
+    def openCount(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Must be called with self._lock held.
+    def _evictIdle(self, count):
+        victims = [key for key, entry in self._entries.items() if entry.refCount == 0][:count]
+        if len(victims) < count:
+            raise CBLException("Can't open more than " + str(self.maxOpen) + " databases: all are in use")
+        for key in victims:
+            self._entries.pop(key).database.close()
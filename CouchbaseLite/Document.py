@@ -18,16 +18,19 @@
 from ._PyCBL import ffi, lib
 from .common import *
 from .Collections import *
-import json
 
 # Concurrency control:
 LastWriteWins = 0
 FailOnConflict = 1
 
 class Document (CBLObject):
+    __slots__ = ("id", "database", "_properties")
+
     def __init__(self, id):
         self.id = id
+        self.database = None
         self._ref = None
+        self._properties = UNSET    # decoded lazily by `properties`
 
     def __repr__(self):
         return self.__class__.__name__ + "['" + self.id + "']"
@@ -67,7 +70,7 @@ class Document (CBLObject):
         return lib.CBLDocument_Sequence(self._ref)
 
     def getProperties(self):
-        if not "_properties" in self.__dict__:
+        if self._properties is UNSET:
             if self._ref:
                 fleeceProps = lib.CBLDocument_Properties(self._ref)
                 self._properties = decodeFleeceDict(fleeceProps, mutable=self.isMutable)
@@ -78,7 +81,15 @@ class Document (CBLObject):
 
     @property
     def JSON(self):
-        return encodeJSON(self.getProperties())
+        data = self.json_bytes()
+        return str(data, "utf-8") if data != None else None
+
+    def json_bytes(self):
+        """Returns the document's properties as UTF-8 encoded JSON, generated by Couchbase Lite
+           straight from the stored Fleece data without decoding it into Python objects."""
+        if not self._ref:
+            return b"{}"
+        return sliceResultToBytes(lib.CBLDocument_CreateJSON(self._ref))
 
     def get(self, key, dflt = None):
         return self.properties.get(key, dflt)
@@ -88,7 +99,7 @@ class Document (CBLObject):
         return key in self.properties
 
     def addListener(self, listener):
-        self.database.addDocumentListener(listener)
+        return self.database.addDocumentListener(self.id, listener)
 
     @property
     def isMutable(self):
@@ -106,6 +117,8 @@ class Document (CBLObject):
 
 
 class MutableDocument (Document):
+    __slots__ = ()
+
     def __init__(self, id):
         """Creates a new empty MutableDocument instance. It will not be written to the database until saved."""
         Document.__init__(self, id)
@@ -124,11 +137,18 @@ class MutableDocument (Document):
 
     @property
     def JSON(self):
-        if "_properties" in self.__dict__:
+        if self._properties is not UNSET:
             return encodeJSON(self._properties)
         else:
             return sliceResultToString(lib.CBLDocument_CreateJSON(self._ref))
 
+    def json_bytes(self):
+        """Returns the document's properties as UTF-8 encoded JSON. Local changes to `properties`
+           are first stored into the document, as saving would."""
+        if self._properties is not UNSET:
+            self._prepareToSave()
+        return Document.json_bytes(self)
+
     def setProperties(self, props):
         self._properties = props
     properties = property(Document.getProperties, setProperties)
@@ -142,7 +162,7 @@ class MutableDocument (Document):
     def _prepareToSave(self):
         if not self._ref:
             self._ref = lib.CBLDocument_CreateWithID(stringParam(self.id))
-        if "_properties" in self.__dict__:
+        if self._properties is not UNSET:
             jsonStr = encodeJSON(self._properties)
             if not lib.CBLDocument_SetJSON(self._ref, stringParam(jsonStr), gError):
                 raise CBLException("Couldn't store properties", gError)
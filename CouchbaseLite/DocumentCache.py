@@ -0,0 +1,206 @@
+# DocumentCache.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import sys
+import threading
+from collections import OrderedDict
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import decodeFleeceDict
+from .Collection import Collection
+
+
+def _estimateSize(value):
+    """A rough estimate of the memory used by a decoded document value, in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + _estimateSize(item)
+    elif isinstance(value, list):
+        for item in value:
+            size += _estimateSize(item)
+    return size
+
+
+class DocumentCache:
+    """
+    A read-through LRU cache of one collection's decoded document properties, keyed by document ID.
+
+        configs = DocumentCache(Collection.get_collection(db, "configs", "devices"), maxEntries=1000)
+        props = configs.get("device::17")
+
+    A hit costs a dict lookup: no call into Couchbase Lite and no decoding. Entries are dropped as
+    soon as the document changes, through a change listener on the whole collection, or (with
+    `listen="documents"`) one listener per cached document, which is cheaper when only a few
+    documents of a busy collection are cached. With `validate=True`, each hit also checks the
+    stored document's sequence, catching changes whose notification hasn't arrived yet.
+
+    The returned properties are shared between callers, and must not be modified.
+    """
+    def __init__(self, collection, *, maxEntries =10000, maxBytes =None, listen ="collection", validate =False):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param maxEntries: The most documents to keep; the least recently used are evicted beyond that.
+        :param maxBytes: If not None, the most (estimated) bytes of decoded properties to keep.
+        :param listen: "collection" to watch the whole collection for changes, or "documents" to watch each cached document.
+        :param validate: If true, hits are validated against the stored document's sequence.
+        """
+        if listen not in ("collection", "documents"):
+            raise ValueError("listen must be \"collection\" or \"documents\"")
+        self.collection = collection
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.listen = listen
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.staleHits = 0          # hits that validation found to be out of date
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()       # docID -> (properties, sequence, revisionID, size, listener token)
+        self._size = 0
+        self._generation = 0                # incremented by every invalidation
+        self._token = None
+        if listen == "collection":
+            self._token = Collection.add_change_listener(collection, self.invalidate)
+
+    def __repr__(self):
+        return "DocumentCache[" + Collection.get_full_name(self.collection) + ", " + str(len(self._entries)) + " docs]"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, docID):
+        return docID in self._entries
+
+    @property
+    def byteSize(self):
+        return self._size
+
+    @property
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "invalidations": self.invalidations, "staleHits": self.staleHits}
+
+    def get(self, docID, default =None):
+        """Returns the properties of document 'docID', or 'default' if it doesn't exist."""
+        with self._lock:
+            entry = self._entries.get(docID)
+            if entry != None and not self.validate:
+                self._entries.move_to_end(docID)
+                self.hits += 1
+                return entry[0] if entry[0] != None else default
+            generation = self._generation
+
+        # A new entry's listener is added before the read, so that a change during the read
+        # invalidates it, and without the lock, which the listener callbacks need.
+        token = None
+        if entry == None and self.listen == "documents":
+            token = Collection.add_document_listener(self.collection, docID, lambda changedID: self.invalidate([changedID]))
+        unused = [token]
+        try:
+            error = ffi.new("CBLError*")
+            doc = lib.CBLCollection_GetDocument(self.collection, stringParam(docID), error)
+            if not doc and error.code != 0:
+                raise CBLException("Couldn't get document " + docID, error)
+            try:
+                sequence = lib.CBLDocument_Sequence(doc) if doc else 0
+                if entry != None and entry[1] == sequence:
+                    with self._lock:
+                        if docID in self._entries:
+                            self._entries.move_to_end(docID)
+                        self.hits += 1
+                    return entry[0] if entry[0] != None else default
+                properties = decodeFleeceDict(lib.CBLDocument_Properties(doc)) if doc else None
+                revisionID = sliceToString(lib.CBLDocument_RevisionID(doc)) if doc else None
+            finally:
+                if doc:
+                    lib.CBL_Release(doc)
+
+            with self._lock:
+                if entry != None:
+                    self.staleHits += 1
+                else:
+                    self.misses += 1
+                # Don't cache what may already be stale, if the collection changed during the read.
+                if generation == self._generation:
+                    unused = self._store(docID, properties, sequence, revisionID, token)
+        finally:
+            self._removeListeners(unused)
+        return properties if properties != None else default
+
+    def revisionID(self, docID):
+        """The revision ID of the cached copy of a document, or None if it isn't cached or doesn't exist."""
+        with self._lock:
+            entry = self._entries.get(docID)
+            return entry[2] if entry != None else None
+
+    def invalidate(self, docIDs =None):
+        """Drops the given document IDs from the cache, or every document if 'docIDs' is None."""
+        tokens = []
+        with self._lock:
+            self._generation += 1
+            if docIDs == None:
+                docIDs = list(self._entries)
+            for docID in docIDs:
+                entry = self._entries.get(docID)
+                if entry != None:
+                    tokens.append(self._remove(docID))
+                    self.invalidations += 1
+        self._removeListeners(tokens)
+
+    def close(self):
+        """Removes the change listeners and empties the cache."""
+        self.invalidate()
+        if self._token != None:
+            self._token.remove()
+            self._token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _store(self, docID, properties, sequence, revisionID, token):
+        # Called with the lock held; 'token' is the new entry's listener token, if any. Returns the
+        # tokens that are no longer needed, to be removed after the lock is released (removing a
+        # listener waits for its callbacks to finish.)
+        tokens = []
+        if docID in self._entries:
+            tokens.append(token)
+            token = self._remove(docID)     # keep the listener that's already registered
+        size = _estimateSize(properties) if self.maxBytes != None else 0
+        self._entries[docID] = (properties, sequence, revisionID, size, token)
+        self._size += size
+        while len(self._entries) > self.maxEntries or (self.maxBytes != None and self._size > self.maxBytes):
+            tokens.append(self._remove(next(iter(self._entries))))
+            self.evictions += 1
+        return tokens
+
+    def _remove(self, docID):
+        properties, sequence, revisionID, size, token = self._entries.pop(docID)
+        self._size -= size
+        return token
+
+    @staticmethod
+    def _removeListeners(tokens):
+        for token in tokens:
+            if token != None:
+                token.remove()
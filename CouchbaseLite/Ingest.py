@@ -0,0 +1,179 @@
+# Ingest.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import encodeJSON
+
+_FLUSH = object()       # queued by `flush`; its future completes when everything before it is committed
+_STOP = object()
+
+
+class IngestBuffer:
+    """
+    Collects documents written from any number of threads, and saves them from one writer thread
+    in group commits: a transaction is committed every `maxBatch` documents, or `maxDelay` seconds
+    after the first document of the batch arrived, whichever comes first.
+
+        with IngestBuffer(db) as ingest:
+            future = ingest.submit(coll, {"sensor": 3, "temperature": 21.5})
+            ...
+            future.result()     # the document ID, once its transaction has committed
+
+    `submit` never waits for the database; it only blocks if `maxQueue` documents are already
+    waiting to be written.
+    """
+    def __init__(self, database, *, maxBatch =500, maxDelay =0.05, maxQueue =10000):
+        """
+        :param database: The Database the documents are saved to. All target collections must belong to it.
+        :param maxBatch: The most documents to save in one transaction.
+        :param maxDelay: The longest time in seconds a document waits for its batch to fill up.
+        :param maxQueue: The most documents waiting to be written; `submit` blocks beyond that.
+        """
+        self.database = database
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.batches = 0
+        self.documents = 0
+        self.lastError = None
+        self._queue = queue.Queue(maxQueue)
+        self._thread = threading.Thread(target=self._run, name="CBL ingest " + database.name, daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def __repr__(self):
+        return "IngestBuffer[" + self.database.name + ", " + str(self._queue.qsize()) + " queued]"
+
+    @property
+    def meanBatchSize(self):
+        return self.documents / self.batches if self.batches else 0.0
+
+    def submit(self, collection, properties, docID =None, *, timeout =None):
+        """
+        Queues a document to be saved. Returns a concurrent.futures.Future whose result is the
+        document's ID once the transaction containing it has committed, or which raises the
+        exception that prevented it.
+
+        :param collection: The CBLCollection to save the document in.
+        :param properties: The document body: a dict, or JSON as str or bytes.
+        :param docID: The document ID; if None, a unique one is generated.
+        :param timeout: Seconds to wait for room in the queue before raising queue.Full.
+        """
+        if self._closed:
+            raise CBLException("The IngestBuffer is closed")
+        if docID != None and not isinstance(docID, str):
+            raise TypeError("docID must be a string")
+        if not isinstance(properties, (str, bytes)):
+            properties = encodeJSON(properties)
+        future = Future()
+        self._queue.put((collection, properties, docID, future), timeout=timeout)
+        return future
+
+    def flush(self, timeout =None):
+        """Waits until every document submitted so far has been committed."""
+        if self._closed:
+            raise CBLException("The IngestBuffer is closed")
+        future = Future()
+        self._queue.put((_FLUSH, None, None, future))
+        future.result(timeout)
+
+    def close(self, timeout =None):
+        """Commits the documents still queued, then stops the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, None, None, None))
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        error = ffi.new("CBLError*")
+        while True:
+            item = self._queue.get()
+            batch = []
+            flushes = []
+            stopping = False
+            deadline = time.monotonic() + self.maxDelay
+            while True:
+                if item[0] is _STOP:
+                    stopping = True
+                elif item[0] is _FLUSH:
+                    flushes.append(item[3])
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.maxBatch:
+                    break
+                try:
+                    # A flush request commits right away instead of waiting for the batch to fill.
+                    remaining = 0 if flushes else deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch, error)
+            for future in flushes:
+                future.set_result(None)
+            if stopping:
+                return
+
+    def _commit(self, batch, error):
+        # Any error is reported through the futures; one escaping would stop the writer thread and
+        # leave every later submit and flush waiting forever.
+        saved = []
+        try:
+            with self.database:
+                for collection, properties, docID, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        saved.append((future, self._save(collection, properties, docID, error)))
+                    except Exception as x:
+                        self.lastError = x
+                        future.set_exception(x)
+        except Exception as x:
+            self.lastError = x
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(x)
+            return
+        self.batches += 1
+        self.documents += len(saved)
+        for future, docID in saved:
+            future.set_result(docID)
+
+    def _save(self, collection, properties, docID, error):
+        doc = lib.CBLDocument_CreateWithID(stringParam(docID)) if docID != None else lib.CBLDocument_Create()
+        try:
+            json = properties if isinstance(properties, bytes) else properties.encode("utf-8")
+            buffer = ffi.from_buffer(json)
+            if not lib.CBLDocument_SetJSON(doc, [buffer, len(buffer)], error):
+                raise CBLException("Invalid document JSON", error)
+            if not lib.CBLCollection_SaveDocument(collection, doc, error):
+                raise CBLException("Couldn't save document", error)
+            return sliceToString(lib.CBLDocument_ID(doc))
+        finally:
+            lib.CBL_Release(doc)
@@ -0,0 +1,141 @@
+# KeyPath.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+from collections import OrderedDict
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import decodeFleeceValue
+from .Document import Document
+from .Query import QueryResult
+
+CBLDocumentType = ffi.typeof("CBLDocument*")
+
+_CACHE_SIZE = 1024
+
+
+class KeyPath:
+    """
+    A compiled path to a nested property, like "payload.readings[3].value" (array indexes may be
+    negative, counting from the end.) Evaluating it walks the document's Fleece data directly and
+    decodes only the value at the end of the path.
+
+        reading = KeyPath("payload.readings[-1].value")
+        for doc in docs:
+            print(reading(doc))
+
+    Compiled paths are cached: constructing a KeyPath with a recently used path returns the same
+    object without recompiling it.
+    """
+    _cache = OrderedDict()
+    _cacheLock = threading.Lock()
+
+    def __new__(cls, path):
+        with cls._cacheLock:
+            keyPath = cls._cache.get(path)
+            if keyPath != None:
+                cls._cache.move_to_end(path)
+                return keyPath
+        keyPath = object.__new__(cls)
+        keyPath.path = path
+        flError = ffi.new("FLError*")
+        keyPath._ref = lib.FLKeyPath_New(stringParam(path), flError)
+        if not keyPath._ref:
+            raise ValueError("Invalid key path " + repr(path) + " (Fleece error " + str(flError[0]) + ")")
+        with cls._cacheLock:
+            keyPath = cls._cache.setdefault(path, keyPath)
+            if len(cls._cache) > _CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return keyPath
+
+    def __del__(self):
+        if "_ref" in self.__dict__ and self._ref:
+            lib.FLKeyPath_Free(self._ref)
+
+    def __repr__(self):
+        return "KeyPath[" + self.path + "]"
+
+    def __str__(self):
+        return self.path
+
+    def __reduce__(self):
+        return (KeyPath, (self.path,))
+
+    @property
+    def components(self):
+        """The path's property names and array indexes, e.g. ["payload", "readings", 3, "value"]."""
+        if "_components" not in self.__dict__:
+            components = []
+            key = ffi.new("FLSlice*")
+            index = ffi.new("int32_t*")
+            while lib.FLKeyPath_GetElement(self._ref, len(components), key, index):
+                components.append(sliceToString(key[0]) if key[0].buf != ffi.NULL else index[0])
+            self._components = components
+        return list(self._components)
+
+    def eval(self, source):
+        """Returns the FLValue at the end of the path, or NULL if there's nothing there."""
+        root = _fleeceRoot(source)
+        if not root:
+            return ffi.NULL
+        return lib.FLKeyPath_Eval(self._ref, root)
+
+    def get(self, source, default =None, *, depth =99):
+        """
+        Returns the value at the end of the path, decoded to Python, or `default` if it's missing.
+
+        :param source: A Document, a QueryResult (row), a CBLDocument pointer, or any Fleece value.
+        :param depth: How deep to decode a dict or array value; below that, lazy Dictionary/Array objects are returned.
+        """
+        value = self.eval(source)
+        if not value:
+            return default
+        return decodeFleeceValue(value, depth=depth)
+
+    __call__ = get
+
+    def exists(self, source):
+        return not not self.eval(source)
+
+    @staticmethod
+    def project(source, paths, default =None):
+        """Returns a dict mapping each of 'paths' (strings or KeyPaths) to its value in 'source'."""
+        root = _fleeceRoot(source)
+        result = {}
+        for path in paths:
+            keyPath = path if isinstance(path, KeyPath) else KeyPath(path)
+            value = lib.FLKeyPath_Eval(keyPath._ref, root) if root else ffi.NULL
+            result[keyPath.path] = decodeFleeceValue(value) if value else default
+        return result
+
+
+def _fleeceRoot(source):
+    """The Fleece value a KeyPath is evaluated against: a document's properties or a result row's columns."""
+    if isinstance(source, Document):
+        if source.isMutable:
+            source._prepareToSave()     # store any local changes to `properties`
+        if not source._ref:
+            return ffi.NULL
+        source = source._ref
+    elif isinstance(source, QueryResult):
+        if source._ref == None:
+            raise CBLException("Accessing a non-current query result row")
+        return ffi.cast("FLValue", lib.CBLResultSet_ResultDict(source._ref))
+    if ffi.typeof(source) == CBLDocumentType:
+        return ffi.cast("FLValue", lib.CBLDocument_Properties(source))
+    return ffi.cast("FLValue", source)
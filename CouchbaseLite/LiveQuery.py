@@ -0,0 +1,185 @@
+# LiveQuery.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import threading
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import decodeFleeceValue, encodeJSON
+from .Query import _resultSetJSON
+
+
+class RowDiff:
+    """
+    The changes between two snapshots of a live query's results, keyed by the LiveQuery's key column.
+    `added` and `removed` map keys to rows; `changed` maps keys to (oldRow, newRow) pairs.
+    """
+    __slots__ = ("added", "removed", "changed")
+
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return "RowDiff[+" + str(len(self.added)) + " -" + str(len(self.removed)) \
+               + " ~" + str(len(self.changed)) + "]"
+
+
+class LiveQuery:
+    """
+    Watches a Query and calls a listener with a RowDiff each time its results change.
+
+        def update(diff):
+            for key, row in diff.added.items(): ...
+        live = LiveQuery(N1QLQuery(db, "SELECT meta().id, temp FROM measures.temperatures"), "id", update)
+        live.start()
+
+    Notifications arriving within `debounce` seconds of each other are coalesced into one diff.
+    The results are read and compared on a background thread, never on the thread that posted the
+    notification; rows are compared in their encoded form, and only added or changed rows are
+    decoded. The listener is called on that background thread.
+    """
+    def __init__(self, query, key, listener, *, debounce =0.1, asArray =False):
+        """
+        :param query: The Query to watch.
+        :param key: The column (name or index) identifying a row across snapshots. Rows with equal keys replace each other.
+        :param listener: Callable taking a RowDiff. The first call, after `start`, has every row in `added`.
+        :param debounce: Seconds to wait after a notification for more to arrive before diffing.
+        :param asArray: If true, rows are lists of column values instead of dicts keyed by column name.
+        """
+        self.query = query
+        self.key = key
+        self.listener = listener
+        self.debounce = debounce
+        self.asArray = asArray
+        self.lastError = None
+        self._snapshot = {}         # key -> (encoded row, decoded row)
+        self._snapshotLock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._token = None
+        if isinstance(key, str):
+            self._keyParam = stringParam(key)
+
+    def __repr__(self):
+        return "LiveQuery[" + repr(self.query) + " by " + repr(self.key) + "]"
+
+    @property
+    def rows(self):
+        """The current rows, as a dict mapping keys to rows."""
+        with self._snapshotLock:
+            return {key: row for key, (encoded, row) in self._snapshot.items()}
+
+    def start(self):
+        if self._thread != None:
+            return
+        self._stopping = False
+        self._changed.clear()
+        self._token = self.query.addListener(self._changed.set)
+        self._thread = threading.Thread(target=self._run, name="CBL live query", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout =None):
+        """Stops the background thread, which removes the query listener as it exits."""
+        if self._thread == None:
+            return
+        self._stopping = True
+        self._changed.set()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        try:
+            while True:
+                self._changed.wait()
+                if self._stopping:
+                    return
+                # Coalesce: keep waiting until no notification has arrived for `debounce` seconds.
+                while True:
+                    self._changed.clear()
+                    if not self._changed.wait(self.debounce) or self._stopping:
+                        break
+                if self._stopping:
+                    return
+                # An error, including one from the listener, mustn't stop later updates.
+                try:
+                    diff = self._update()
+                    if diff:
+                        self.listener(diff)
+                    self.lastError = None
+                except Exception as x:
+                    self.lastError = x
+                    print ("WARNING: LiveQuery update failed: " + str(x))
+        finally:
+            # Removed here rather than in `stop`, which may give up waiting while _update uses it.
+            self._token.remove()
+            self._token = None
+
+    def _update(self):
+        error = ffi.new("CBLError*")
+        results = lib.CBLQuery_CopyCurrentResults(self.query._ref, self._token.c_token, error)
+        if not results:
+            raise CBLException("Couldn't get the live query's results", error)
+        with self._snapshotLock:
+            old = self._snapshot
+        new = {}
+        added = {}
+        changed = {}
+        try:
+            while lib.CBLResultSet_Next(results):
+                key = self._rowKey(results)
+                encoded = _resultSetJSON(results, self.asArray)
+                previous = old.get(key)
+                if previous != None and previous[0] == encoded:
+                    new[key] = previous
+                    continue
+                row = json.loads(encoded)
+                new[key] = (encoded, row)
+                if previous == None:
+                    added[key] = row
+                else:
+                    changed[key] = (previous[1], row)
+        finally:
+            lib.CBL_Release(results)
+        removed = {key: row for key, (encoded, row) in old.items() if key not in new}
+        with self._snapshotLock:
+            self._snapshot = new
+        return RowDiff(added, removed, changed)
+
+    def _rowKey(self, results):
+        if isinstance(self.key, str):
+            value = lib.CBLResultSet_ValueForKey(results, self._keyParam)
+        else:
+            value = lib.CBLResultSet_ValueAtIndex(results, self.key)
+        key = decodeFleeceValue(value) if value else None
+        if isinstance(key, (dict, list)):
+            key = encodeJSON(key, sortKeys=True)
+        return key
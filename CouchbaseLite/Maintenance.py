@@ -0,0 +1,279 @@
+# Maintenance.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import threading
+import time
+from collections import deque
+
+from .Database import MaintenanceType
+
+_TYPE_NAMES = {
+    MaintenanceType.Compact:        "compact",
+    MaintenanceType.Reindex:        "reindex",
+    MaintenanceType.IntegrityCheck: "integrity check",
+    MaintenanceType.Optimize:       "optimize",
+    MaintenanceType.FullOptimize:   "full optimize",
+}
+
+
+def databaseSize(path):
+    """Total size in bytes of the files in a database's `.cblite2` directory."""
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False):
+            total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+class MaintenancePolicy:
+    """
+    Decides when a MaintenanceScheduler runs one maintenance type. The policy is due as soon as
+    any of its triggers fires; triggers left as None are disabled.
+    """
+    def __init__(self, type, *, writes =None, growthBytes =None, growthRatio =None,
+                 idleSeconds =None, intervalSeconds =None, minIntervalSeconds =60):
+        """
+        :param type: One of the MaintenanceType constants.
+        :param writes: Run after this many document changes since the last run.
+        :param growthBytes: Run once the database files have grown by this many bytes since the last run.
+        :param growthRatio: Run once the database files have grown by this fraction (e.g. 0.5 = 50%) since the last run.
+        :param idleSeconds: Run once there have been writes since the last run, and then none for this many seconds.
+        :param intervalSeconds: Run at least this often, regardless of activity.
+        :param minIntervalSeconds: Never run more often than this, whatever the triggers say.
+        """
+        self.type = type
+        self.writes = writes
+        self.growthBytes = growthBytes
+        self.growthRatio = growthRatio
+        self.idleSeconds = idleSeconds
+        self.intervalSeconds = intervalSeconds
+        self.minIntervalSeconds = minIntervalSeconds
+        # State, updated by the scheduler:
+        self.lastRun = time.monotonic()
+        self.writesSinceRun = 0
+        self.sizeAtRun = None
+
+    def __repr__(self):
+        return "MaintenancePolicy[" + _TYPE_NAMES.get(self.type, str(self.type)) + "]"
+
+    def _dueReason(self, now, size, lastWrite):
+        """Returns a description of the trigger that fired, or None if the policy isn't due."""
+        sinceRun = now - self.lastRun
+        if sinceRun < self.minIntervalSeconds:
+            return None
+        if self.writes != None and self.writesSinceRun >= self.writes:
+            return str(self.writesSinceRun) + " writes"
+        if self.sizeAtRun != None and size != None:
+            growth = size - self.sizeAtRun
+            if self.growthBytes != None and growth >= self.growthBytes:
+                return "grew " + str(growth) + " bytes"
+            if self.growthRatio != None and self.sizeAtRun > 0 and growth >= self.growthRatio * self.sizeAtRun:
+                return "grew " + str(round(100.0 * growth / self.sizeAtRun)) + "%"
+        if self.idleSeconds != None and self.writesSinceRun > 0 and lastWrite != None \
+                and now - lastWrite >= self.idleSeconds:
+            return "idle " + str(round(now - lastWrite)) + "s"
+        if self.intervalSeconds != None and sinceRun >= self.intervalSeconds:
+            return "interval"
+        return None
+
+
+class MaintenanceReport:
+    """The outcome of one maintenance run."""
+    __slots__ = ("type", "reason", "started", "duration", "sizeBefore", "sizeAfter", "error")
+
+    def __init__(self, type, reason, started, duration, sizeBefore, sizeAfter, error =None):
+        self.type = type
+        self.reason = reason
+        self.started = started          # wall-clock time.time()
+        self.duration = duration        # seconds
+        self.sizeBefore = sizeBefore
+        self.sizeAfter = sizeAfter
+        self.error = error              # the exception, if the operation failed
+
+    @property
+    def bytesReclaimed(self):
+        if self.sizeBefore == None or self.sizeAfter == None:
+            return None
+        return self.sizeBefore - self.sizeAfter
+
+    @property
+    def succeeded(self):
+        return self.error == None
+
+    def __repr__(self):
+        r = "MaintenanceReport[" + _TYPE_NAMES.get(self.type, str(self.type)) + " (" + self.reason + "), " \
+            + "%.3fs" % self.duration
+        if self.bytesReclaimed != None:
+            r += ", reclaimed " + str(self.bytesReclaimed) + " bytes"
+        if self.error != None:
+            r += ", failed: " + str(self.error)
+        return r + "]"
+
+
+class MaintenanceScheduler:
+    """
+    Runs database maintenance (compact, reindex, integrity check, optimize...) on a background
+    thread, whenever one of its MaintenancePolicy objects says it's due.
+
+    Only one maintenance operation runs at a time, whether started by a policy or by `runNow`.
+    Writes to the database's default collection are counted automatically; writers to other
+    collections can report theirs with `noteWrites`.
+    """
+    def __init__(self, database, policies, *, checkInterval =5.0, onReport =None, historySize =100):
+        """
+        :param database: The Database to maintain.
+        :param policies: A list of MaintenancePolicy. When several are due at once, the first one in the list runs.
+        :param checkInterval: How often, in seconds, the background thread evaluates the policies.
+        :param onReport: Optional callable taking a MaintenanceReport, called on the background thread after every run.
+        :param historySize: How many reports to keep in `reports`.
+        """
+        self.database = database
+        self.policies = list(policies)
+        self.checkInterval = checkInterval
+        self.onReport = onReport
+        self.reports = deque(maxlen=historySize)
+        self.lastError = None                   # the last exception raised by `onReport` or the background loop
+        self._runLock = threading.Lock()        # held while maintenance runs
+        self._stateLock = threading.Lock()      # guards the write counters
+        self._lastWrite = None
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._listenerToken = None
+
+    def __repr__(self):
+        return "MaintenanceScheduler[" + self.database.name + "]"
+
+    def start(self):
+        if self._thread != None:
+            return
+        size = self._size()
+        for policy in self.policies:
+            policy.lastRun = time.monotonic()
+            policy.sizeAtRun = size
+        self._listenerToken = self.database.addListener(lambda docIDs: self.noteWrites(len(docIDs)))
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name="CBL maintenance " + self.database.name,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout =None):
+        """Stops the background thread, waiting for a maintenance operation in progress to finish."""
+        if self._thread == None:
+            return
+        self._stopEvent.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if self._listenerToken != None:
+            self._listenerToken.remove()
+            self._listenerToken = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def isRunning(self):
+        """True while a maintenance operation is in progress."""
+        return self._runLock.locked()
+
+    def noteWrites(self, count =1):
+        """Tells the scheduler about document writes it can't observe itself."""
+        with self._stateLock:
+            self._lastWrite = time.monotonic()
+            for policy in self.policies:
+                policy.writesSinceRun += count
+
+    def runNow(self, type, reason ="manual"):
+        """
+        Runs a maintenance operation on the calling thread and returns its MaintenanceReport.
+        Returns None without doing anything if another operation is already in progress.
+        """
+        if not self._runLock.acquire(blocking=False):
+            return None
+        try:
+            report = self._perform(type, reason)
+        finally:
+            self._runLock.release()
+        if report.succeeded:
+            self._resetPolicies(type, report.sizeAfter)
+        else:
+            # Keep a failing operation from rerunning at every check, ignoring minIntervalSeconds.
+            now = time.monotonic()
+            with self._stateLock:
+                for policy in self.policies:
+                    if policy.type == type:
+                        policy.lastRun = now
+        return report
+
+    def _run(self):
+        while not self._stopEvent.wait(self.checkInterval):
+            # Any error is recorded rather than raised, which would silently stop the thread.
+            try:
+                now = time.monotonic()
+                size = self._size()
+                with self._stateLock:
+                    lastWrite = self._lastWrite
+                for policy in self.policies:
+                    reason = policy._dueReason(now, size, lastWrite)
+                    if reason != None:
+                        self.runNow(policy.type, reason)
+                        break
+            except Exception as x:
+                self.lastError = x
+
+    def _resetPolicies(self, type, size):
+        # Compaction and full optimization subsume the cheaper types, so a run of one of those
+        # also resets the policies for the others.
+        covered = {type}
+        if type == MaintenanceType.Compact or type == MaintenanceType.FullOptimize:
+            covered.add(MaintenanceType.Optimize)
+        now = time.monotonic()
+        with self._stateLock:
+            for policy in self.policies:
+                if policy.type in covered:
+                    policy.lastRun = now
+                    policy.writesSinceRun = 0
+                    policy.sizeAtRun = size
+
+    def _perform(self, type, reason):
+        sizeBefore = self._size()
+        started = time.time()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            self.database.performMaintenance(type)
+        except Exception as x:
+            error = x
+        duration = time.perf_counter() - t0
+        report = MaintenanceReport(type, reason, started, duration, sizeBefore, self._size(), error)
+        self.reports.append(report)
+        if self.onReport != None:
+            try:
+                self.onReport(report)
+            except Exception as x:
+                self.lastError = x
+        return report
+
+    def _size(self):
+        try:
+            return databaseSize(self.database.path)
+        except OSError:
+            return None
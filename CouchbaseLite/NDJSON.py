@@ -0,0 +1,167 @@
+# NDJSON.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Streaming import and export of collections as newline-delimited JSON (one document per line.)
+# Documents never pass through Python dicts: lines are parsed straight into Fleece, and exported
+# rows are written straight from Fleece's JSON encoder.
+
+import io
+import itertools
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collection import Collection
+from .Query import N1QLQuery
+
+
+def import_ndjson(collection, fileobj, *, id_field ="_id", keep_id_field =False, batch_size =1000):
+    """
+    Reads newline-delimited JSON objects from 'fileobj' (text or binary) and saves each one as a
+    document in 'collection', committing a transaction every 'batch_size' documents. Memory use
+    is bounded by one batch of lines, regardless of the file size.
+
+    :param id_field: The property holding each document's ID. Lines without it get a generated ID. Pass None to always generate IDs.
+    :param keep_id_field: If False (the default) the ID property is removed from the saved document body.
+    :return: The number of documents imported.
+    """
+    error = ffi.new("CBLError*")
+    flError = ffi.new("FLError*")
+    idKey = stringParam(id_field) if id_field else None
+    lines = iter(fileobj)
+    lineNo = 0
+    count = 0
+    while True:
+        batch = list(itertools.islice(lines, batch_size))
+        if not batch:
+            return count
+        with Collection._transaction(collection):
+            for line in batch:
+                lineNo += 1
+                if isinstance(line, str):
+                    line = line.encode("utf-8")
+                line = line.strip()
+                if not line:
+                    continue
+                _importLine(collection, line, lineNo, idKey, keep_id_field, error, flError)
+                count += 1
+
+
+def _importLine(collection, line, lineNo, idKey, keepIDField, error, flError):
+    buffer = ffi.from_buffer(line)
+    fldoc = lib.FLDoc_FromJSON([buffer, len(buffer)], flError)
+    if not fldoc:
+        raise CBLException("Invalid JSON on line " + str(lineNo) + " (Fleece error " + str(flError[0]) + ")")
+    doc = ffi.NULL
+    props = ffi.NULL
+    try:
+        root = lib.FLValue_AsDict(lib.FLDoc_GetRoot(fldoc))
+        if not root:
+            raise CBLException("Line " + str(lineNo) + " is not a JSON object")
+        docID = lib.FLDict_Get(root, idKey) if idKey else ffi.NULL
+        if docID and lib.FLValue_GetType(docID) == lib.kFLString:
+            doc = lib.CBLDocument_CreateWithID(lib.FLValue_AsString(docID))
+        else:
+            docID = ffi.NULL
+            doc = lib.CBLDocument_Create()
+        # A shallow mutable copy of the parsed body; it points into `fldoc`, which stays alive until the save is done.
+        props = lib.FLDict_MutableCopy(root, lib.kFLDefaultCopy)
+        if docID and not keepIDField:
+            lib.FLMutableDict_Remove(props, idKey)
+        lib.CBLDocument_SetProperties(doc, props)
+        if not lib.CBLCollection_SaveDocument(collection, doc, error):
+            raise CBLException("Couldn't save the document on line " + str(lineNo), error)
+    finally:
+        if props:
+            lib.FLValue_Release(ffi.cast("FLValue", props))
+        if doc:
+            lib.CBL_Release(doc)
+        lib.FLDoc_Release(fldoc)
+
+
+def export_ndjson(collection, fileobj, query =None, *, id_field ="_id"):
+    """
+    Writes documents to 'fileobj' (text or binary) as newline-delimited JSON, streaming one row
+    at a time.
+
+    With no 'query', every document in 'collection' is written, with its ID added as the
+    'id_field' property (so the output can be fed back to import_ndjson.) Otherwise each result
+    row of 'query' is written as a JSON object keyed by the query's column names.
+
+    :return: The number of lines written.
+    """
+    text = isinstance(fileobj, io.TextIOBase)
+
+    def write(sliceResult, start =0):
+        data = memoryview(ffi.buffer(sliceResult.buf, sliceResult.size))[start:]
+        fileobj.write(str(data, "utf-8") if text else data)
+
+    newline = "\n" if text else b"\n"
+    count = 0
+    if query != None:
+        for rs in query._rows():
+            json = lib.FLValue_ToJSON(ffi.cast("FLValue", lib.CBLResultSet_ResultDict(rs)))
+            try:
+                write(json)
+            finally:
+                lib.FLSliceResult_Release(json)
+            fileobj.write(newline)
+            count += 1
+        return count
+
+    error = ffi.new("CBLError*")
+    idPrefix = ("{" + _jsonString(id_field) + ":") if id_field else None
+    if not text and idPrefix != None:
+        idPrefix = idPrefix.encode("utf-8")
+    allIDs = N1QLQuery(lib.CBLCollection_Database(collection),
+                       "SELECT meta().id FROM " + Collection.get_full_name(collection))
+    for rs in allIDs._rows():
+        docID = lib.CBLResultSet_ValueAtIndex(rs, 0)
+        doc = lib.CBLCollection_GetDocument(collection, lib.FLValue_AsString(docID), error)
+        if not doc:
+            if error.code != 0:
+                raise CBLException("Couldn't read a document to export", error)
+            continue    # deleted since the query ran
+        try:
+            json = lib.CBLDocument_CreateJSON(doc)
+        finally:
+            lib.CBL_Release(doc)
+        try:
+            if idPrefix == None:
+                write(json)
+            else:
+                # Splice the ID in front of the body's own properties: {"_id":"...", ...}
+                fileobj.write(idPrefix)
+                idJSON = lib.FLValue_ToJSON(docID)
+                try:
+                    write(idJSON)
+                finally:
+                    lib.FLSliceResult_Release(idJSON)
+                if json.size > 2:
+                    fileobj.write("," if text else b",")
+                    write(json, 1)
+                else:
+                    fileobj.write("}" if text else b"}")
+        finally:
+            lib.FLSliceResult_Release(json)
+        fileobj.write(newline)
+        count += 1
+    return count
+
+
+def _jsonString(s):
+    import json
+    return json.dumps(s)
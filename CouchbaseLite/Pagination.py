@@ -0,0 +1,182 @@
+# Pagination.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+
+from ._PyCBL import lib
+from .common import *
+from .Collection import Collection
+from .Query import N1QLQuery
+
+
+def _keyPath(path):
+    for part in path.split("."):
+        if not part.replace("_", "").isalnum():
+            raise ValueError("Key paths must be made of plain property names: " + repr(path))
+    return ".".join("`" + part + "`" for part in path.split("."))
+
+
+class Page:
+    """One page of a KeysetPager. Pass `cursor` to the pager to get the next page."""
+    __slots__ = ("rows", "cursor")
+
+    def __init__(self, rows, cursor):
+        self.rows = rows
+        self.cursor = cursor        # None if this is the last page
+
+    def __repr__(self):
+        return "Page[" + str(len(self.rows)) + " rows" + (", more]" if self.cursor else "]")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+
+class KeysetPager:
+    """
+    Pages through a collection in the order of an indexed property, then document ID.
+
+        pager = KeysetPager(coll, "timestamp", fields=["sensor", "timestamp", "temperature"])
+        page = pager.page()
+        while page.cursor:
+            upload(page.rows)
+            page = pager.page(page.cursor)
+
+    Each page starts where the previous one ended: the query asks for keys after the last row's
+    (key, document ID), which an index on the key finds directly, instead of skipping earlier rows
+    with OFFSET. So every page costs the same no matter how deep it is. The pager checks the query
+    plan to make sure the key is indexed, since without an index every page would sort the whole
+    collection.
+
+    The cursor tokens are opaque strings that can be stored, e.g. to resume an export after a
+    restart. Rows changed or added behind the cursor's position are not revisited.
+    """
+    def __init__(self, collection, key, *, fields =None, where =None, params =None, pageSize =1000,
+                 descending =False, requireIndex =True):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param key: The property (or dotted key path) to order by. Documents without it are skipped.
+        :param fields: Properties to return in each row. If None, rows are the documents' whole properties.
+        :param where: An optional N1QL condition limiting the rows, which may use $parameters from 'params'.
+        :param params: Values of the parameters in 'where'. They mustn't be named "key", "id" or "limit".
+        :param pageSize: The number of rows per page.
+        :param descending: If true, pages go from the highest key to the lowest.
+        :param requireIndex: If true (the default), raise CBLException if the key isn't indexed.
+        """
+        self.collection = collection
+        self.key = key
+        self.fields = list(fields) if fields != None else None
+        self.where = where
+        self.params = dict(params or {})
+        self.pageSize = pageSize
+        self.descending = descending
+        self.pages = 0
+        self.rows = 0
+        for reserved in ("key", "id", "limit"):
+            if reserved in self.params:
+                raise ValueError("The parameter name $" + reserved + " is used by the pager")
+        self._keyExpr = _keyPath(key)
+        self._lock = threading.Lock()
+        # The cursor records what it's a position in, so it can't be used with a different scan.
+        self._scan = [Collection.get_full_name(collection), key, where, descending]
+        self._first = self._compile(False)
+        self._next = self._compile(True)
+        if requireIndex and not self._next.plan.ordersByIndex:
+            raise CBLException("Paging by " + repr(key) + " needs a value index on it: "
+                               + "the query would sort the whole collection for every page")
+
+    def __repr__(self):
+        return "KeysetPager[" + self._scan[0] + " by " + self.key + "]"
+
+    @property
+    def plan(self):
+        """The QueryPlan of the queries fetching the second and later pages."""
+        return self._next.plan
+
+    def page(self, cursor =None):
+        """Returns the first Page, or the one after the position recorded in 'cursor'."""
+        params = dict(self.params)
+        params["limit"] = self.pageSize + 1
+        if cursor != None:
+            state = decodeCursor("keyset", cursor)
+            if state.get("scan") != self._scan:
+                raise ValueError("The cursor is from a different pager")
+            params["key"] = state["key"]
+            params["id"] = state["id"]
+        with self._lock:
+            query = self._next if cursor != None else self._first
+            query.setParameters(params)
+            rows = list(query.stream(asArray=True))
+
+        more = len(rows) > self.pageSize
+        rows = rows[:self.pageSize]
+        nextCursor = None
+        if more:
+            docID, key = rows[-1][0], rows[-1][1]
+            nextCursor = encodeCursor("keyset", {"scan": self._scan, "key": key, "id": docID})
+
+        if self.fields != None:
+            result = []
+            for row in rows:
+                item = dict(zip(self.fields, row[2:]))
+                item["_id"] = row[0]
+                result.append(item)
+        else:
+            docs = Collection.get_documents(self.collection, [row[0] for row in rows])
+            result = []
+            for row in rows:
+                props = docs.get(row[0])
+                if props != None:       # unless deleted since the query ran
+                    props["_id"] = row[0]
+                    result.append(props)
+        self.pages += 1
+        self.rows += len(result)
+        return Page(result, nextCursor)
+
+    def iterPages(self, cursor =None):
+        """Yields every Page from the beginning, or from the position recorded in 'cursor'."""
+        while True:
+            page = self.page(cursor)
+            yield page
+            cursor = page.cursor
+            if cursor == None:
+                return
+
+    def __iter__(self):
+        """Yields every row, fetching one page at a time."""
+        for page in self.iterPages():
+            yield from page.rows
+
+    def _compile(self, resume):
+        key = self._keyExpr
+        select = ["META().id", key] + [_keyPath(f) for f in (self.fields or [])]
+        where = [key + " IS VALUED"]
+        if self.where:
+            where.append("(" + self.where + ")")
+        if resume:
+            op = "<" if self.descending else ">"
+            # The first term lets the index seek straight to the position; the second breaks ties.
+            where.append("{k} {op}= $key AND ({k} {op} $key OR META().id {op} $id)".format(k=key, op=op))
+        order = " DESC" if self.descending else ""
+        text = "SELECT {} FROM {} WHERE {} ORDER BY {}{}, META().id{} LIMIT $limit".format(
+            ", ".join(select), self._scan[0], " AND ".join(where), key, order, order)
+        return N1QLQuery(lib.CBLCollection_Database(self.collection), text)
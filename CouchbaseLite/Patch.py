@@ -0,0 +1,180 @@
+# Patch.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import setFleeceSlot
+from .KeyPath import KeyPath
+
+OP_SET = "set"
+OP_UNSET = "unset"
+OP_INCREMENT = "increment"
+OP_APPEND = "append"
+
+
+class Patch:
+    """
+    A list of in-place changes to a document's properties, applied by Collection.update_document
+    directly to the document's Fleece data: only the properties along each key path are touched,
+    the rest of the document is never decoded.
+
+        Patch().set("status", "ok").increment("stats.count").append("log", "updated")
+
+    Key paths have the same syntax as KeyPath: dotted property names with optional array indexes,
+    e.g. "readings[-1].value".
+    Missing intermediate dictionaries are created by set/increment/append.
+    """
+    def __init__(self, operations =None):
+        """:param operations: Optional list of (op, path, [value]) tuples, with op one of "set", "unset", "increment", "append"."""
+        self.operations = []
+        for op in (operations or []):
+            self._add(op[0], op[1], op[2] if len(op) > 2 else None)
+
+    def __repr__(self):
+        return "Patch" + repr([(op, ".".join(map(str, path)), value) for op, path, value in self.operations])
+
+    def __len__(self):
+        return len(self.operations)
+
+    def set(self, path, value):
+        return self._add(OP_SET, path, value)
+
+    def unset(self, path):
+        return self._add(OP_UNSET, path, None)
+
+    def increment(self, path, by =1):
+        if isinstance(by, bool) or not isinstance(by, (int, float)):
+            raise TypeError("increment amount must be a number")
+        return self._add(OP_INCREMENT, path, by)
+
+    def append(self, path, value):
+        return self._add(OP_APPEND, path, value)
+
+    def _add(self, op, path, value):
+        if op not in (OP_SET, OP_UNSET, OP_INCREMENT, OP_APPEND):
+            raise ValueError("Unknown patch operation " + repr(op))
+        components = KeyPath(path).components
+        if not components or not isinstance(components[0], str):
+            raise ValueError("Key path must start with a property name: " + repr(path))
+        self.operations.append((op, components, value))
+        return self
+
+    def _apply(self, props):
+        """Applies the operations to a FLMutableDict, such as CBLDocument_MutableProperties returns."""
+        for op, path, value in self.operations:
+            container = _walk(props, path, create=(op != OP_UNSET))
+            if container == None:
+                continue
+            key = path[-1]
+            _checkKey(container, key)
+            if op == OP_SET:
+                setFleeceSlot(_slot(container, key), value)
+            elif op == OP_UNSET:
+                _remove(container, key)
+            elif op == OP_INCREMENT:
+                current = _get(container, key)
+                if current and lib.FLValue_GetType(current) != lib.kFLNull:
+                    if lib.FLValue_GetType(current) != lib.kFLNumber:
+                        raise CBLException("Can't increment non-numeric property at " + repr(path))
+                    if lib.FLValue_IsInteger(current) and isinstance(value, int):
+                        value = lib.FLValue_AsInt(current) + value
+                    else:
+                        value = lib.FLValue_AsDouble(current) + value
+                setFleeceSlot(_slot(container, key), value)
+            elif op == OP_APPEND:
+                array = _child(container, key, False, True)
+                setFleeceSlot(lib.FLMutableArray_Append(array), value)
+
+
+# A container is a (isDict, FLMutableDict-or-FLMutableArray) pair.
+
+def _walk(props, path, create):
+    """Returns the container that holds the last path component, or None if it's missing and `create` is false."""
+    container = (True, props)
+    for i in range(len(path) - 1):
+        container = _child(container, path[i], isinstance(path[i + 1], str), create)
+        if container == None:
+            return None
+        container = (isinstance(path[i + 1], str), container)
+    return container
+
+
+def _checkKey(container, key):
+    if container[0] != isinstance(key, str):
+        raise CBLException("Key path component " + repr(key) + " doesn't match the document's structure")
+
+
+def _index(array, key):
+    count = lib.FLArray_Count(ffi.cast("FLArray", array))
+    index = key + count if key < 0 else key
+    if index < 0 or index >= count:
+        raise IndexError("Array index " + str(key) + " out of range")
+    return index
+
+
+def _child(container, key, wantDict, create):
+    """Returns the mutable dict or array at `key` of a container, creating it if necessary and allowed."""
+    _checkKey(container, key)
+    isDict, c = container
+    if isDict:
+        child = lib.FLMutableDict_GetMutableDict(c, stringParam(key)) if wantDict \
+            else lib.FLMutableDict_GetMutableArray(c, stringParam(key))
+    else:
+        count = lib.FLArray_Count(ffi.cast("FLArray", c))
+        if not create and not (-count <= key < count):
+            return None
+        index = _index(c, key)
+        child = lib.FLMutableArray_GetMutableDict(c, index) if wantDict \
+            else lib.FLMutableArray_GetMutableArray(c, index)
+    if child:
+        return child
+    existing = _get(container, key)
+    if existing and lib.FLValue_GetType(existing) != lib.kFLNull:
+        if create:
+            raise CBLException("Property " + repr(key) + " exists but is not a " + ("dictionary" if wantDict else "array"))
+        return None
+    if not create:
+        return None
+    new = lib.FLMutableDict_New() if wantDict else lib.FLMutableArray_New()
+    lib.FLSlot_SetValue(_slot(container, key), ffi.cast("FLValue", new))
+    lib.FLValue_Release(ffi.cast("FLValue", new))
+    return _child(container, key, wantDict, False)
+
+
+def _get(container, key):
+    isDict, c = container
+    if isDict:
+        return lib.FLDict_Get(ffi.cast("FLDict", c), stringParam(key))
+    return lib.FLArray_Get(ffi.cast("FLArray", c), _index(c, key))
+
+
+def _slot(container, key):
+    isDict, c = container
+    if isDict:
+        return lib.FLMutableDict_Set(c, stringParam(key))
+    return lib.FLMutableArray_Set(c, _index(c, key))
+
+
+def _remove(container, key):
+    isDict, c = container
+    if isDict:
+        lib.FLMutableDict_Remove(c, stringParam(key))
+    else:
+        count = lib.FLArray_Count(ffi.cast("FLArray", c))
+        index = key + count if key < 0 else key
+        if 0 <= index < count:
+            lib.FLMutableArray_Remove(c, index, 1)
@@ -0,0 +1,323 @@
+# Profiler.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import threading
+import time
+from collections import deque
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import decodeFleece
+from .Query import Query, N1QLQuery
+
+_PLAN_LINE = re.compile(r"^(\d+)\|(\d+)\|(\d+)\|\s*(.*)$")
+_SCAN = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+(\S+))?")
+_INDEX = re.compile(r"USING\s+(AUTOMATIC\s+)?(COVERING\s+)?INDEX\s+(\S+)")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (.*)$")
+
+
+class PlanStep:
+    """One line of SQLite's query plan."""
+    __slots__ = ("id", "parent", "detail", "operation", "table", "alias", "index", "covering", "automatic")
+
+    def __init__(self, id, parent, detail):
+        self.id = id
+        self.parent = parent
+        self.detail = detail
+        self.operation = detail.split(" ", 1)[0] if detail else ""
+        self.table = self.alias = self.index = None
+        self.covering = self.automatic = False
+        scan = _SCAN.match(detail)
+        if scan:
+            self.operation, self.table, self.alias = scan.group(1), scan.group(2), scan.group(3)
+        index = _INDEX.search(detail)
+        if index:
+            self.automatic = index.group(1) != None
+            self.covering = index.group(2) != None
+            self.index = index.group(3)
+
+    def __repr__(self):
+        return "PlanStep[" + self.detail + "]"
+
+    @property
+    def isVirtualTable(self):
+        """True for a full-text index lookup."""
+        return "VIRTUAL TABLE" in self.detail
+
+    @property
+    def isFullScan(self):
+        """True if this step reads every row of a table, without an index."""
+        return (self.operation == "SCAN" and self.index == None and not self.isVirtualTable
+                and "PRIMARY KEY" not in self.detail)
+
+
+class QueryPlan:
+    """
+    A parsed Query.explanation: the SQL a query was translated to, SQLite's plan for it, and the
+    query's JSON form.
+
+        plan = QueryPlan(query.explanation)
+        if plan.fullScans:
+            print("unindexed:", plan.fullScans, plan.sql)
+    """
+    def __init__(self, explanation):
+        import json     # deferred, as in Collections.encodeJSON
+        self.text = explanation
+        self.sql = None
+        self.json = None
+        self.steps = []
+        sql = []
+        for line in explanation.splitlines():
+            match = _PLAN_LINE.match(line)
+            if match:
+                self.steps.append(PlanStep(int(match.group(1)), int(match.group(2)), match.group(4)))
+            elif line.startswith("{") or line.startswith("["):
+                try:
+                    self.json = json.loads(line)
+                except ValueError:
+                    pass
+            elif line.strip() and not self.steps:
+                sql.append(line)
+        self.sql = "\n".join(sql) if sql else None
+
+    def __repr__(self):
+        return "QueryPlan[indexes=" + repr(self.indexes) + ", fullScans=" + repr(self.fullScans) + "]"
+
+    def __str__(self):
+        # The steps as an indented tree, the way the sqlite3 shell shows them.
+        depths = {}
+        lines = []
+        for step in self.steps:
+            depth = depths.get(step.parent, -1) + 1
+            depths[step.id] = depth
+            lines.append("  " * depth + step.detail)
+        return "\n".join(lines)
+
+    @property
+    def indexes(self):
+        """The names of the indexes the query uses, including full-text indexes."""
+        names = []
+        for step in self.steps:
+            name = step.index if step.index != None and not step.automatic else None
+            if name == None and step.isVirtualTable:
+                name = step.table
+            if name != None and name not in names:
+                names.append(name)
+        return names
+
+    @property
+    def fullScans(self):
+        """The tables (or aliases) the query reads in full, without an index."""
+        return [step.alias or step.table for step in self.steps if step.isFullScan]
+
+    @property
+    def tempBTrees(self):
+        """What SQLite has to sort or deduplicate in a temporary B-tree: "ORDER BY", "GROUP BY", "DISTINCT"..."""
+        result = []
+        for step in self.steps:
+            match = _TEMP_BTREE.search(step.detail)
+            if match:
+                result.append(match.group(1))
+        return result
+
+    @property
+    def usesFullTextIndex(self):
+        return any(step.isVirtualTable for step in self.steps)
+
+    @property
+    def isIndexed(self):
+        """True if no table is read in full."""
+        return not self.fullScans
+
+    @property
+    def ordersByIndex(self):
+        """True if rows come out of an index in the query's order, without a sort."""
+        return any(step.index != None and not step.automatic for step in self.steps) \
+            and "ORDER BY" not in self.tempBTrees
+
+
+class QueryStats:
+    """Accumulated timings of one distinct query, as kept by QueryProfiler."""
+    __slots__ = ("text", "count", "rows", "compileSeconds", "executeSeconds", "decodeSeconds", "maxSeconds")
+
+    def __init__(self, text):
+        self.text = text
+        self.count = 0
+        self.rows = 0
+        self.compileSeconds = 0.0
+        self.executeSeconds = 0.0
+        self.decodeSeconds = 0.0
+        self.maxSeconds = 0.0
+
+    def __repr__(self):
+        return "QueryStats[{} runs, {:.3f}s total, {:.3f}s max: {}]".format(
+            self.count, self.totalSeconds, self.maxSeconds, self.text)
+
+    @property
+    def totalSeconds(self):
+        return self.compileSeconds + self.executeSeconds + self.decodeSeconds
+
+    @property
+    def meanSeconds(self):
+        return self.totalSeconds / self.count if self.count else 0.0
+
+
+class SlowQuery:
+    """A query run that took at least the QueryProfiler's threshold."""
+    __slots__ = ("text", "params", "plan", "when", "rows", "compileSeconds", "executeSeconds", "decodeSeconds")
+
+    def __init__(self, text, params, plan, when, rows, compileSeconds, executeSeconds, decodeSeconds):
+        self.text = text
+        self.params = params
+        self.plan = plan
+        self.when = when
+        self.rows = rows
+        self.compileSeconds = compileSeconds
+        self.executeSeconds = executeSeconds
+        self.decodeSeconds = decodeSeconds
+
+    def __repr__(self):
+        return "SlowQuery[{:.3f}s, {} rows, indexes={}, fullScans={}: {}]".format(
+            self.totalSeconds, self.rows, self.plan.indexes, self.plan.fullScans, self.text)
+
+    @property
+    def totalSeconds(self):
+        return self.compileSeconds + self.executeSeconds + self.decodeSeconds
+
+
+class QueryProfiler:
+    """
+    Runs queries while timing their compilation, execution and decoding separately, keeps
+    per-query statistics, and logs the slow ones along with their parameters and parsed plan.
+
+        profiler = QueryProfiler(db, slowThreshold=0.05)
+        rows = profiler.execute("SELECT * FROM readings WHERE sensor = $s", {"s": 3})
+        ...
+        for stats in profiler.stats()[:5]:
+            print(stats)
+        for slow in profiler.slowQueries:
+            print(slow, slow.plan)
+
+    "Execute" is the time Couchbase Lite takes to run the query and collect the result set;
+    "decode" is the time spent stepping through the rows and converting them to Python objects.
+    Queries given as N1QL strings are compiled once and cached.
+    """
+    def __init__(self, database, *, slowThreshold =0.1, maxSlowQueries =100, onSlowQuery =None):
+        """
+        :param database: The Database (or CBLDatabase pointer) that N1QL strings are compiled against.
+        :param slowThreshold: Runs taking at least this many seconds in total are logged.
+        :param maxSlowQueries: The number of slow query records to keep; older ones are dropped.
+        :param onSlowQuery: An optional function to call with each SlowQuery record.
+        """
+        self.database = database
+        self.slowThreshold = slowThreshold
+        self.onSlowQuery = onSlowQuery
+        self.slowQueries = deque(maxlen=maxSlowQueries)
+        self._stats = {}
+        self._queries = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "QueryProfiler[" + str(len(self._stats)) + " queries, " + str(len(self.slowQueries)) + " slow]"
+
+    def execute(self, query, params =None, *, asArray =False):
+        """
+        Runs a query and returns its rows as a list of dicts (or lists, if 'asArray' is true.)
+
+        :param query: A Query, or a N1QL string.
+        :param params: Optional dict of query parameters.
+        """
+        compileSeconds = 0.0
+        if isinstance(query, str):
+            with self._lock:
+                compiled = self._queries.get(query)
+            if compiled == None:
+                t0 = time.perf_counter()
+                compiled = N1QLQuery(self.database, query)
+                compileSeconds = time.perf_counter() - t0
+                with self._lock:
+                    compiled = self._queries.setdefault(query, compiled)
+            query = compiled
+        elif not isinstance(query, Query):
+            raise TypeError("query must be a Query or a N1QL string")
+
+        error = ffi.new("CBLError*")
+        with self._lock:    # parameters are stored in the query, so runs of one query mustn't overlap
+            if params != None:
+                query.setParameters(params)
+            t0 = time.perf_counter()
+            results = lib.CBLQuery_Execute(query._ref, error)
+            t1 = time.perf_counter()
+        if not results:
+            raise CBLException("Query failed", error)
+        rows = []
+        try:
+            getRow = lib.CBLResultSet_ResultArray if asArray else lib.CBLResultSet_ResultDict
+            while lib.CBLResultSet_Next(results):
+                rows.append(decodeFleece(getRow(results)))
+        finally:
+            lib.CBL_Release(results)
+        t2 = time.perf_counter()
+        self._record(query, params, compileSeconds, t1 - t0, t2 - t1, len(rows))
+        return rows
+
+    def plan(self, query):
+        """Returns the QueryPlan of a Query or N1QL string, parsed once and cached."""
+        text = query if isinstance(query, str) else query.sourceCode
+        with self._lock:
+            plan = self._plans.get(text)
+        if plan == None:
+            if isinstance(query, str):
+                query = self._queries.get(text) or N1QLQuery(self.database, text)
+            plan = QueryPlan(query.explanation)
+            with self._lock:
+                self._plans[text] = plan
+        return plan
+
+    def stats(self):
+        """Returns the QueryStats of every distinct query run so far, the most time-consuming first."""
+        with self._lock:
+            return sorted(self._stats.values(), key=lambda s: s.totalSeconds, reverse=True)
+
+    def reset(self):
+        """Clears the statistics and the slow query log. Compiled queries are kept."""
+        with self._lock:
+            self._stats.clear()
+            self.slowQueries.clear()
+
+    def _record(self, query, params, compileSeconds, executeSeconds, decodeSeconds, rowCount):
+        text = query.sourceCode
+        total = compileSeconds + executeSeconds + decodeSeconds
+        with self._lock:
+            stats = self._stats.get(text)
+            if stats == None:
+                stats = QueryStats(text)
+                self._stats[text] = stats
+            stats.count += 1
+            stats.rows += rowCount
+            stats.compileSeconds += compileSeconds
+            stats.executeSeconds += executeSeconds
+            stats.decodeSeconds += decodeSeconds
+            stats.maxSeconds = max(stats.maxSeconds, total)
+        if total >= self.slowThreshold:
+            slow = SlowQuery(text, dict(params) if params else None, self.plan(query), time.time(), rowCount,
+                             compileSeconds, executeSeconds, decodeSeconds)
+            self.slowQueries.append(slow)
+            if self.onSlowQuery != None:
+                self.onSlowQuery(slow)
@@ -19,20 +19,23 @@ from ._PyCBL import ffi, lib
 from .common import *
 from .Collections import *
 from .Document import MutableDocument
-import json
 
 JSONLanguage = lib.kCBLJSONLanguage
 N1QLLanguage = lib.kCBLN1QLLanguage
 
+_MISSING = object()
+
 ValueIndex = 0
 FullTextIndex = 1
 
 class Query (CBLObject):
 
     def __init__(self, database, queryString, language = N1QLLanguage):
+        """'database' is a Database, or a raw CBLDatabase pointer such as CBLCollection_Database returns."""
         errorPos = ffi.new("int*")
+        dbRef = database._ref if isinstance(database, CBLObject) else database
         CBLObject.__init__(self,
-                           lib.CBLDatabase_CreateQuery(database._ref,
+                           lib.CBLDatabase_CreateQuery(dbRef,
                                                        language, 
                                                        stringParam(queryString),
                                                        errorPos, 
@@ -50,6 +53,12 @@ class Query (CBLObject):
     def explanation(self):
         return sliceToString(lib.CBLQuery_Explain(self._ref))
 
+    @property
+    def plan(self):
+        """The explanation, parsed into a Profiler.QueryPlan."""
+        from .Profiler import QueryPlan
+        return QueryPlan(self.explanation)
+
     @property
     def columnNames(self):
         if not "_columns" in self.__dict__:
@@ -66,6 +75,65 @@ class Query (CBLObject):
         doc._prepareToSave()
         lib.CBLQuery_SetParameters(self._ref, lib.CBLDocument_Properties(doc._ref))
 
+    def _rows(self):
+        """Executes the query and returns a Generator that yields the raw CBLResultSet once per row.
+           Internal: the result set only points to a row until the generator is advanced."""
+        error = ffi.new("CBLError*")
+        results = lib.CBLQuery_Execute(self._ref, error)
+        if not results:
+            raise CBLException("Query failed", error)
+        try:
+            while lib.CBLResultSet_Next(results):
+                yield results
+        finally:
+            lib.CBL_Release(results)
+
+    def execute_json(self, asArray =False):
+        """Executes the query and returns a Generator of rows as UTF-8 encoded JSON bytes, each a
+           JSON object keyed by column name (or an array, if `asArray` is true.) The rows are
+           encoded by Fleece directly; no Python objects are created besides the bytes."""
+        for rs in self._rows():
+            yield _resultSetJSON(rs, asArray)
+
+    def stream(self, columns =None, *, depth =None, asArray =False):
+        """
+        Executes the query and returns a Generator of rows, decoded one at a time, for result sets
+        too big to hold in memory.
+
+        :param columns: Optional list of column names or indexes; only these columns are decoded.
+        :param depth: If not None, the number of levels of nested dicts/arrays to decode in each column; deeper ones are returned as JSON strings.
+        :param asArray: If true, each row is a list of values instead of a dict keyed by column name. (In a dict, columns whose value is missing are omitted.)
+        """
+        names = self.columnNames
+        if columns == None:
+            indexes = list(range(self.columnCount))
+        else:
+            indexes = []
+            for column in columns:
+                if isinstance(column, int):
+                    if column < 0 or column >= self.columnCount:
+                        raise IndexError("Column index out of range")
+                    indexes.append(column)
+                elif column in names:
+                    indexes.append(names.index(column))
+                else:
+                    raise KeyError("No such column in Query: " + repr(column))
+        keys = [names[i] for i in indexes]
+        for rs in self._rows():
+            values = []
+            for i in indexes:
+                value = lib.CBLResultSet_ValueAtIndex(rs, i)
+                if not value:
+                    values.append(_MISSING)
+                elif depth == None:
+                    values.append(decodeFleeceValue(value))
+                else:
+                    values.append(decodeFleeceBounded(value, depth))
+            if asArray:
+                yield [None if v is _MISSING else v for v in values]
+            else:
+                yield {key: v for key, v in zip(keys, values) if v is not _MISSING}
+
     def execute(self):
         """Executes the query and returns a Generator of QueryResult objects."""
         results = lib.CBLQuery_Execute(self._ref, gError)
@@ -84,6 +152,7 @@ class Query (CBLObject):
     # Listeners:
 
     def addListener(self, listener):
+        from . import _Listeners
         handle = ffi.new_handle(listener)
         self.listeners.add(handle)
         c_token = lib.CBLQuery_AddChangeListener(self._ref, lib.queryListenerCallback, handle)
@@ -109,6 +178,8 @@ class QueryResult (object):
     """A container representing a query result. It can be indexed using either
        integers (to access columns in the order they were declared in the query)
        or strings (to access columns by name.)"""
+    __slots__ = ("query", "_ref")
+
     def __init__(self, query, results):
         self.query = query
         self._ref = results
@@ -116,7 +187,7 @@ class QueryResult (object):
     def __repr__(self):
         if self._ref == None:
             return "QueryResult[invalidated]"
-        return "QueryResult" + encodeJSON(self.asDictionary())
+        return "QueryResult" + str(self.json_bytes(), "utf-8")
 
     def invalidate(self):
         self._ref = None
@@ -159,6 +230,20 @@ class QueryResult (object):
     def asDictionary(self):
         return decodeFleece(lib.CBLResultSet_ResultDict(self._ref))
 
+    def json_bytes(self, asArray =False):
+        """Returns the row as UTF-8 encoded JSON: an object keyed by column name, or an array if `asArray` is true."""
+        if self._ref == None:
+            raise CBLException("Accessing a non-current query result row")
+        return _resultSetJSON(self._ref, asArray)
+
+
+def _resultSetJSON(rs, asArray):
+    if asArray:
+        row = lib.CBLResultSet_ResultArray(rs)
+    else:
+        row = lib.CBLResultSet_ResultDict(rs)
+    return sliceResultToBytes(lib.FLValue_ToJSON(ffi.cast("FLValue", row)))
+
 
 def createIndex(database, name, index_spec):
     type = None
@@ -218,9 +303,3 @@ class IndexSpec:
                             self.ignore_accents,
                             self.language])
         return None
-
-
-@ffi.def_extern()
-def queryListenerCallback(context, query):
-    listener = ffi.from_handle(context)
-    listener()
@@ -0,0 +1,246 @@
+# QueryCache.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import encodeJSON
+from .Collection import Collection
+from .Query import Query, N1QLQuery
+
+# Collection names following FROM or JOIN in N1QL: `name`, scope.name, with optional backquotes.
+_IDENTIFIER = r"(?:`[^`]+`|[A-Za-z_][\w-]*)"
+_SOURCE = re.compile(r"\b(?:FROM|JOIN)\s+(" + _IDENTIFIER + r"(?:\." + _IDENTIFIER + r")?)", re.IGNORECASE)
+
+_DEFAULT = "_default"
+
+
+def queryCollections(n1ql, databaseName =None):
+    """
+    Returns the (scope, collection) names a N1QL query reads from. A bare collection name is in the
+    default scope; "_", "_default" and the database's own name denote the default collection.
+    """
+    sources = []
+    for m in _SOURCE.finditer(n1ql):
+        parts = [part.strip("`") for part in re.findall(_IDENTIFIER, m.group(1))]
+        if len(parts) == 1:
+            name = parts[0]
+            if name == "_" or name == _DEFAULT or name == databaseName:
+                name = _DEFAULT
+            parts = [_DEFAULT, name]
+        if tuple(parts) not in sources:
+            sources.append(tuple(parts))
+    return sources
+
+
+class QueryCache:
+    """
+    Caches query results, keyed by query text and parameters, until a document in one of the
+    collections the query reads from changes.
+
+        cache = QueryCache(db, ttl=60)
+        count = cache.execute("SELECT count(*) AS n FROM measures.temperatures")[0]["n"]
+
+    The collections are found from the FROM and JOIN clauses of N1QL queries; JSON queries must
+    name them with the `collections` parameter. Results are decoded from JSON, so blobs appear as
+    plain dicts. The returned rows are shared between callers, and must not be modified.
+
+    Read-your-writes is not guaranteed: entries are dropped by collection change notifications,
+    which Couchbase Lite may deliver asynchronously, so a query run right after a write can still
+    return the cached result from before it. A writer that needs to see its own changes should
+    call `invalidate` with the collection it wrote to.
+    """
+    def __init__(self, database, *, maxEntries =256, maxBytes =16 * 1024 * 1024, ttl =None):
+        """
+        :param database: The Database the queries run on.
+        :param maxEntries: The most results to keep; the least recently used are evicted beyond that.
+        :param maxBytes: The most JSON-encoded result bytes to keep.
+        :param ttl: If not None, seconds after which an entry expires even if nothing changed.
+        """
+        self.database = database
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()           # guards the cache state
+        self._queryLock = threading.Lock()      # serializes query execution (parameters are per Query)
+        self._entries = OrderedDict()           # key -> (rows, size, expires, sources)
+        self._size = 0
+        self._queries = OrderedDict()           # (text, language) -> compiled Query
+        self._watched = {}                      # (scope, name) -> (CBLCollection*, ListenerToken)
+        self._keysBySource = {}                 # (scope, name) -> set of keys
+        self._generations = {}                  # (scope, name) -> count of changes seen
+
+    def __repr__(self):
+        return "QueryCache[" + str(len(self._entries)) + " entries, " + str(self._size) + " bytes]"
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def byteSize(self):
+        return self._size
+
+    def execute(self, query, params =None, *, asArray =False, collections =None):
+        """
+        Returns the rows of a query as a list of dicts keyed by column name (or lists, if `asArray`
+        is true), from the cache when possible.
+
+        :param query: N1QL query text, or a Query object.
+        :param params: Optional dict of query parameters.
+        :param collections: The (scope, collection) names the query reads, if they can't be found from its text.
+        """
+        if isinstance(query, Query):
+            text = query.sourceCode
+            language = lib.kCBLN1QLLanguage if isinstance(query, N1QLQuery) else None
+        else:
+            text = query
+            language = lib.kCBLN1QLLanguage
+        key = (text, encodeJSON(params, sortKeys=True) if params else None, asArray)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry != None:
+                if entry[2] == None or entry[2] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+            self.misses += 1
+
+        if collections != None:
+            sources = [tuple(c) for c in collections]
+        elif language == lib.kCBLN1QLLanguage:
+            sources = queryCollections(text, self.database.name)
+        else:
+            sources = []
+        if not sources:
+            raise ValueError("Can't tell which collections the query reads; pass them as `collections`")
+        for source in sources:
+            self._watch(source)
+
+        with self._queryLock:
+            with self._lock:
+                generations = [self._generations[source] for source in sources]
+            compiled = query if isinstance(query, Query) else self._compiled(text)
+            if params:
+                compiled.setParameters(params)
+            encoded = list(compiled.execute_json(asArray))
+
+        size = sum(len(row) for row in encoded)
+        rows = [json.loads(row) for row in encoded]
+        with self._lock:
+            # Don't store the result if a collection changed while the query ran.
+            if generations == [self._generations[source] for source in sources] \
+                    and (self.maxBytes == None or size <= self.maxBytes):
+                if key in self._entries:
+                    self._remove(key)
+                expires = time.monotonic() + self.ttl if self.ttl != None else None
+                self._entries[key] = (rows, size, expires, sources)
+                self._size += size
+                for source in sources:
+                    self._keysBySource[source].add(key)
+                self._evict()
+        return rows
+
+    def invalidate(self, scope =None, collection =None):
+        """Drops the cached results that depend on a collection, or all of them if no collection is given."""
+        with self._lock:
+            if collection == None:
+                for source in self._generations:
+                    self._generations[source] += 1
+                keys = list(self._entries)
+            else:
+                source = (scope or _DEFAULT, collection)
+                if source in self._generations:
+                    self._generations[source] += 1
+                keys = list(self._keysBySource.get(source, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def close(self):
+        """Removes the collection listeners and empties the cache."""
+        with self._lock:
+            watched = list(self._watched.values())
+            self._watched.clear()
+            self._entries.clear()
+            self._keysBySource.clear()
+            self._size = 0
+            self._queries.clear()
+        for coll, token in watched:
+            token.remove()
+            lib.CBL_Release(coll)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _compiled(self, text):
+        query = self._queries.get(text)
+        if query == None:
+            query = N1QLQuery(self.database, text)
+            self._queries[text] = query
+            if len(self._queries) > self.maxEntries:
+                self._queries.popitem(last=False)
+        else:
+            self._queries.move_to_end(text)
+        return query
+
+    def _watch(self, source):
+        with self._lock:
+            if source in self._watched:
+                return
+        error = ffi.new("CBLError*")
+        coll = lib.CBLDatabase_Collection(self.database._ref, stringParam(source[1]), stringParam(source[0]), error)
+        if not coll:
+            raise CBLException("Couldn't find collection " + ".".join(source), error)
+        token = Collection.add_change_listener(coll, lambda docIDs: self._changed(source))
+        with self._lock:
+            if source not in self._watched:
+                self._watched[source] = (coll, token)
+                self._keysBySource[source] = set()
+                self._generations[source] = 0
+                return
+        token.remove()      # another thread got here first
+        lib.CBL_Release(coll)
+
+    def _changed(self, source):
+        self.invalidate(source[0], source[1])
+
+    def _remove(self, key):
+        rows, size, expires, sources = self._entries.pop(key)
+        self._size -= size
+        for source in sources:
+            keys = self._keysBySource.get(source)
+            if keys != None:
+                keys.discard(key)
+
+    def _evict(self):
+        while len(self._entries) > self.maxEntries or (self.maxBytes != None and self._size > self.maxBytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
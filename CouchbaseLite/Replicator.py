@@ -1,6 +1,5 @@
 from ._PyCBL import ffi, lib
 from .common import *
-import json
 
 #class ReplicatorStatus:
 #    def __init__(self, activity, progress, error)
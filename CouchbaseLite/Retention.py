@@ -0,0 +1,150 @@
+# Retention.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collection import Collection
+from .Query import N1QLQuery
+
+
+class RetentionPolicy:
+    """
+    A retention window for one collection: each document expires `window` after the time stored
+    in its `timestampField` property.
+    """
+    def __init__(self, collection, window, *, timestampField ="timestamp", timestampScale =1000):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param window: How long documents are kept: a timedelta, or a number of milliseconds.
+        :param timestampField: The document property holding the document's own timestamp. Documents without a numeric value there are left alone.
+        :param timestampScale: Multiplier converting that property to milliseconds. The default 1000 suits seconds since the epoch, i.e. `time.time()`.
+        """
+        if not isinstance(timestampField, str) or not timestampField.replace("_", "").isalnum():
+            raise ValueError("timestampField must be a plain property name")
+        self.collection = collection
+        if hasattr(window, "total_seconds"):
+            self.windowMs = int(window.total_seconds() * 1000)
+        else:
+            self.windowMs = int(window)
+        self.timestampField = timestampField
+        self.timestampScale = timestampScale
+        self._query = None
+
+    def __repr__(self):
+        return "RetentionPolicy[" + Collection.get_full_name(self.collection) + ", " + str(self.windowMs) + "ms]"
+
+    def _pendingQuery(self):
+        # Documents that don't have an expiration yet, with the expiration they should get.
+        if self._query == None:
+            field = "`" + self.timestampField + "`"
+            self._query = N1QLQuery(
+                lib.CBLCollection_Database(self.collection),
+                "SELECT meta().id, {f} * $scale + $window FROM {c} "
+                "WHERE meta().expiration IS NOT VALUED AND ISNUMBER({f}) LIMIT $limit"
+                    .format(f=field, c=Collection.get_full_name(self.collection)))
+        return self._query
+
+
+class RetentionSweeper:
+    """
+    Enforces RetentionPolicy windows by giving every document that lacks one an expiration time
+    of (its timestamp + the window). Couchbase Lite's own expiration purger then deletes the
+    documents once they expire; documents that are already past their window are purged almost
+    immediately. Documents that already have an expiration are not touched, so a sweep only
+    costs work proportional to the documents written since the previous one.
+
+    Call `sweep()` yourself, or `start()` a background thread that sweeps periodically.
+    """
+    def __init__(self, policies, *, interval =600.0, batchSize =1000):
+        """
+        :param policies: A list of RetentionPolicy.
+        :param interval: Seconds between sweeps of the background thread.
+        :param batchSize: Documents updated per transaction.
+        """
+        self.policies = list(policies)
+        self.interval = interval
+        self.batchSize = batchSize
+        self.lastError = None
+        self._sweepLock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        """Assigns expirations to all documents that need one. Returns the number of documents updated."""
+        with self._sweepLock:
+            total = 0
+            for policy in self.policies:
+                total += self._sweepPolicy(policy)
+            return total
+
+    def _sweepPolicy(self, policy):
+        error = ffi.new("CBLError*")
+        query = policy._pendingQuery()
+        total = 0
+        while True:
+            query.setParameters({"scale": policy.timestampScale, "window": policy.windowMs,
+                                 "limit": self.batchSize})
+            # stream() has its own error buffer; execute() uses the shared one, unsafe off the main thread.
+            batch = [(row[0], row[1]) for row in query.stream(asArray=True)]
+            if not batch:
+                return total
+            with Collection._transaction(policy.collection):
+                for docID, expiration in batch:
+                    # An expiration must be nonzero, and one in the past means "purge now".
+                    timestamp = max(int(expiration), 1)
+                    if not lib.CBLCollection_SetDocumentExpiration(policy.collection, stringParam(docID),
+                                                                   timestamp, error):
+                        raise CBLException("Couldn't set the expiration of " + docID, error)
+            total += len(batch)
+            if len(batch) < self.batchSize:
+                return total
+
+    def start(self):
+        if self._thread != None:
+            return
+        for policy in self.policies:
+            policy._pendingQuery()      # compiled here, since compiling uses the shared error buffer
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name="CBL retention sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout =None):
+        if self._thread == None:
+            return
+        self._stopEvent.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+                self.lastError = None
+            except Exception as x:     # anything escaping would silently end the thread
+                self.lastError = x
+                print ("WARNING: RetentionSweeper.sweep() failed: " + str(x))
+            if self._stopEvent.wait(self.interval):
+                return
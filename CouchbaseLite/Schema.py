@@ -0,0 +1,223 @@
+# Schema.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import contextlib
+import dataclasses
+import threading
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collections import decodeFleeceValue, setFleeceSlot
+from .Collection import Collection
+from .KeyPath import _fleeceRoot
+
+_NO_DEFAULT = object()
+
+# CBLPy_DictGetMany (see CBLForPython_Extras.c) looks up all the keys of a record in one call.
+_dictGetMany = getattr(lib, "CBLPy_DictGetMany", None)
+
+
+class Schema:
+    """
+    Maps documents to typed records: a dataclass, a NamedTuple, or a record type generated from a
+    list of field names. Each declared field is read straight from the document's Fleece data with
+    a precomputed key, and the record is constructed in one call; undeclared properties are never
+    looked at. Writing goes the other way, from record fields to Fleece, without a dict in between.
+
+        @dataclass(slots=True)
+        class Reading:
+            sensor: int
+            temperature: float
+            timestamp: float = 0.0
+
+        readings = Schema(Reading)
+        r = readings.load(coll, "sensor::1::...")
+        readings.save(coll, "sensor::1::...", r)
+
+    Missing properties take the field's default, or None if it has none.
+    """
+    def __init__(self, recordType, *, keys =None):
+        """
+        :param recordType: A dataclass or NamedTuple class; or a list of field names, for which a NamedTuple called "Record" is generated.
+        :param keys: Optional dict mapping field names to document property names, where they differ.
+        """
+        if isinstance(recordType, (list, tuple)):
+            recordType = collections.namedtuple("Record", recordType)
+        if dataclasses.is_dataclass(recordType):
+            fields = [(f.name, f.default if f.default is not dataclasses.MISSING
+                               else f.default_factory if f.default_factory is not dataclasses.MISSING
+                               else _NO_DEFAULT, f.default_factory is not dataclasses.MISSING)
+                      for f in dataclasses.fields(recordType) if f.init]
+        elif isinstance(recordType, type) and issubclass(recordType, tuple) and hasattr(recordType, "_fields"):
+            defaults = getattr(recordType, "_field_defaults", {})
+            fields = [(name, defaults.get(name, _NO_DEFAULT), False) for name in recordType._fields]
+        else:
+            raise TypeError("Schema needs a dataclass, a NamedTuple, or a list of field names")
+        keys = keys or {}
+        kwOnly = set()
+        if dataclasses.is_dataclass(recordType):
+            kwOnly = {f.name for f in dataclasses.fields(recordType) if f.init and getattr(f, "kw_only", False)}
+        self.recordType = recordType
+        self.fieldNames = [name for name, default, factory in fields]
+        self.propertyNames = [keys.get(name, name) for name in self.fieldNames]
+        self._defaults = [(default, factory) for name, default, factory in fields]
+        self._keyStrings = [ffi.from_buffer(name.encode("utf-8")) for name in self.propertyNames]
+        self._keys = threading.local()      # FLDictKeys cache lookups internally, so each thread has its own
+        self._positional = len(self.fieldNames) - len(kwOnly)
+        if any(name in kwOnly for name in self.fieldNames[:self._positional]):
+            self._positional = 0        # keyword-only fields come first; pass everything by name
+
+    def __repr__(self):
+        return "Schema[" + self.recordType.__name__ + "]"
+
+    def _dictKeys(self, root):
+        # Returns this thread's FLDictKey array, ready for looking up keys in 'root', and an FLValue
+        # array for the looked-up values. An FLDictKey remembers the shared keys of the first dict
+        # it's used with, so the keys are re-initialized when 'root' is from another database.
+        state = self._keys
+        keys = getattr(state, "keys", None)
+        if keys == None:
+            keys = state.keys = ffi.new("FLDictKey[]", len(self._keyStrings))
+            state.values = ffi.new("FLValue[]", len(self._keyStrings))
+            state.doc = None
+            state.sharedKeys = ffi.NULL
+        doc = lib.FLValue_FindDoc(ffi.cast("FLValue", root)) if root else ffi.NULL
+        sharedKeys = lib.FLDoc_GetSharedKeys(doc) if doc else ffi.NULL
+        if not sharedKeys or sharedKeys != state.sharedKeys:
+            for i, buffer in enumerate(self._keyStrings):
+                keys[i] = lib.FLDictKey_Init([buffer, len(buffer)])
+            if state.doc != None:
+                lib.FLDoc_Release(state.doc)
+            # Holding on to the doc keeps its shared keys alive, so their address can't be reused.
+            state.doc = doc if doc else None
+            state.sharedKeys = sharedKeys
+        elif doc:
+            lib.FLDoc_Release(doc)
+        return keys, state.values
+
+    def decode(self, source):
+        """
+        Returns a record with the fields of a document.
+
+        :param source: A Document, a QueryResult (row), a CBLDocument pointer, or a Fleece dict.
+        """
+        root = ffi.cast("FLDict", _fleeceRoot(source))
+        keys, found = self._dictKeys(root)
+        if _dictGetMany != None:
+            _dictGetMany(root, keys, len(self._defaults), found)
+        else:
+            for i in range(len(self._defaults)):
+                found[i] = lib.FLDict_GetWithKey(root, keys + i) if root else ffi.NULL
+        values = []
+        for value, (default, factory) in zip(found, self._defaults):
+            if value:
+                values.append(decodeFleeceValue(value))
+            elif default is _NO_DEFAULT:
+                values.append(None)
+            else:
+                values.append(default() if factory else default)
+        if self._positional == len(values):
+            return self.recordType(*values)
+        n = self._positional
+        return self.recordType(*values[:n], **dict(zip(self.fieldNames[n:], values[n:])))
+
+    def encode(self, record, properties =None):
+        """
+        Writes a record's fields into a Fleece mutable dict, and returns it. If 'properties' is None
+        a new FLMutableDict is created, which the caller must release with FLValue_Release.
+        """
+        if properties == None:
+            properties = lib.FLMutableDict_New()
+        for fieldName, buffer in zip(self.fieldNames, self._keyStrings):
+            setFleeceSlot(lib.FLMutableDict_Set(properties, [buffer, len(buffer)]), getattr(record, fieldName))
+        return properties
+
+    def load(self, collection, docID):
+        """Reads a document from a collection as a record, or returns None if it doesn't exist."""
+        error = ffi.new("CBLError*")
+        doc = lib.CBLCollection_GetDocument(collection, stringParam(docID), error)
+        if not doc:
+            if error.code != 0:
+                raise CBLException("Couldn't get document " + docID, error)
+            return None
+        try:
+            return self.decode(doc)
+        finally:
+            lib.CBL_Release(doc)
+
+    def loadMany(self, collection, docIDs, *, consistent =False):
+        """
+        Returns a dict mapping each of 'docIDs' to its record, or None for missing documents. If
+        'consistent' is true the documents are read in one transaction, as by Collection.get_documents.
+        """
+        idSlice = SliceBuffer()
+        error = ffi.new("CBLError*")
+        records = {}
+        with Collection._transaction(collection) if consistent else contextlib.nullcontext():
+            for docID in docIDs:
+                doc = lib.CBLCollection_GetDocument(collection, idSlice.set(docID), error)
+                if not doc:
+                    if error.code != 0:
+                        raise CBLException("Couldn't get document " + docID, error)
+                    records[docID] = None
+                    continue
+                try:
+                    records[docID] = self.decode(doc)
+                finally:
+                    lib.CBL_Release(doc)
+        return records
+
+    def save(self, collection, docID, record, *, replace =True):
+        """
+        Saves a record as document 'docID'. If 'replace' is true the document's body becomes just the
+        record's fields; otherwise the fields are written over the existing document's properties.
+        """
+        error = ffi.new("CBLError*")
+        doc = ffi.NULL if replace else lib.CBLCollection_GetMutableDocument(collection, stringParam(docID), error)
+        if not doc:
+            if error.code != 0:
+                raise CBLException("Couldn't get document " + docID, error)
+            doc = lib.CBLDocument_CreateWithID(stringParam(docID))
+            props = self.encode(record)
+            lib.CBLDocument_SetProperties(doc, props)
+            lib.FLValue_Release(ffi.cast("FLValue", props))
+        else:
+            self.encode(record, lib.CBLDocument_MutableProperties(doc))
+        try:
+            if not lib.CBLCollection_SaveDocument(collection, doc, error):
+                raise CBLException("Couldn't save document " + docID, error)
+        finally:
+            lib.CBL_Release(doc)
+
+
+_registry = {}
+_registryLock = threading.Lock()
+
+
+def registerSchema(collection, recordType, *, keys =None):
+    """Creates a Schema for 'recordType' and registers it as the one for 'collection'. Returns the Schema."""
+    schema = recordType if isinstance(recordType, Schema) else Schema(recordType, keys=keys)
+    with _registryLock:
+        _registry[Collection.get_full_name(collection)] = schema
+    return schema
+
+
+def schemaFor(collection):
+    """Returns the Schema registered for 'collection', or None."""
+    with _registryLock:
+        return _registry.get(Collection.get_full_name(collection))
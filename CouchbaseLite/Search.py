@@ -0,0 +1,228 @@
+# Search.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import threading
+
+from ._PyCBL import lib
+from .common import *
+from .Collection import Collection
+from .Query import N1QLQuery
+
+_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SUFFIXES = ("ing", "ed", "es", "ly", "s", "e", "y")
+
+
+def _identifier(name, what):
+    if not isinstance(name, str) or not name.replace("_", "").isalnum():
+        raise ValueError(what + " must be a plain name: " + repr(name))
+    return name
+
+
+def _propertyPath(path):
+    return ".".join("`" + _identifier(part, "Field names") + "`" for part in path.split("."))
+
+
+def _stem(word):
+    # A crude English stemmer, close enough to the index's to find the words that matched.
+    word = word.lower()
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _termStems(terms):
+    return {_stem(word.rstrip("*")) for word in _WORD.findall(terms) if word not in _OPERATORS}
+
+
+def matchOffsets(text, terms):
+    """
+    Returns the (start, end) character ranges of the words in 'text' that match the full-text
+    search 'terms' (a query string, or a set of stems from a previous call.) Matching is by prefix
+    of a rough English stem, like the index's stemming, so it can differ from what the index
+    matched in edge cases.
+    """
+    stems = _termStems(terms) if isinstance(terms, str) else terms
+    return [(m.start(), m.end()) for m in _WORD.finditer(text)
+            if any(m.group().lower().startswith(stem) for stem in stems)]
+
+
+def makeSnippet(text, offsets, *, length =120, highlight =("[", "]"), ellipsis ="…"):
+    """Returns an excerpt of 'text' around its first matches, with each match wrapped in 'highlight'."""
+    if not offsets:
+        return text[:length] + (ellipsis if len(text) > length else "")
+    start = max(0, offsets[0][0] - length // 4)
+    if start > 0:
+        space = text.find(" ", start, offsets[0][0])      # don't start in the middle of a word
+        start = space + 1 if space >= 0 else start
+    end = min(len(text), start + length)
+    pieces = [ellipsis] if start > 0 else []
+    pos = start
+    for s, e in offsets:
+        if s >= end:
+            break
+        if s < pos:
+            continue
+        pieces += [text[pos:s], highlight[0], text[s:e], highlight[1]]
+        pos = e
+    pieces.append(text[pos:max(pos, end)])
+    if end < len(text):
+        pieces.append(ellipsis)
+    return "".join(pieces)
+
+
+class SearchHit:
+    """One document found by a full-text search."""
+    __slots__ = ("id", "rank", "fields", "snippets", "offsets")
+
+    def __init__(self, id, rank, fields, snippets =None, offsets =None):
+        self.id = id
+        self.rank = rank
+        self.fields = fields        # dict of the requested fields
+        self.snippets = snippets    # dict of field -> excerpt, if snippets were requested
+        self.offsets = offsets      # dict of field -> [(start, end), ...], if snippets were requested
+
+    def __repr__(self):
+        return "SearchHit[" + self.id + ", rank=" + str(self.rank) + "]"
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+
+class SearchPage:
+    """A page of search hits, in descending rank order. Pass `cursor` to get the next page."""
+    __slots__ = ("hits", "cursor")
+
+    def __init__(self, hits, cursor):
+        self.hits = hits
+        self.cursor = cursor        # None if this is the last page
+
+    def __repr__(self):
+        return "SearchPage[" + str(len(self.hits)) + " hits" + (", more]" if self.cursor else "]")
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def __getitem__(self, i):
+        return self.hits[i]
+
+
+class FullTextSearch:
+    """
+    Searches a collection's full-text index, returning ranked pages of hits.
+
+        logs = FullTextSearch(coll, "messageIndex", fields=["message", "level", "timestamp"])
+        page = logs.search("disk AND full", limit=50, snippets=["message"])
+        for hit in page:
+            print(hit.rank, hit["timestamp"], hit.snippets["message"])
+        more = logs.search("disk AND full", limit=50, cursor=page.cursor)
+
+    Pages after the first continue from the last hit's rank and document ID (a keyset) instead of
+    skipping over the earlier hits with OFFSET, so only the rows of the page itself are returned
+    and decoded. The query engine still matches, ranks and sorts every hit for each page, so a
+    page costs about as much to find as the first one; keyset paging saves the decoding of the
+    skipped rows, not the search. Only the requested fields are read from each document. The
+    compiled queries are kept for reuse, so keep one FullTextSearch per index rather than
+    creating one per search.
+    """
+    def __init__(self, collection, index, *, fields =()):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param index: The name of a full-text index on the collection.
+        :param fields: The properties (or dotted key paths) to return with each hit.
+        """
+        self.collection = collection
+        self.index = _identifier(index, "Index names")
+        self.fields = list(fields)
+        select = ["META().id", "RANK({})".format(self.index)] + [_propertyPath(f) for f in self.fields]
+        self._select = ", ".join(select)
+        self._from = Collection.get_full_name(collection)
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "FullTextSearch[" + self._from + "." + self.index + "]"
+
+    def search(self, terms, *, limit =20, offset =0, cursor =None, snippets =None,
+               snippetLength =120, highlight =("[", "]")):
+        """
+        Returns a SearchPage with up to 'limit' hits for 'terms', a full-text query string that may
+        use the index's operators (AND, OR, NOT, "phrases", prefix*).
+
+        :param offset: Hits to skip, after the cursor if there is one. Prefer cursors for deep pages.
+        :param cursor: The `cursor` of the previous page, to continue after it.
+        :param snippets: Field names to make snippets of: an excerpt of each field around its matches, and the offsets of the matches.
+        """
+        if not isinstance(terms, str) or not terms.strip():
+            raise ValueError("Search terms must be a non-empty string")
+        after = None
+        if cursor != None:
+            state = decodeCursor("search", cursor)
+            if state.get("index") != self.index or state.get("terms") != terms:
+                raise ValueError("The cursor is from a different search")
+            after = (state["rank"], state["id"])
+        params = {"terms": terms, "limit": limit + 1, "offset": offset}
+        if after != None:
+            params["rank"], params["id"] = after
+
+        with self._lock:
+            query = self._query(after != None)
+            query.setParameters(params)
+            rows = list(query.stream(asArray=True))
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        stems = _termStems(terms) if snippets else None
+        hits = []
+        for row in rows:
+            fields = dict(zip(self.fields, row[2:]))
+            hit = SearchHit(row[0], row[1], fields)
+            if snippets:
+                hit.snippets = {}
+                hit.offsets = {}
+                for name in snippets:
+                    text = fields.get(name)
+                    if isinstance(text, str):
+                        offsets = matchOffsets(text, stems)
+                        hit.offsets[name] = offsets
+                        hit.snippets[name] = makeSnippet(text, offsets, length=snippetLength, highlight=highlight)
+            hits.append(hit)
+
+        nextCursor = None
+        if more:
+            last = hits[-1]
+            nextCursor = encodeCursor("search", {"index": self.index, "terms": terms,
+                                                 "rank": last.rank, "id": last.id})
+        return SearchPage(hits, nextCursor)
+
+    def _query(self, keyset):
+        query = self._queries.get(keyset)
+        if query == None:
+            rank = "RANK({})".format(self.index)
+            where = "MATCH({}, $terms)".format(self.index)
+            if keyset:
+                where += " AND ({r} < $rank OR ({r} = $rank AND META().id > $id))".format(r=rank)
+            text = "SELECT {} FROM {} WHERE {} ORDER BY {} DESC, META().id LIMIT $limit OFFSET $offset".format(
+                self._select, self._from, where, rank)
+            query = N1QLQuery(lib.CBLCollection_Database(self.collection), text)
+            self._queries[keyset] = query
+        return query
@@ -0,0 +1,218 @@
+# Stats.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+from collections import deque
+
+from ._PyCBL import ffi, lib
+from .common import *
+from .Collection import Collection
+from .Maintenance import databaseSize
+from .Query import N1QLQuery
+
+
+def _names(mutableArray):
+    try:
+        return Collection.FL_array_to_string_array(mutableArray)
+    finally:
+        lib.FLMutableArray_Release(mutableArray)
+
+
+def _totalDocumentCount(db):
+    # The documents in every collection of the database, which share its files.
+    error = ffi.new("CBLError*")
+    scopes = lib.CBLDatabase_ScopeNames(db, error)
+    if not scopes:
+        raise CBLException("Couldn't get scope names", error)
+    total = 0
+    for scope in _names(scopes):
+        collections = lib.CBLDatabase_CollectionNames(db, stringParam(scope), error)
+        if not collections:
+            raise CBLException("Couldn't get collection names", error)
+        for name in _names(collections):
+            collection = lib.CBLDatabase_Collection(db, stringParam(name), stringParam(scope), error)
+            if collection:
+                total += lib.CBLCollection_Count(collection)
+                lib.CBL_Release(collection)
+    return total
+
+
+class CollectionStats:
+    """
+    Statistics of one collection, cached so that dashboards and health checks can poll them as
+    often as they like.
+
+        stats = CollectionStats(coll)
+        ...
+        print(stats.count, stats.changesPerSecond)
+        publish(stats.snapshot())
+
+    A change listener counts the collection's changes as they happen. The values that need a
+    call into Couchbase Lite -- the document count, last sequence and size -- are only read
+    again once there have been changes since they were last read, and at most once per `maxAge`
+    seconds; reading them in between just returns the cached values. The index list isn't
+    affected by document changes, so it's re-read every `maxAge` seconds.
+    """
+    def __init__(self, collection, *, maxAge =5.0, rateWindow =60.0, listen =True):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param maxAge: The minimum number of seconds between reads of the same value.
+        :param rateWindow: The number of seconds of recent changes that `changesPerSecond` averages over.
+        :param listen: If false, no change listener is registered and every value is re-read when older than `maxAge`.
+        """
+        self.collection = collection
+        self.name = Collection.get_full_name(collection)
+        self.maxAge = maxAge
+        self.rateWindow = rateWindow
+        self.changes = 0            # document changes seen since this object was created
+        self.lastChange = None      # time.time() of the last change seen
+        self._db = lib.CBLCollection_Database(collection)
+        self._path = sliceResultToString(lib.CBLDatabase_Path(self._db))
+        self._lock = threading.Lock()
+        self._cache = {}            # name -> (value, monotonic time read, self.changes when read)
+        self._buckets = deque()     # [second, changes], for the recent change rate
+        self._lastChangedID = None
+        self._sequenceQuery = None
+        self._started = time.monotonic()
+        self._listenerToken = Collection.add_change_listener(collection, self._noteChanges) if listen else None
+
+    def __repr__(self):
+        return "CollectionStats[" + self.name + "]"
+
+    def close(self):
+        """Removes the change listener. The values are re-read when older than `maxAge` from then on."""
+        if self._listenerToken != None:
+            self._listenerToken.remove()
+            self._listenerToken = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def refresh(self):
+        """Forgets the cached values, so each is read again the next time it's asked for."""
+        with self._lock:
+            self._cache.clear()
+
+    @property
+    def count(self):
+        """The number of documents in the collection."""
+        return self._get("count", lambda: lib.CBLCollection_Count(self.collection))
+
+    @property
+    def indexNames(self):
+        """The names of the collection's indexes."""
+        return list(self._get("indexes", lambda: Collection.get_index_names(self.collection), False))
+
+    @property
+    def lastSequence(self):
+        """The sequence number of the collection's latest change to a document that still exists."""
+        return self._get("sequence", self._readLastSequence)
+
+    @property
+    def databaseBytes(self):
+        """The size of the database's files, which all its collections share."""
+        return self._get("size", self._readSize)[0]
+
+    @property
+    def approximateBytes(self):
+        """The collection's share of the database's files, in proportion to its number of documents."""
+        return self._get("size", self._readSize)[1]
+
+    @property
+    def changesPerSecond(self):
+        """The average rate of document changes over the last `rateWindow` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            recent = sum(n for _, n in self._buckets)
+        return recent / max(1.0, min(self.rateWindow, now - self._started))
+
+    def snapshot(self):
+        """Returns all the statistics as a dict, e.g. to publish as JSON."""
+        return {
+            "collection":       self.name,
+            "count":            self.count,
+            "indexes":          self.indexNames,
+            "lastSequence":     self.lastSequence,
+            "databaseBytes":    self.databaseBytes,
+            "approximateBytes": self.approximateBytes,
+            "changes":          self.changes,
+            "changesPerSecond": self.changesPerSecond,
+            "lastChange":       self.lastChange,
+        }
+
+    def _noteChanges(self, docIDs):
+        # Called on Couchbase Lite's notification thread, so it only does bookkeeping.
+        second = int(time.monotonic())
+        with self._lock:
+            self.changes += len(docIDs)
+            self.lastChange = time.time()
+            if docIDs:
+                self._lastChangedID = docIDs[-1]
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += len(docIDs)
+            else:
+                self._buckets.append([second, len(docIDs)])
+                self._prune(second)
+
+    def _prune(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.rateWindow:
+            self._buckets.popleft()
+
+    def _get(self, name, read, followsChanges =True):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached != None:
+                value, readAt, changes = cached
+                if now - readAt < self.maxAge:
+                    return value
+                if followsChanges and self._listenerToken != None and changes == self.changes:
+                    return value
+            changes = self.changes
+        value = read()      # without the lock, which the notification thread may be waiting for
+        with self._lock:
+            self._cache[name] = (value, now, changes)
+        return value
+
+    def _readLastSequence(self):
+        with self._lock:
+            docID = self._lastChangedID
+            cached = self._cache.get("sequence")
+        if docID != None and cached != None:
+            # The latest change is usually to a document that still exists; reading its sequence
+            # is much cheaper than the query.
+            doc = lib.CBLCollection_GetDocument(self.collection, stringParam(docID), ffi.NULL)
+            if doc:
+                try:
+                    return max(cached[0], lib.CBLDocument_Sequence(doc))
+                finally:
+                    lib.CBL_Release(doc)
+        if self._sequenceQuery == None:
+            self._sequenceQuery = N1QLQuery(self._db, "SELECT MAX(META().sequence) FROM " + self.name)
+        for row in self._sequenceQuery.stream(asArray=True):
+            return row[0] or 0
+        return 0
+
+    def _readSize(self):
+        fileBytes = databaseSize(self._path)
+        total = _totalDocumentCount(self._db)
+        return fileBytes, (fileBytes * self.count // total) if total else 0
@@ -0,0 +1,178 @@
+# Streaming.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Memory-bounded helpers for processing query results that don't fit in memory, such as the rows
+# yielded by `Query.stream`. Rows are buffered up to a byte limit, then sorted and spilled to
+# temporary files, which are merged back as the results are read.
+
+import heapq
+import itertools
+import pickle
+import sys
+import tempfile
+from operator import itemgetter
+
+
+def peakRSS():
+    """The peak resident set size of this process so far, in bytes, or None if it can't be measured."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # Linux reports kilobytes
+
+
+class SpillStats:
+    """Statistics of an ExternalSorter: how much it buffered and spilled, and the process's peak RSS."""
+    __slots__ = ("rows", "runs", "bytesSpilled", "peakBufferBytes", "peakRSS")
+
+    def __init__(self):
+        self.rows = 0
+        self.runs = 0
+        self.bytesSpilled = 0
+        self.peakBufferBytes = 0
+        self.peakRSS = None
+
+    def __repr__(self):
+        r = "SpillStats[" + str(self.rows) + " rows, " + str(self.runs) + " runs, " \
+            + str(self.bytesSpilled) + " bytes spilled"
+        if self.peakRSS != None:
+            r += ", peak RSS " + str(self.peakRSS // (1024 * 1024)) + "MB"
+        return r + "]"
+
+
+class ExternalSorter:
+    """
+    Sorts an arbitrary number of rows using a bounded amount of memory.
+
+        with ExternalSorter(key=lambda row: row["timestamp"], memoryLimit=32 << 20) as sorter:
+            sorter.extend(query.stream(["timestamp", "value"]))
+            for row in sorter:
+                ...
+
+    Rows are stored pickled, so they must be picklable; the pickled size is what counts towards
+    `memoryLimit`. Once the buffered rows exceed it they are sorted and written to a temporary
+    file. Iterating merges those files, holding only one row per file in memory. The sort is stable.
+    """
+    def __init__(self, key =None, *, reverse =False, memoryLimit =64 * 1024 * 1024, tmpdir =None):
+        """
+        :param key: Function returning a row's sort key; defaults to the row itself.
+        :param reverse: If true, sort in descending order.
+        :param memoryLimit: The most bytes of pickled rows to hold before spilling to disk.
+        :param tmpdir: Directory for the temporary files; defaults to the system's.
+        """
+        self.key = key
+        self.reverse = reverse
+        self.memoryLimit = memoryLimit
+        self.tmpdir = tmpdir
+        self.stats = SpillStats()
+        self._buffer = []               # (key, pickled row)
+        self._bufferBytes = 0
+        self._runs = []                 # temporary files, each holding one sorted run
+        self._iterated = False
+
+    def __repr__(self):
+        return "ExternalSorter[" + repr(self.stats) + "]"
+
+    def add(self, row):
+        if self._iterated:
+            raise RuntimeError("Can't add rows to an ExternalSorter after iterating it")
+        data = pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+        self._buffer.append((self.key(row) if self.key else row, data))
+        self._bufferBytes += len(data)
+        self.stats.rows += 1
+        if self._bufferBytes > self.stats.peakBufferBytes:
+            self.stats.peakBufferBytes = self._bufferBytes
+        if self._bufferBytes > self.memoryLimit:
+            self._spill()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def __iter__(self):
+        """Yields the rows in sorted order. An ExternalSorter can only be iterated once."""
+        if self._iterated:
+            raise RuntimeError("An ExternalSorter can only be iterated once")
+        self._iterated = True
+        self._buffer.sort(key=itemgetter(0), reverse=self.reverse)
+        buffered = (pickle.loads(data) for key, data in self._buffer)
+        try:
+            if not self._runs:
+                yield from buffered
+            else:
+                runs = [_readRun(f) for f in self._runs] + [buffered]
+                yield from heapq.merge(*runs, key=self.key, reverse=self.reverse)
+        finally:
+            self.stats.peakRSS = peakRSS()
+            self.close()
+
+    def close(self):
+        """Deletes the temporary files. Called automatically once iteration finishes."""
+        for f in self._runs:
+            f.close()
+        self._runs = []
+        self._buffer = []
+        self._bufferBytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _spill(self):
+        self._buffer.sort(key=itemgetter(0), reverse=self.reverse)
+        f = tempfile.TemporaryFile(dir=self.tmpdir)
+        for key, data in self._buffer:
+            f.write(data)
+            self.stats.bytesSpilled += len(data)
+        f.seek(0)
+        self._runs.append(f)
+        self.stats.runs += 1
+        self._buffer = []
+        self._bufferBytes = 0
+
+
+def _readRun(f):
+    unpickler = pickle.Unpickler(f)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+def sortedRows(rows, key =None, *, reverse =False, memoryLimit =64 * 1024 * 1024, tmpdir =None, stats =None):
+    """
+    Returns a Generator of 'rows' in sorted order, spilling to disk beyond 'memoryLimit' bytes.
+    Pass a SpillStats as 'stats' to have it filled in.
+    """
+    sorter = ExternalSorter(key, reverse=reverse, memoryLimit=memoryLimit, tmpdir=tmpdir)
+    if stats != None:
+        sorter.stats = stats
+    sorter.extend(rows)
+    yield from sorter
+
+
+def groupedRows(rows, key, *, memoryLimit =64 * 1024 * 1024, tmpdir =None, stats =None):
+    """
+    Groups 'rows' by 'key', sorting them externally first. Yields (key, iterator of rows) pairs,
+    like itertools.groupby; each iterator must be consumed before advancing to the next group.
+    """
+    return itertools.groupby(sortedRows(rows, key, memoryLimit=memoryLimit, tmpdir=tmpdir, stats=stats), key)
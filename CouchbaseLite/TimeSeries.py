@@ -0,0 +1,339 @@
+# TimeSeries.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Helpers for collections of per-sensor measurements: documents with a sensor ID, a numeric
+# timestamp and a numeric value, like the ones in sensor/src/Main.py.
+
+import threading
+from collections import deque
+
+from ._PyCBL import lib
+from .Collection import Collection
+from .Query import N1QLQuery
+
+_AGGREGATES = {"min": "MIN", "max": "MAX", "avg": "AVG", "sum": "SUM", "count": "COUNT"}
+
+
+def _field(name):
+    if not isinstance(name, str) or not name.replace("_", "").isalnum():
+        raise ValueError("Field names must be plain property names: " + repr(name))
+    return "`" + name + "`"
+
+
+def toArrays(rows, columns):
+    """
+    Converts rows (lists of column values, as `Query.stream(asArray=True)` yields) into a dict of
+    column name -> NumPy array. Columns are float64, except "sensor", whose type NumPy infers.
+    Without NumPy installed, the arrays are plain lists.
+    """
+    rows = list(rows)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    result = {}
+    for i, name in enumerate(columns):
+        column = [row[i] for row in rows]
+        if numpy != None:
+            column = numpy.array(column, dtype=None if name == "sensor" else numpy.float64)
+        result[name] = column
+    return result
+
+
+class TimeSeries:
+    """
+    Aggregating queries over a collection of time-stamped sensor readings. The grouping and range
+    filtering run in the query engine; only the aggregated rows are decoded.
+
+        temps = TimeSeries(coll, valueField="temperature")
+        hourly = temps.downsample(3600, start=time.time() - 86400, asArrays=True)
+        plot(hourly["bucket"], hourly["avg"])
+    """
+    def __init__(self, collection, *, valueField ="value", timestampField ="timestamp", sensorField ="sensor"):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param valueField: The property holding each reading's numeric value.
+        :param timestampField: The property holding each reading's numeric timestamp.
+        :param sensorField: The property identifying the sensor.
+        """
+        self.collection = collection
+        self.valueField = valueField
+        self.timestampField = timestampField
+        self.sensorField = sensorField
+        self._fields = {"v": _field(valueField), "t": _field(timestampField), "s": _field(sensorField),
+                        "c": Collection.get_full_name(collection)}
+        self._queries = {}          # query text -> (N1QLQuery, lock held while it's parameterized and run)
+        self._queriesLock = threading.Lock()
+
+    def __repr__(self):
+        return "TimeSeries[" + self._fields["c"] + "." + self.valueField + "]"
+
+    def downsample(self, bucket, start =None, end =None, *, sensor =None,
+                   aggregates =("min", "max", "avg", "count"), asArrays =False):
+        """
+        Aggregates the readings in [start, end) into buckets of 'bucket' timestamp units, per sensor.
+        Returns a list of dicts with keys "sensor", "bucket" (the bucket's start) and the aggregate
+        names, ordered by sensor and bucket; or, if 'asArrays' is true, a dict of arrays (see toArrays.)
+        """
+        for name in aggregates:
+            if name not in _AGGREGATES:
+                raise ValueError("Unknown aggregate " + repr(name))
+        columns = ["sensor", "bucket"] + list(aggregates)
+        select = "{s} AS sensor, FLOOR({t} / $bucket) * $bucket AS bucket, " \
+                 + ", ".join(_AGGREGATES[name] + "({v}) AS `" + name + "`" for name in aggregates)
+        query = self._query(select, start, end, sensor, "GROUP BY {s}, FLOOR({t} / $bucket) ORDER BY sensor, bucket")
+        params = self._params(start, end, sensor)
+        params["bucket"] = bucket
+        return self._run(query, params, columns, asArrays)
+
+    def window(self, start =None, end =None, *, sensor =None, asArrays =False):
+        """Returns the raw readings in [start, end), as rows with "sensor", "timestamp" and "value", ordered by time."""
+        columns = ["sensor", "timestamp", "value"]
+        query = self._query("{s} AS sensor, {t} AS timestamp, {v} AS `value`", start, end, sensor,
+                            "ORDER BY {t}")
+        return self._run(query, self._params(start, end, sensor), columns, asArrays)
+
+    def _query(self, select, start, end, sensor, suffix):
+        where = ["ISNUMBER({v})", "ISNUMBER({t})"]
+        if start != None:
+            where.append("{t} >= $start")
+        if end != None:
+            where.append("{t} < $end")
+        if sensor != None:
+            where.append("{s} = $sensor")
+        text = ("SELECT " + select + " FROM {c} WHERE " + " AND ".join(where) + " " + suffix).format(**self._fields)
+        with self._queriesLock:
+            entry = self._queries.get(text)
+            if entry == None:
+                entry = (N1QLQuery(lib.CBLCollection_Database(self.collection), text), threading.Lock())
+                self._queries[text] = entry
+        return entry
+
+    def _params(self, start, end, sensor):
+        params = {}
+        if start != None:
+            params["start"] = start
+        if end != None:
+            params["end"] = end
+        if sensor != None:
+            params["sensor"] = sensor
+        return params
+
+    def _run(self, entry, params, columns, asArrays):
+        # The parameters are set on the shared query object, so other threads using the same
+        # query have to wait until its rows have been read.
+        query, lock = entry
+        with lock:
+            if params:
+                query.setParameters(params)
+            rows = query.stream(asArray=True)
+            if asArrays:
+                return toArrays(rows, columns)
+            return [dict(zip(columns, row)) for row in rows]
+
+
+class SensorAggregate:
+    """The aggregates of one sensor's readings, as kept by RollingAggregates."""
+    __slots__ = ("sensor", "count", "min", "max", "mean", "last", "lastTimestamp")
+
+    def __init__(self, sensor, count, min, max, mean, last, lastTimestamp):
+        self.sensor = sensor
+        self.count = count
+        self.min = min
+        self.max = max
+        self.mean = mean
+        self.last = last
+        self.lastTimestamp = lastTimestamp
+
+    def __repr__(self):
+        return "SensorAggregate[{}: n={} min={} max={} mean={} last={}]".format(
+            self.sensor, self.count, self.min, self.max, self.mean, self.last)
+
+
+class _Rolling:
+    # Per-sensor state. With a window, the readings inside it are kept in a deque in timestamp
+    # order, along with monotonic deques of candidate minimums/maximums, so that each reading is
+    # added and expired in amortized O(1). Change notifications and document batches don't
+    # guarantee timestamp order, so a reading older than the newest one is inserted in its place
+    # and the candidate deques are rebuilt, which takes time proportional to the window.
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.lastTimestamp = None
+        if window != None:
+            self.readings = deque()
+            self.mins = deque()
+            self.maxes = deque()
+
+    def add(self, timestamp, value):
+        if self.lastTimestamp == None or timestamp >= self.lastTimestamp:
+            self.last = value
+            self.lastTimestamp = timestamp
+        if self.window == None:
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min == None else min(self.min, value)
+            self.max = value if self.max == None else max(self.max, value)
+            return
+        if timestamp < self.lastTimestamp - self.window:
+            return      # arrived after it already fell out of the window
+        reading = (timestamp, value)
+        self.count += 1
+        self.sum += value
+        if not self.readings or self.readings[-1][0] <= timestamp:
+            self.readings.append(reading)
+            self._push(reading)
+        else:
+            i = len(self.readings)
+            while i > 0 and self.readings[i - 1][0] > timestamp:
+                i -= 1
+            self.readings.insert(i, reading)
+            self.mins.clear()
+            self.maxes.clear()
+            for r in self.readings:
+                self._push(r)
+        self._expire(self.lastTimestamp - self.window)
+
+    def _push(self, reading):
+        while self.mins and self.mins[-1][1] > reading[1]:
+            self.mins.pop()
+        self.mins.append(reading)
+        while self.maxes and self.maxes[-1][1] < reading[1]:
+            self.maxes.pop()
+        self.maxes.append(reading)
+
+    def _expire(self, cutoff):
+        while self.readings and self.readings[0][0] < cutoff:
+            timestamp, value = self.readings.popleft()
+            self.count -= 1
+            self.sum -= value
+        while self.mins and self.mins[0][0] < cutoff:
+            self.mins.popleft()
+        while self.maxes and self.maxes[0][0] < cutoff:
+            self.maxes.popleft()
+
+    def snapshot(self, sensor):
+        if self.window != None:
+            lo = self.mins[0][1] if self.mins else None
+            hi = self.maxes[0][1] if self.maxes else None
+        else:
+            lo, hi = self.min, self.max
+        mean = self.sum / self.count if self.count else None
+        return SensorAggregate(sensor, self.count, lo, hi, mean, self.last, self.lastTimestamp)
+
+
+class RollingAggregates:
+    """
+    Per-sensor min/max/mean/last of a collection's readings, kept up to date from the collection's
+    change notifications: each new reading is read once, by ID, and folded into its sensor's
+    aggregates. Reading the aggregates is a dict lookup.
+
+        temps = RollingAggregates(coll, valueField="temperature", window=3600)
+        temps.start()
+        print(temps.get(sensor_id).mean)
+
+    The collection is treated as append-only: a changed reading is counted again, and deleted
+    readings are not subtracted.
+    """
+    def __init__(self, collection, *, valueField ="value", timestampField ="timestamp", sensorField ="sensor",
+                 window =None):
+        """
+        :param collection: A CBLCollection, as returned by Collection.get_collection.
+        :param window: If not None, only readings within this many timestamp units of each sensor's latest reading are aggregated. Otherwise all readings since `start` are.
+        """
+        self.collection = collection
+        self.valueField = valueField
+        self.timestampField = timestampField
+        self.sensorField = sensorField
+        self.window = window
+        self._projection = [sensorField, timestampField, valueField]
+        self._sensors = {}
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __repr__(self):
+        return "RollingAggregates[" + Collection.get_full_name(self.collection) + "." + self.valueField + "]"
+
+    def start(self, seed =True):
+        """
+        Starts listening for changes. If 'seed' is true, the aggregates are first initialized with
+        one query over the existing readings (just those inside the window, if there is one.)
+        The listener is registered after the query, so that no reading is counted twice; a
+        reading saved while the query runs may be missed.
+        """
+        if self._token != None:
+            return
+        if seed:
+            series = TimeSeries(self.collection, valueField=self.valueField,
+                                timestampField=self.timestampField, sensorField=self.sensorField)
+            start = None
+            if self.window != None:
+                latest = N1QLQuery(lib.CBLCollection_Database(self.collection),
+                                   "SELECT MAX({}) FROM {}".format(_field(self.timestampField),
+                                                                   Collection.get_full_name(self.collection)))
+                newest = [row[0] for row in latest.stream(asArray=True)]
+                if newest and newest[0] != None:
+                    start = newest[0] - self.window
+            readings = series.window(start)
+            with self._lock:
+                for row in readings:
+                    self._add(row["sensor"], row["timestamp"], row["value"])
+        self._token = Collection.add_change_listener(self.collection, self._changed)
+
+    def stop(self):
+        if self._token != None:
+            self._token.remove()
+            self._token = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get(self, sensor):
+        """Returns the SensorAggregate of one sensor, or None if it has no readings."""
+        with self._lock:
+            state = self._sensors.get(sensor)
+            return state.snapshot(sensor) if state != None else None
+
+    def snapshot(self):
+        """Returns a dict mapping every sensor to its SensorAggregate."""
+        with self._lock:
+            return {sensor: state.snapshot(sensor) for sensor, state in self._sensors.items()}
+
+    def _changed(self, docIDs):
+        docs = Collection.get_documents(self.collection, docIDs, self._projection)
+        with self._lock:
+            for props in docs.values():
+                if props != None:
+                    self._add(props[self.sensorField], props[self.timestampField], props[self.valueField])
+
+    def _add(self, sensor, timestamp, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+            return
+        state = self._sensors.get(sensor)
+        if state == None:
+            state = _Rolling(self.window)
+            self._sensors[sensor] = state
+        state.add(timestamp, value)
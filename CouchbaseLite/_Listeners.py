@@ -0,0 +1,59 @@
+# _Listeners.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# The `extern "Python"` callbacks that C listeners and handlers call back into. This module is
+# imported the first time a listener or handler is registered, not at package import.
+
+from ._PyCBL import ffi, lib
+from .common import *
+
+
+@ffi.def_extern()
+def databaseListenerCallback(context, db, numDocs, c_docIDs):
+    docIDs = []
+    for i in range(numDocs):
+        docIDs.append(sliceToString(c_docIDs[i]))
+    listener = ffi.from_handle(context)
+    listener(docIDs)
+
+@ffi.def_extern()
+def documentListenerCallback(context, db, docID):
+    listener = ffi.from_handle(context)
+    listener(sliceToString(docID))
+
+@ffi.def_extern()
+def queryListenerCallback(context, query, token):
+    listener = ffi.from_handle(context)
+    listener()
+
+@ffi.def_extern()
+def collectionListenerCallback(context, change):
+    docIDs = []
+    for i in range(change.numDocs):
+        docIDs.append(sliceToString(change.docIDs[i]))
+    listener = ffi.from_handle(context)
+    listener(docIDs)
+
+@ffi.def_extern()
+def collectionDocumentListenerCallback(context, change):
+    listener = ffi.from_handle(context)
+    listener(sliceToString(change.docID))
+
+@ffi.def_extern()
+def conflictHandlerCallback(context, documentBeingSaved, conflictingDocument):
+    handler = ffi.from_handle(context)
+    return bool(handler(documentBeingSaved, conflictingDocument))
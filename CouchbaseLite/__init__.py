@@ -1 +1,120 @@
-# placeholder file, to mark this directory as a Python package
+# __init__.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Python bindings for Couchbase Lite.
+
+The public classes can be used straight from the package, e.g. `CouchbaseLite.Database` or
+`CouchbaseLite.N1QLQuery`. Importing the package itself is nearly free: each submodule (and
+the native `_PyCBL` extension behind it) is only imported the first time one of its names is
+looked up.
+"""
+
+import importlib
+import sys
+import types
+
+# Public name -> submodule that defines it.
+_LAZY_NAMES = {
+    "CBLException":                 "common",
+    "Database":                     "Database",
+    "DatabaseConfiguration":        "Database",
+    "IndexConfiguration":           "Database",
+    "FullTextIndexConfiguration":   "Database",
+    "MaintenanceType":              "Database",
+    "Transaction":                  "Database",
+    "TransactionWarning":           "Database",
+    "DatabasePool":                 "DatabasePool",
+    "MaintenanceScheduler":         "Maintenance",
+    "MaintenancePolicy":            "Maintenance",
+    "Document":                     "Document",
+    "MutableDocument":              "Document",
+    "LastWriteWins":                "Document",
+    "FailOnConflict":               "Document",
+    "Array":                        "Collections",
+    "MutableArray":                 "Collections",
+    "Dictionary":                   "Collections",
+    "MutableDictionary":            "Collections",
+    "Blob":                         "Blob",
+    "Collection":                   "Collection",
+    "CollectionStats":              "Stats",
+    "DocumentCache":                "DocumentCache",
+    "RetentionPolicy":              "Retention",
+    "RetentionSweeper":             "Retention",
+    "FullTextSearch":               "Search",
+    "SearchHit":                    "Search",
+    "SearchPage":                   "Search",
+    "Schema":                       "Schema",
+    "registerSchema":               "Schema",
+    "schemaFor":                    "Schema",
+    "IngestBuffer":                 "Ingest",
+    "import_ndjson":                "NDJSON",
+    "export_ndjson":                "NDJSON",
+    "KeyPath":                      "KeyPath",
+    "LiveQuery":                    "LiveQuery",
+    "RowDiff":                      "LiveQuery",
+    "KeysetPager":                  "Pagination",
+    "QueryProfiler":                "Profiler",
+    "QueryPlan":                    "Profiler",
+    "Patch":                        "Patch",
+    "QueryCache":                   "QueryCache",
+    "Query":                        "Query",
+    "N1QLQuery":                    "Query",
+    "JSONQuery":                    "Query",
+    "QueryResult":                  "Query",
+    "N1QLLanguage":                 "Query",
+    "JSONLanguage":                 "Query",
+    "ExternalSorter":               "Streaming",
+    "SpillStats":                   "Streaming",
+    "sortedRows":                   "Streaming",
+    "groupedRows":                  "Streaming",
+    "TimeSeries":                   "TimeSeries",
+    "RollingAggregates":            "TimeSeries",
+    "SensorAggregate":              "TimeSeries",
+    "Replicator":                   "Replicator",
+    "ReplicatorConfiguration":      "Replicator",
+    "ReplicatorType":               "Replicator",
+    "ReplicationCollection":        "Replicator",
+}
+
+__all__ = list(_LAZY_NAMES)
+
+
+def __getattr__(name):
+    moduleName = _LAZY_NAMES.get(name)
+    if moduleName == None:
+        raise AttributeError("module " + __name__ + " has no attribute " + name)
+    value = getattr(importlib.import_module("." + moduleName, __name__), name)
+    globals()[name] = value     # later lookups don't come through here
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
+
+
+class _LazyPackage (types.ModuleType):
+    # Loading a submodule binds it as an attribute of this package, which would shadow the
+    # class of the same name (`CouchbaseLite.Database` would become the module). Skip those
+    # bindings; the submodules are still reachable through `sys.modules` and `from ... import`.
+    def __setattr__(self, name, value):
+        if name in _LAZY_NAMES and isinstance(value, types.ModuleType):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+
+sys.modules[__name__].__class__ = _LazyPackage
@@ -15,6 +15,9 @@
 # limitations under the License.
 #
 
+import math
+import threading
+
 from ._PyCBL import ffi, lib
 
 def cstr(str):
@@ -36,11 +39,11 @@ def sliceResultToString(sr):
     return str
 
 def sliceResultToBytes(sr):
-    """Copies a FLSliceResult to a Python bytes object. Does not free the FLSliceResult."""
-    if sr.buf == None:
+    """Copies a FLSliceResult to a Python bytes object and frees it."""
+    if sr.buf == ffi.NULL:
         return None
+    b = ffi.buffer(sr.buf, sr.size)[:]
     lib.FLSliceResult_Release(sr)
-    b = bytes( ffi.buffer(sr.buf, sr.size) )
     return b
 
 def asSlice(data):
@@ -57,6 +60,78 @@ def stringParam(str):
     buffer = ffi.from_buffer(utf8)
     return [buffer, len(buffer)]
 
+class SliceBuffer (object):
+    """A reusable FLSlice, for passing many strings to C functions without allocating a buffer
+       for each one. The slice returned by `set` is only valid until the next call."""
+    def __init__(self, capacity =256):
+        self._buffer = ffi.new("char[]", capacity)
+        self._slice = ffi.new("FLSlice*")
+        self._slice.buf = self._buffer
+
+    def set(self, str):
+        utf8 = str.encode()
+        if len(utf8) > len(self._buffer):
+            self._buffer = ffi.new("char[]", 2 * len(utf8))
+            self._slice.buf = self._buffer
+        ffi.memmove(self._buffer, utf8, len(utf8))
+        self._slice.size = len(utf8)
+        return self._slice[0]
+
+def cblTimestamp(when):
+    """Converts an expiration time to a CBLTimestamp, i.e. milliseconds since the Unix epoch.
+       Accepts None (meaning no expiration, 0), a datetime, a timedelta (relative to now),
+       or a number that is already a CBLTimestamp."""
+    if when == None:
+        return 0
+    elif hasattr(when, "total_seconds"):        # timedelta
+        return lib.CBL_Now() + math.ceil(when.total_seconds() * 1000)
+    elif hasattr(when, "timestamp"):            # datetime
+        return math.ceil(when.timestamp() * 1000)
+    else:
+        return int(when)
+
+_transactionLocks = {}
+_transactionLocksLock = threading.Lock()
+
+def transactionLock(db):
+    """Returns the reentrant lock that serializes transactions on a CBLDatabase handle. Couchbase
+       Lite transactions belong to the handle, not to a thread: a thread beginning a transaction
+       while another thread has one open on the same handle would join it. So every transaction
+       holds this lock from its outermost begin to its end."""
+    key = int(ffi.cast("uintptr_t", db))
+    with _transactionLocksLock:
+        lock = _transactionLocks.get(key)
+        if lock == None:
+            lock = _transactionLocks[key] = threading.RLock()
+        return lock
+
+def encodeCursor(kind, state):
+    """Encodes a pagination position, a JSON-compatible dict, as an opaque URL-safe string."""
+    import base64, json
+    text = json.dumps({"kind": kind, "state": state}, separators=(",", ":"), allow_nan=False)
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodeCursor(kind, token):
+    """Decodes a string made by encodeCursor, returning its state; raises ValueError if it's not a
+       valid cursor of the given kind."""
+    import base64, binascii, json
+    try:
+        text = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        cursor = json.loads(text)
+    except (TypeError, binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(cursor, dict) or cursor.get("kind") != kind or not isinstance(cursor.get("state"), dict):
+        raise ValueError("Invalid cursor")
+    return cursor["state"]
+
+class _Unset (object):
+    __slots__ = ()
+    def __repr__(self):
+        return "UNSET"
+
+# Marks a lazily computed `__slots__` field that hasn't been computed yet (None is a valid value.)
+UNSET = _Unset()
+
 # A global CBLError object to use in API calls, so each call doesn't have to
 # allocate a new one. (This is fine as long as we're single-threaded.)
 gError = ffi.new("CBLError*")
@@ -74,17 +149,22 @@ class CBLException (EnvironmentError):
 
 
 class CBLObject (object):
+    __slots__ = ("_ref", "__weakref__")
+
     def __init__(self, ref, message =None, error =None):
         self._ref = ref
         if not ref and message:
             raise CBLException(message, error)
 
     def __del__(self):
-        if lib != None and "_ref" in self.__dict__ and self._ref != None:
-            lib.CBL_Release(self._ref)
+        ref = getattr(self, "_ref", None)     # unset if __init__ failed early
+        if lib != None and ref != None and ref != ffi.NULL:
+            lib.CBL_Release(ref)
 
 
 class ListenerToken (object):
+    __slots__ = ("owner", "handle", "c_token")
+
     def __init__(self, owner, handle, c_token):
         self.owner = owner
         self.handle = handle
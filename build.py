@@ -41,7 +41,26 @@ else:
     DEFAULT_LIBRARY_PATH += ".so"
 
 
-def BuildLibrary(includeDir, python_includedir, lib_path, libraries, extra_link_args, buildEE, verbose):
+def CompileArgs(optimize, lto, profile):
+    """Returns the extra compiler and linker flags for the build options."""
+    compile_args = []
+    link_args = []
+    if optimize:
+        compile_args.append("-O3")
+    if lto:
+        # Lets the compiler inline our C helpers into the CFFI wrappers that call them.
+        # (libcblite itself is a shared library, so calls into it aren't affected.)
+        compile_args.append("-flto")
+        link_args.append("-flto")
+    if profile:
+        # Symbols and frame pointers, so profilers like `perf` can attribute time to functions.
+        compile_args += ["-g", "-fno-omit-frame-pointer"]
+        link_args.append("-g")
+    return compile_args, link_args
+
+
+def BuildLibrary(includeDir, python_includedir, lib_path, libraries, extra_link_args, buildEE, extras, verbose,
+                 extra_compile_args =None):
     include_dirs = [includeDir]
     if python_includedir:
         # when cross-compiling, use python headers for target rather than build system
@@ -59,15 +78,19 @@ def BuildLibrary(includeDir, python_includedir, lib_path, libraries, extra_link_
     # This is passed to the real C compiler and should include the declarations of
     # the symbols declared in cdef()
     cHeaderSource = r"""#include <cbl/CouchbaseLite.h>"""
+    if extras:
+        # Our own C helpers (see CBLForPython_Extras.c) are compiled into the same extension.
+        cHeaderSource += "\n" + ReadFile("../CBLForPython_Extras.c")
 
     ffibuilder = FFI()
-    ffibuilder.cdef(CDeclarations(buildEE))
+    ffibuilder.cdef(CDeclarations(buildEE, extras))
     ffibuilder.set_source(
         "_PyCBL",       # Module name
         cHeaderSource,
         libraries=libraries,
         include_dirs=include_dirs,
         library_dirs=["."],
+        extra_compile_args=extra_compile_args or [],
         extra_link_args=extra_link_args)
     ffibuilder.compile(verbose=verbose)
 
@@ -75,16 +98,21 @@ def BuildLibrary(includeDir, python_includedir, lib_path, libraries, extra_link_
     os.remove("_PyCBL.o")
 
 
-def CDeclarations(buildEE):
+def CDeclarations(buildEE, extras):
     if buildEE:
-        f = open("../CBLForPython_EE.h", "rb", buffering=0)
-        result = str(f.readall(), encoding="utf-8")
+        result = ReadFile("../CBLForPython_EE.h")
     else:
-        f = open("../CBLForPython.h", "rb", buffering=0)
-        result = str(f.readall(), encoding="utf-8")
+        result = ReadFile("../CBLForPython.h")
+    if extras:
+        result += "\n" + ReadFile("../CBLForPython_Extras.h")
     return result
 
 
+def ReadFile(path):
+    with open(path, "rb", buffering=0) as f:
+        return str(f.readall(), encoding="utf-8")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="build Couchbase Lite Python bindings")
     parser.add_argument('--edition', 
@@ -111,17 +139,32 @@ if __name__ == "__main__":
                         default='', 
                         metavar="PATH",
                         help="Directory containing python headers (specify for cross-compiling)")
+    parser.add_argument('--without_extras',
+                        action='store_true',
+                        help="Don't compile the C helpers in CBLForPython_Extras.c into the bindings")
+    parser.add_argument('--optimize',
+                        action='store_true',
+                        help="Compile the bindings with -O3")
+    parser.add_argument('--lto',
+                        action='store_true',
+                        help="Compile and link the bindings with link-time optimization")
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="Keep symbols and frame pointers, for profiling")
     parser.add_argument('--verbose', 
                         action='store_true',
                         help="Show verbose output from CFFI")
     args = parser.parse_args()
 
-    linkFlags = None
+    linkFlags = []
     if args.link_flags != None:
         linkFlags = args.link_flags.split()
+    compileFlags, extraLinkFlags = CompileArgs(args.optimize, args.lto, args.profile)
+    linkFlags += extraLinkFlags
 
     buildEE = (args.edition == 'EE')
 
     print("Building Python bindings with headers from ", args.include, "/cbl  and library ", args.library)
 
-    BuildLibrary(args.include, args.python_includedir, args.library, args.link.split(), linkFlags, buildEE, args.verbose)
+    BuildLibrary(args.include, args.python_includedir, args.library, args.link.split(), linkFlags, buildEE,
+                 not args.without_extras, args.verbose, compileFlags)
@@ -19,15 +19,21 @@
 
 from CouchbaseLite.Database import Database, DatabaseConfiguration, IndexConfiguration, FullTextIndexConfiguration
 from CouchbaseLite.Document import Document, MutableDocument
-from CouchbaseLite.Query import N1QLQuery, QueryResult, JSONLanguage
+from CouchbaseLite.Query import QueryResult, JSONLanguage
 #from CouchbaseLite.Replicator import ReplicatorConfiguration, ReplicatorType, Replicator
 from CouchbaseLite.Replicator import ReplicatorConfiguration, Replicator, ReplicatorType, ReplicationCollection
 from CouchbaseLite.Collection import Collection
+from CouchbaseLite.Patch import Patch
+from CouchbaseLite.Retention import RetentionPolicy, RetentionSweeper
+from CouchbaseLite.TimeSeries import TimeSeries, RollingAggregates
+from CouchbaseLite.Stats import CollectionStats
 
-import json, time, uuid, sys
+import datetime, json, time, uuid, sys
 import SensorSimulator
 
 NUM_PROBES = 4
+RETENTION = datetime.timedelta(days=7)   # measures older than this are purged locally
+ROLLING_WINDOW = 3600                    # seconds of readings in the live per-sensor aggregates
 
 
 def create_new_database(db_name = 'my-database-made-using-python-wrapper'):
@@ -71,12 +77,7 @@ def save_doc_inside_collection(db, sensor_id, collection, json_doc):
     return doc_id
 
 def modify_existing_doc(collection, doc_id):
-    my_existing_doc = Collection.get_mutable_document(collection, doc_id)
-
-    prob_properties= {'foo': 'bar'}
-    Document.setJSON(my_existing_doc, prob_properties)
-
-    Collection.save_document(collection, my_existing_doc)
+    Collection.update_document(collection, doc_id, Patch().set('foo', 'bar').increment('revisions'))
 
 
 def add_new_json_sample(db, sensor_id, last_value):
@@ -90,14 +91,8 @@ def add_new_json_sample(db, sensor_id, last_value):
     save_doc_inside_collection(db, sensor_id, coll_press, prob_properties)
 
 
-def select_count(db, scope_and_collection):
-    q = N1QLQuery(db, 'SELECT count(*) AS count FROM {}'.format(scope_and_collection))
-
-    count_result = None
-
-    for row in q.execute():
-        count_result = row.asDictionary()
-        print('-> {}: {}'.format(scope_and_collection, count_result))
+def select_count(stats):
+    print('-> {}: count {}, {:.2f} changes/s'.format(stats.name, stats.count, stats.changesPerSecond))
 
 
 def start_replication(db: Database, endpoint_url, username, password):
@@ -177,6 +172,17 @@ def main():
 
     replicator = start_replication(db, endpoint_url, username, password)
 
+    sweeper = RetentionSweeper([RetentionPolicy(Collection.get_collection(db, name, "measures"), RETENTION)
+                                for name in ("temperatures", "pressures")])
+    sweeper.start()
+
+    coll_temp = Collection.get_collection(db, "temperatures", "measures")
+    rolling_temps = RollingAggregates(coll_temp, valueField='temperature', window=ROLLING_WINDOW)
+    rolling_temps.start()
+    temp_series = TimeSeries(coll_temp, valueField='temperature')
+    temp_stats = CollectionStats(coll_temp)
+    press_stats = CollectionStats(Collection.get_collection(db, "pressures", "measures"))
+
     last_values = []
     for x in range(NUM_PROBES):
         last_values.append(- sys.float_info.max)
@@ -187,8 +193,12 @@ def main():
             add_new_json_sample(db, sensor_id, last_values[x])
 
             time.sleep(2)
-            select_count(db, 'measures.temperatures') # list n temperatures documents inside local CBlite DB
-            select_count(db, 'measures.pressures') # list n pressures documents inside local CBlite DB
+            select_count(temp_stats) # list n temperatures documents inside local CBlite DB
+            select_count(press_stats) # list n pressures documents inside local CBlite DB
+            print('-> {}'.format(rolling_temps.get(sensor_id)))
+
+        for row in temp_series.downsample(60, start=time.time() - ROLLING_WINDOW):
+            print('-> minute {bucket:.0f} sensor {sensor}: avg {avg:.2f} over {count} readings'.format(**row))
         #Replic
 
     close_database(db)
@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+#
+#  bench_ffi.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Times common patterns of calls through the CFFI bindings, to show the per-call overhead of the
+# build at hand. Compare builds made with and without `build.py --without_extras`, `--optimize`
+# and `--lto`. Run it like test.sh does:
+#
+#     cd test && PYTHONPATH=.. python3 bench_ffi.py [--count N]
+
+import argparse
+import shutil
+import tempfile
+import timeit
+
+from CouchbaseLite._PyCBL import ffi, lib
+from CouchbaseLite.common import SliceBuffer, stringParam
+from CouchbaseLite.Collection import Collection
+from CouchbaseLite.Collections import decodeFleeceDict, decodeFleeceValue
+from CouchbaseLite.Database import Database, DatabaseConfiguration
+from CouchbaseLite.Schema import Schema
+
+DOCS = 1000
+
+
+def report(label, count, function, perCall =1):
+    seconds = min(timeit.repeat(function, number=count, repeat=5))
+    print ("%-36s %10.1f" % (label, seconds * 1e9 / (count * perCall)))
+
+
+def getDocument(collection, idParam):
+    doc = lib.CBLCollection_GetDocument(collection, idParam, ffi.NULL)
+    lib.CBL_Release(doc)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure the overhead of calls through the bindings")
+    parser.add_argument('--count', type=int, default=100000, help="calls per measurement")
+    args = parser.parse_args()
+    count = args.count
+
+    helpers = [name for name in ("CBLPy_PickleFleece", "CBLPy_ValueType", "CBLPy_DictGetMany", "CBLPy_GetDocuments")
+               if hasattr(lib, name)]
+    print ("C helpers: ", ", ".join(helpers) if helpers else "none (built --without_extras)")
+
+    directory = tempfile.mkdtemp(prefix="bench_ffi")
+    db = Database("bench", DatabaseConfiguration(directory))
+    try:
+        collection = Collection.get_default_collection(db)
+        with db:
+            for i in range(DOCS):
+                doc = lib.CBLDocument_CreateWithID(stringParam("doc-%04d" % i))
+                json = ('{"type": "reading", "sensor": %d, "timestamp": %d, "temperature": %.2f, '
+                        '"tags": ["a", "b"], "location": {"room": "lab", "floor": 2}}' % (i % 16, 1700000000 + i, 20.5))
+                lib.CBLDocument_SetJSON(doc, stringParam(json), ffi.NULL)
+                lib.CBLCollection_SaveDocument(collection, doc, ffi.NULL)
+                lib.CBL_Release(doc)
+        ids = ["doc-%04d" % i for i in range(DOCS)]
+
+        doc = lib.CBLCollection_GetDocument(collection, stringParam(ids[0]), ffi.NULL)
+        props = lib.CBLDocument_Properties(doc)
+        number = lib.FLDict_Get(props, stringParam("temperature"))
+
+        print ("%-36s %10s" % ("pattern", "ns/call"))
+        report("FLValue_GetType", count, lambda: lib.FLValue_GetType(number))
+        report("FLValue_GetType + IsInteger", count,
+               lambda: lib.FLValue_GetType(number) == lib.kFLNumber and lib.FLValue_IsInteger(number))
+        report("FLDict_Get with stringParam", count, lambda: lib.FLDict_Get(props, stringParam("temperature")))
+        key = SliceBuffer()
+        report("FLDict_Get with SliceBuffer", count, lambda: lib.FLDict_Get(props, key.set("temperature")))
+        report("decodeFleeceValue (number)", count, lambda: decodeFleeceValue(number))
+        report("decodeFleeceDict (document)", count // 10, lambda: decodeFleeceDict(props))
+        report("decodeFleeceDict, Python decoder", count // 10, lambda: decodeFleeceDict(props, native=False))
+        readings = Schema(["sensor", "timestamp", "temperature"])
+        report("Schema.decode (3 fields)", count // 10, lambda: readings.decode(props))
+        report("CBLCollection_GetDocument", count // 10, lambda: getDocument(collection, key.set(ids[0])))
+        report("Collection.get_documents, per doc", 10, lambda: Collection.get_documents(collection, ids), DOCS)
+        lib.CBL_Release(doc)
+    finally:
+        db.close()
+        shutil.rmtree(directory, ignore_errors=True)
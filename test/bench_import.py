@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+#
+#  bench_import.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Measures cold-start import time of the CouchbaseLite package. Each sample runs in a fresh
+# interpreter, so nothing is cached in `sys.modules`. Run it like test.sh does:
+#
+#     cd test && PYTHONPATH=.. python3 bench_import.py [--runs N]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+CASES = [
+    ("interpreter only",            "pass"),
+    ("import CouchbaseLite",        "import CouchbaseLite"),
+    ("CouchbaseLite.Database",      "import CouchbaseLite; CouchbaseLite.Database"),
+    ("from .Database import",       "from CouchbaseLite.Database import Database"),
+    ("Database + N1QLQuery",        "import CouchbaseLite; CouchbaseLite.Database; CouchbaseLite.N1QLQuery"),
+    ("every public name",           "import CouchbaseLite; [getattr(CouchbaseLite, n) for n in CouchbaseLite.__all__]"),
+]
+
+TIMER = "import time; _t = time.perf_counter(); {code}; print(time.perf_counter() - _t)"
+
+
+def sample(code):
+    out = subprocess.run([sys.executable, "-c", TIMER.format(code=code)],
+                         check=True, capture_output=True, text=True, env=os.environ)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure CouchbaseLite import time")
+    parser.add_argument('--runs', type=int, default=20, help="fresh interpreters per case")
+    args = parser.parse_args()
+
+    print ("%-28s %10s %10s" % ("case", "median ms", "min ms"))
+    for label, code in CASES:
+        times = [sample(code) for _ in range(args.runs)]
+        print ("%-28s %10.2f %10.2f" % (label, statistics.median(times) * 1000, min(times) * 1000))
@@ -0,0 +1,68 @@
+#! /usr/bin/env python3
+#
+#  bench_memory.py
+#
+# Copyright (c) 2019-2024 Couchbase, Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Measures the memory held by many Document handles, compared with the same fields stored in a
+# per-instance __dict__ (the layout Document used before it had __slots__). Run it like test.sh does:
+#
+#     cd test && PYTHONPATH=.. python3 bench_memory.py [--count N]
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from CouchbaseLite.Document import Document, MutableDocument
+from CouchbaseLite.Query import QueryResult
+from CouchbaseLite.Streaming import peakRSS
+
+
+class DictDocument (object):
+    def __init__(self, id):
+        self.id = id
+        self.database = None
+        self._ref = None
+
+
+def measure(label, factory, count, ids):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    handles = [factory(docID) for docID in ids]
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print ("%-20s %10.1f %12.1f %10.0f" % (label, current / count, current / (1024 * 1024), elapsed * 1e9 / count))
+    del handles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure the memory used by Document handles")
+    parser.add_argument('--count', type=int, default=1000000, help="handles to create")
+    args = parser.parse_args()
+
+    # The IDs are created up front, so only the handles themselves are measured.
+    ids = ["sensor::%d" % i for i in range(args.count)]
+    print ("%-20s %10s %12s %10s" % ("handle", "bytes/obj", "total MB", "ns/obj"))
+    measure("dict-based", DictDocument, args.count, ids)
+    measure("Document", Document, args.count, ids)
+    measure("MutableDocument", MutableDocument, args.count, ids)
+    measure("QueryResult", lambda docID: QueryResult(None, None), args.count, ids)
+    rss = peakRSS()
+    if rss != None:
+        print ("peak RSS: %.1f MB" % (rss / (1024 * 1024)))
@@ -17,9 +17,34 @@
 # limitations under the License.
 #
 
-from CouchbaseLite.Database import Database, DatabaseConfiguration, IndexConfiguration, FullTextIndexConfiguration
+from CouchbaseLite.Database import Database, DatabaseConfiguration, IndexConfiguration, FullTextIndexConfiguration, MaintenanceType
 from CouchbaseLite.Document import Document, MutableDocument
-from CouchbaseLite.Query import JSONQuery, N1QLLanguage, JSONLanguage
+from CouchbaseLite.Query import JSONQuery, N1QLQuery, N1QLLanguage, JSONLanguage
+from CouchbaseLite.DatabasePool import DatabasePool
+from CouchbaseLite.Maintenance import MaintenanceScheduler, MaintenancePolicy
+from CouchbaseLite.Collection import Collection
+from CouchbaseLite.Collections import decodeFleeceDict, decodeFleeceBounded
+from CouchbaseLite.DocumentCache import DocumentCache
+from CouchbaseLite.NDJSON import import_ndjson, export_ndjson
+from CouchbaseLite.Patch import Patch
+from CouchbaseLite.KeyPath import KeyPath
+from CouchbaseLite.QueryCache import QueryCache
+from CouchbaseLite.LiveQuery import LiveQuery
+from CouchbaseLite.Streaming import sortedRows, SpillStats
+from CouchbaseLite.TimeSeries import TimeSeries, RollingAggregates
+from CouchbaseLite.Ingest import IngestBuffer
+from CouchbaseLite.Schema import Schema, registerSchema, schemaFor
+from CouchbaseLite.Pagination import KeysetPager
+from CouchbaseLite.Profiler import QueryProfiler
+from CouchbaseLite.Stats import CollectionStats
+from CouchbaseLite.Retention import RetentionPolicy, RetentionSweeper
+from CouchbaseLite.common import CBLException, cblTimestamp
+from CouchbaseLite._PyCBL import lib
+import datetime
+import io
+import queue
+import threading
+import time
 import json
 
 Database.deleteFile("db", "/tmp")
@@ -128,6 +153,7 @@ with db:
     read_doc = db.getMutableDocument('nested_doc')
     print("read_doc = ", canonicalJSON(read_doc.JSON))
     assert(canonicalJSON(read_doc.JSON) == """{"array": ["a"], "empty_array": [], "empty_obj": {}, "flat": "flat", "nested": {"nested": "nested"}}""")
+    assert(canonicalJSON(read_doc.json_bytes()) == canonicalJSON(read_doc.JSON))
     db.saveDocument(read_doc)
 
     update_doc = db.getMutableDocument('nested_doc')
@@ -137,6 +163,89 @@ with db:
     assert(canonicalJSON(update_doc.JSON) == """{"a": "b", "array": ["a"], "empty_array": [], "empty_obj": {}, "flat": "flat", "nested": {"foo": "bar", "nested": "nested"}}""")
     db.saveDocument(update_doc)
 
+with db.transaction() as tx:
+    with db.transaction() as inner:
+        assert(inner is tx and tx.depth == 2)
+        doc = MutableDocument("aborted")
+        db.saveDocument(doc)
+        tx.abort()
+    assert(db.inTransaction)
+assert(tx.aborted and not tx.committed and not db.inTransaction)
+assert([op[:2] for op in tx.operations] == [("save", "aborted")])
+assert(not db.getDocument("aborted"))
+
+# A transaction on another thread waits for this one, so its abort can't roll back this one's commit.
+txStarted = threading.Event()
+def abortingWriter():
+    txStarted.wait()
+    with db.transaction() as otherTx:
+        db.saveDocument(MutableDocument("txAborted"))
+        otherTx.abort()
+otherThread = threading.Thread(target=abortingWriter)
+otherThread.start()
+with db.transaction() as tx:
+    db.saveDocument(MutableDocument("txCommitted"))
+    txStarted.set()
+    time.sleep(0.1)
+otherThread.join()
+assert(tx.committed and db.getDocument("txCommitted") and not db.getDocument("txAborted"))
+db.purgeDocument("txCommitted")
+print ("transactions: ", db.transactionStats)
+
+with DocumentCache(Collection.get_default_collection(db), maxEntries = 2, validate = True) as docCache:
+    assert(docCache.get("foo") == db.getDocument("foo").properties)
+    assert(docCache.get("foo") is docCache.get("foo"))
+    assert(docCache.get("nosuchdoc", "missing") == "missing")
+    docCache.get("bar")
+    assert("foo" not in docCache and docCache.evictions == 1)
+    print ("document cache: ", docCache.stats)
+
+page = Collection.search(Collection.get_default_collection(db), "ExampleFullTextFlavorIndex", "spice OR cardamom",
+                         limit = 1, fields = ["flavor", "color"], snippets = ["flavor"])
+nextPage = Collection.search(Collection.get_default_collection(db), "ExampleFullTextFlavorIndex", "spice OR cardamom",
+                             limit = 1, fields = ["flavor", "color"], cursor = page.cursor)
+print ("search: ", page.hits, page[0].snippets, nextPage.hits)
+assert(len(page) == 1 and page.cursor and len(nextPage) == 1 and not nextPage.cursor)
+assert({page[0].id, nextPage[0].id} == {"foo", "bar"} and page[0]["color"] == "green")
+assert(page[0].snippets["flavor"] in ("pumpkin [spice]", "[cardamom]"))
+
+try:
+    KeysetPager(Collection.get_default_collection(db), "flavor")
+    assert(False)   # there's no index on flavor
+except CBLException:
+    pass
+db.createIndex("PagerColorIndex", IndexConfiguration(N1QLLanguage, "color"))
+pager = KeysetPager(Collection.get_default_collection(db), "color", pageSize = 1)
+pagerPages = list(pager.iterPages())
+print ("pager: ", pagerPages)
+assert([[row["_id"] for row in page] for page in pagerPages] == [["bar"], ["foo"]])
+assert(pagerPages[1][0]["flavor"] == "cardamom")
+resumed = KeysetPager(Collection.get_default_collection(db), "color", pageSize = 1).page(pagerPages[0].cursor)
+assert(resumed[0] == pagerPages[1][0] and not resumed.cursor)
+assert("PagerColorIndex" in pager.plan.indexes)
+
+profiler = QueryProfiler(db, slowThreshold = 0)
+colorQuery = "SELECT flavor FROM _default WHERE color = $color ORDER BY flavor"
+for _ in range(2):
+    assert(profiler.execute(colorQuery, {"color": "green"}) == [{"flavor": "cardamom"}, {"flavor": "pumpkin spice"}])
+colorStats = profiler.stats()[0]
+print ("profiler: ", colorStats, profiler.slowQueries[-1])
+assert(colorStats.count == 2 and colorStats.rows == 4 and colorStats.compileSeconds > 0)
+assert(profiler.slowQueries[-1].params == {"color": "green"} and profiler.slowQueries[-1].plan.indexes == ["PagerColorIndex"])
+
+stats = CollectionStats(Collection.get_default_collection(db), listen = False)
+print ("stats: ", stats.snapshot())
+assert(stats.count == Collection.count(Collection.get_default_collection(db)) == db.count)
+assert("PagerColorIndex" in stats.indexNames and "ExampleFullTextFlavorIndex" in stats.indexNames)
+assert(stats.lastSequence > 0 and 0 < stats.approximateBytes <= stats.databaseBytes)
+stats.close()
+
+# The native decoder, if _PyCBL was built with it, must agree with the Python one.
+fooDoc = db.getDocument("foo")
+fooFleece = lib.CBLDocument_Properties(fooDoc._ref)
+assert(decodeFleeceDict(fooFleece) == decodeFleeceDict(fooFleece, native = False))
+assert(decodeFleeceBounded(fooFleece, 1) == decodeFleeceBounded(fooFleece, 1, native = False))
+
 
 dbListenerToken.remove()
 
@@ -148,5 +257,192 @@ print ("Columns: ", q.columnNames)
 
 for row in q.execute():
     print ("row: ", row.asArray(), "  ...or...  ", row.asDictionary())
+    assert(json.loads(row.json_bytes()) == row.asDictionary())
+
+assert([json.loads(r) for r in q.execute_json(asArray = True)] == [r.asArray() for r in q.execute()])
+assert(list(q.stream()) == [r.asDictionary() for r in q.execute()])
+assert(list(q.stream([0], asArray = True)) == [r.asArray()[:1] for r in q.execute()])
+spillStats = SpillStats()
+assert(list(sortedRows(q.stream(), key = json.dumps, memoryLimit = 1, stats = spillStats))
+       == sorted((r.asDictionary() for r in q.execute()), key = json.dumps))
+print ("spill: ", spillStats)
+
+exported = io.StringIO()
+assert(export_ndjson(Collection.get_default_collection(db), exported) == 3)
+print ("ndjson: ", exported.getvalue())
+imported = Collection.create_collection(db, "imported", "test")
+assert(import_ndjson(imported, io.StringIO(exported.getvalue()), batch_size = 2) == 3)
+for line in exported.getvalue().splitlines():
+    exportedProps = json.loads(line)
+    docID = exportedProps.pop("_id")
+    assert(db.getDocument(docID).properties == exportedProps)
+    assert(Collection.get_document(imported, docID))    # raises if the import missed it
+
+before = db.getDocument(docID).properties
+Collection.update_document(Collection.get_default_collection(db), docID,
+                           Patch().set("patched.by", "test").increment("patched.count", 2).append("patched.log", 1))
+after = db.getDocument(docID).properties
+assert(after["patched"] == {"by": "test", "count": 2, "log": [1]})
+del after["patched"]
+assert(after == before)
+
+assert(KeyPath("patched.log[-1]") is KeyPath("patched.log[-1]"))
+assert(KeyPath("patched.log[-1]").components == ["patched", "log", -1])
+assert(KeyPath("patched.log[-1]")(db.getDocument(docID)) == 1)
+assert(KeyPath("patched.missing")(db.getDocument(docID), "dflt") == "dflt")
+assert(KeyPath.project(db.getDocument(docID), ["patched.by", "patched.count"]) == {"patched.by": "test", "patched.count": 2})
+
+fetched = db.getDocuments([docID, "nosuchdoc"])
+assert(fetched == {docID: db.getDocument(docID).properties, "nosuchdoc": None})
+assert(db.getDocuments([docID], projection = ["patched.count"]) == {docID: {"patched.count": 2}})
+
+with QueryCache(db, ttl = 60) as cache:
+    countQuery = "SELECT count(*) AS n FROM test.imported"
+    assert(cache.execute(countQuery) == [{"n": 3}])
+    assert(cache.execute(countQuery) is cache.execute(countQuery))
+    Collection.update_document(imported, "cachebuster", Patch().set("x", 1), create = True)
+    for _ in range(50):     # notifications may be delivered asynchronously
+        if cache.execute(countQuery) == [{"n": 4}]:
+            break
+        time.sleep(0.1)
+    assert(cache.execute(countQuery) == [{"n": 4}])
+    Collection.update_document(imported, "cachebuster2", Patch().set("x", 1), create = True)
+    cache.invalidate("test", "imported")
+    assert(cache.execute(countQuery) == [{"n": 5}])
+    print ("query cache: ", cache, cache.hits, "hits,", cache.misses, "misses")
+
+diffs = queue.Queue()
+with LiveQuery(N1QLQuery(db, "SELECT meta().id AS id, x FROM test.imported"), "id", diffs.put, debounce = 0.05):
+    initial = diffs.get(timeout = 5)
+    assert(len(initial.added) == 5 and not initial.removed and not initial.changed)
+    Collection.update_document(imported, "cachebuster", Patch().set("x", 2))
+    diff = diffs.get(timeout = 5)
+    print ("live query: ", diff)
+    assert(list(diff.changed) == ["cachebuster"] and diff.changed["cachebuster"][1]["x"] == 2)
+
+readings = Collection.create_collection(db, "readings", "test")
+rolling = RollingAggregates(readings, window = 10)
+rolling.start()
+for i, (sensor, t, v) in enumerate([(1, 0, 5.0), (1, 5, 7.0), (2, 6, 1.0), (1, 15, 3.0)]):
+    Collection.update_document(readings, "r" + str(i), Patch().set("sensor", sensor).set("timestamp", t).set("value", v),
+                               create = True)
+for _ in range(50):     # notifications may be delivered asynchronously
+    if rolling.get(1) and rolling.get(1).last == 3.0:
+        break
+    time.sleep(0.1)
+rolling.stop()
+assert(TimeSeries(readings).downsample(10, sensor = 1) ==
+       [{"sensor": 1, "bucket": 0, "min": 5.0, "max": 7.0, "avg": 6.0, "count": 2},
+        {"sensor": 1, "bucket": 10, "min": 3.0, "max": 3.0, "avg": 3.0, "count": 1}])
+latest = rolling.get(1)
+print ("rolling: ", latest)
+assert((latest.count, latest.min, latest.max, latest.last) == (2, 3.0, 7.0, 3.0))
+
+# Seeding reads the existing readings once each.
+with RollingAggregates(readings) as seeded:
+    assert((seeded.get(1).count, seeded.get(2).count) == (3, 1))
+
+# Readings may be delivered out of timestamp order.
+shuffled = RollingAggregates(readings, window = 10)
+for t, v in [(10, 5.0), (5, 1.0), (16, 9.0)]:
+    shuffled._add(1, t, v)
+shuffledLatest = shuffled.get(1)
+assert((shuffledLatest.count, shuffledLatest.min, shuffledLatest.max, shuffledLatest.mean) == (2, 5.0, 9.0, 7.0))
+
+readingSchema = registerSchema(readings, ["sensor", "timestamp", "value"])
+assert(schemaFor(readings) is readingSchema)
+assert(readingSchema.load(readings, "r1") == (1, 5, 7.0))
+readingSchema.save(readings, "r4", readingSchema.recordType(2, 20, 4.5))
+records = readingSchema.loadMany(readings, ["r3", "r4", "nosuchdoc"])
+assert(records == {"r3": (1, 15, 3.0), "r4": (2, 20, 4.5), "nosuchdoc": None})
+assert(Schema(["sensor", "unit"]).load(readings, "r4") == (2, None))
+
+# A database with different shared keys, so the same property names have other key numbers.
+Database.deleteFile("schemadb", "/tmp")
+schemaDB = Database("schemadb", DatabaseConfiguration("/tmp"))
+filler = MutableDocument("filler")
+filler["aaa"] = filler["abb"] = filler["acc"] = 0
+schemaDB.saveDocument(filler)
+otherReading = MutableDocument("s1")
+otherReading["sensor"], otherReading["timestamp"], otherReading["value"] = 5, 7, 9.5
+schemaDB.saveDocument(otherReading)
+assert(readingSchema.load(Collection.get_default_collection(schemaDB), "s1") == (5, 7, 9.5))
+assert(readingSchema.load(readings, "r1") == (1, 5, 7.0))
+schemaDB.close()
+Database.deleteFile("schemadb", "/tmp")
+
+with IngestBuffer(db, maxBatch = 8, maxDelay = 0.01) as ingest:
+    producers = [threading.Thread(target = lambda n: [ingest.submit(readings, {"sensor": n, "timestamp": 100 + i, "value": i})
+                                                      for i in range(20)], args = (10 + n,))
+                 for n in range(4)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    named = ingest.submit(readings, '{"sensor": 99}', "ingested")
+    ingest.flush()
+    assert(named.done() and named.result() == "ingested")
+    print ("ingest: ", ingest.documents, "docs in", ingest.batches, "batches")
+    assert(ingest.documents == 81 and ingest.batches >= 11)
+    try:
+        ingest.submit(readings, {"sensor": 98}, 123)
+        assert(False)   # docID must be a string
+    except TypeError:
+        pass
+    failed = ingest.submit("not a collection", {"sensor": 98})
+    survivor = ingest.submit(readings, {"sensor": 98}, "ingestedAfterError")
+    ingest.flush()
+    assert(isinstance(failed.exception(), TypeError) and survivor.result() == "ingestedAfterError")
+
+future = datetime.datetime(2100, 1, 1)
+futureMs = int(future.timestamp() * 1000)
+assert(cblTimestamp(None) == 0 and cblTimestamp(futureMs) == futureMs and cblTimestamp(future) == futureMs)
+assert(abs(cblTimestamp(datetime.timedelta(days = 1)) - (time.time() + 86400) * 1000) < 60000)
+
+db.setDocumentExpiration("foo", future)
+assert(db.getDocumentExpiration("foo") == future)
+db.setDocumentExpiration("foo", None)
+assert(db.getDocumentExpiration("foo") == None)
+
+expiring = Collection.create_collection(db, "expiring", "test")
+now = time.time()
+for i in range(3):
+    Collection.update_document(expiring, "x" + str(i), Patch().set("timestamp", now + i), create = True)
+Collection.set_document_expiration(expiring, "x0", future)
+assert(Collection.get_document_expiration(expiring, "x0") == futureMs)
+Collection.set_document_expiration(expiring, "x0", None)
+assert(Collection.get_document_expiration(expiring, "x0") == 0)
+assert(Collection.set_documents_expiration(expiring, ["x0", "x1"], futureMs, batch_size = 1) == 2)
+assert([Collection.get_document_expiration(expiring, "x" + str(i)) for i in range(3)] == [futureMs, futureMs, 0])
+assert(Collection.set_expiration_where(expiring, "timestamp >= $cutoff", None, {"cutoff": now + 1}) == 2)
+assert([Collection.get_document_expiration(expiring, "x" + str(i)) for i in range(3)] == [futureMs, 0, 0])
+
+# The sweeper gives the documents without an expiration one at their timestamp plus the window.
+sweeper = RetentionSweeper([RetentionPolicy(expiring, datetime.timedelta(days = 365))], batchSize = 1)
+assert(sweeper.sweep() == 2 and sweeper.sweep() == 0)
+expirations = [Collection.get_document_expiration(expiring, "x" + str(i)) for i in range(3)]
+print ("expirations: ", expirations)
+assert(expirations[0] == futureMs)
+assert(all(abs(expirations[i] - ((now + i) * 1000 + 365 * 86400000)) <= 1 for i in (1, 2)))
+
+scheduler = MaintenanceScheduler(db, [MaintenancePolicy(MaintenanceType.Optimize, writes = 1000)])
+report = scheduler.runNow(MaintenanceType.IntegrityCheck)
+print ("maintenance: ", report)
+assert(report.succeeded)
+assert(not scheduler.isRunning)
+failingScheduler = MaintenanceScheduler(db, [], onReport = lambda report: 1 / 0)
+assert(failingScheduler.runNow(MaintenanceType.Optimize).succeeded)
+assert(isinstance(failingScheduler.lastError, ZeroDivisionError))
 
 db.close()
+
+with DatabasePool(maxOpen = 1) as pool:
+    pooled = pool.acquire("db", DatabaseConfiguration("/tmp"))
+    assert(pool.acquire("db", DatabaseConfiguration("/tmp/")) is pooled)
+    assert(pooled.count == 3)
+    pool.release(pooled)
+    pool.release(pooled)
+    with pool.database("otherdb", DatabaseConfiguration("/tmp")) as other:   # evicts idle "db"
+        assert(pool.openCount == 1)
+        assert(other.count == 0)
+Database.deleteFile("otherdb", "/tmp")